@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of Create_OpenLink.py against a fake OMERO server.
+
+    $ python benchmarks/bench_create_openlink.py --images 1000 10000 100000
+
+For every number of images a synthetic OMERO world (see fakegateway) is
+generated in a temporary directory, then the script adds all Projects,
+Datasets, Images, Screens and Plates of the world to a new area each (in a
+temporary OPENLINK_DIR). Reported per object type are the wall time, the
+simulated round trips to the OMERO server and the created symlinks.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakegateway import OMERO_STUBS, FakeGateway, World  # noqa: E402
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "omero_openlink", "scripts", "omero", "util_scripts",
+    "Create_OpenLink.py")
+
+OBJECT_TYPES = ["Project", "Dataset", "Image", "Screen", "Plate"]
+
+
+def load_script(openlink_dir, managed_rep, original_rep):
+    """
+    Load a fresh module of Create_OpenLink.py (the script keeps the state
+    of a run in globals) configured for the given directories.
+    """
+    spec = importlib.util.spec_from_file_location("Create_OpenLink", SCRIPT)
+    script = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(script)
+    script.OPENLINK_DIR = openlink_dir
+    script.MANAGED_REP = managed_rep
+    script.ORIGINAL_REP = original_rep
+    return script
+
+
+def count_symlinks(path):
+    count = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in dirnames + filenames:
+            if os.path.islink(os.path.join(dirpath, name)):
+                count += 1
+    return count
+
+
+def run(script, world, obj_type, attachments=True, verbose=False):
+    """
+    Add all objects of obj_type of the world to a new area.
+    :return: dict with number of 'objects', 'seconds', 'round_trips' (with
+             'calls' and 'queries' by name) and 'symlinks'
+    """
+    conn = FakeGateway(script, world)
+    ids = world.ids(obj_type)
+    params = {
+        script.PARAM_DATATYPE: obj_type,
+        script.PARAM_ID: ids,
+        script.PARAM_SLOT_NAME: "bench_%s" % obj_type.lower(),
+        script.PARAM_ATTACH: attachments,
+    }
+    before = set(os.listdir(script.OPENLINK_DIR))
+    output = sys.stdout if verbose else io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        script.addObjToArea(conn, params)
+    seconds = time.perf_counter() - start
+    areas = set(os.listdir(script.OPENLINK_DIR)) - before
+    return {
+        'objects': len(ids),
+        'images': world.images_of(obj_type, ids),
+        'seconds': seconds,
+        'round_trips': conn.round_trips.total,
+        'calls': dict(conn.round_trips.calls),
+        'queries': dict(conn.round_trips.queries),
+        'symlinks': sum(count_symlinks(os.path.join(script.OPENLINK_DIR, a))
+                        for a in areas),
+    }
+
+
+def benchmark(images, types, directory=None, attachments=True, keep=False,
+              verbose=False):
+    """
+    Generate a world of <images> images and add each object type to an
+    area.
+    :return: list of (<object type>, result of run)
+    """
+    root = tempfile.mkdtemp(prefix="openlink_bench_", dir=directory)
+    try:
+        dirs = [os.path.join(root, d) for d in ("openlink", "managed",
+                                                "files")]
+        for d in dirs:
+            os.makedirs(d)
+        start = time.perf_counter()
+        world = World(dirs[1], dirs[2], images=images)
+        print("# %d images: world of %d files generated in %.1f s (%s)"
+              % (images, world.files, time.perf_counter() - start, root),
+              file=sys.stderr)
+        results = []
+        for obj_type in types:
+            script = load_script(dirs[0], dirs[1], dirs[2] + "/")
+            results.append((obj_type, run(script, world, obj_type,
+                                          attachments, verbose)))
+        return results
+    finally:
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def print_results(images, results, details=False):
+    print("%8s  %-8s %8s %8s %10s %12s %10s"
+          % ("images", "type", "objects", "seconds", "images/s",
+             "round trips", "symlinks"))
+    for obj_type, r in results:
+        print("%8d  %-8s %8d %8.2f %10.0f %12d %10d"
+              % (images, obj_type, r['objects'], r['seconds'],
+                 r['images'] / max(r['seconds'], 1e-9), r['round_trips'],
+                 r['symlinks']))
+        if details:
+            calls = dict(r['calls'])
+            calls.pop("projection", None)
+            print("%20s %s" % ("", ", ".join(
+                "%s: %d" % item
+                for item in sorted(r['queries'].items()) +
+                sorted(calls.items()))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark Create_OpenLink.py with a fake OMERO server")
+    parser.add_argument("--images", type=int, nargs="+",
+                        default=[1000, 10000, 100000],
+                        help="numbers of images (default: 1000 10000 100000)")
+    parser.add_argument("--types", nargs="+", choices=OBJECT_TYPES,
+                        default=OBJECT_TYPES,
+                        help="object types to add (default: all)")
+    parser.add_argument("--no-attachments", action="store_true",
+                        help="do not add file attachments")
+    parser.add_argument("--dir", default=None,
+                        help="directory for the temporary OMERO and "
+                             "OPENLINK_DIR directories")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the temporary directories")
+    parser.add_argument("--details", action="store_true",
+                        help="show round trips by query and call")
+    parser.add_argument("--verbose", action="store_true",
+                        help="show the output of the script")
+    args = parser.parse_args(argv)
+
+    if OMERO_STUBS:
+        print("# omero-py not available, using omero_stubs",
+              file=sys.stderr)
+    for images in args.images:
+        results = benchmark(images, args.types, args.dir,
+                            not args.no_attachments, args.keep, args.verbose)
+        print_results(images, results, args.details)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the views of the OpenLink tab over a synthetic OPENLINK_DIR.
+
+Run in the python environment of OMERO.web (OMERODIR set, the settings of
+OMERO.web are used if DJANGO_SETTINGS_MODULE is not set):
+
+    $ python benchmarks/bench_views.py --users 10 --areas 10 100 --files 50
+
+For every number of areas per user a synthetic OPENLINK_DIR is generated
+(see openlink_dir.py) and the views are called with a request of Django's
+RequestFactory and a stub of the OMERO connection (the undecorated view of
+login_required). Reported per view are the latency percentiles of the
+requests and the calls of the filesystem (os.stat, os.scandir, open, ...)
+per request. The first request of a user also creates the area registry,
+it is reported separately as "cold".
+"""
+
+import argparse
+import builtins
+import collections
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import types
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCHMARKS_DIR, os.path.dirname(BENCHMARKS_DIR)]
+
+import django  # noqa: E402
+
+if not os.environ.get("DJANGO_SETTINGS_MODULE"):
+    os.environ["DJANGO_SETTINGS_MODULE"] = "omeroweb.settings"
+django.setup()
+
+from django.test import RequestFactory  # noqa: E402
+from django.urls import NoReverseMatch, include, re_path, reverse, \
+    set_urlconf  # noqa: E402
+
+from omero_openlink import views  # noqa: E402
+from openlink_dir import generate  # noqa: E402
+
+PERCENTILES = (50, 90, 99)
+
+# functions of the filesystem that are counted, by module
+COUNTED = {
+    os: ("stat", "lstat", "scandir", "listdir", "readlink", "rename",
+         "replace", "remove", "unlink", "rmdir", "mkdir"),
+    builtins: ("open",),
+    sqlite3: ("connect",),
+}
+# calls of DirEntry objects that may need a system call
+ENTRY_CALLS = ("stat", "is_dir", "is_file", "is_symlink")
+
+
+class CountedEntry:
+    """DirEntry of a counted os.scandir"""
+
+    def __init__(self, entry, counter):
+        self._entry = entry
+        self._counter = counter
+
+    def __getattr__(self, name):
+        value = getattr(self._entry, name)
+        if name not in ENTRY_CALLS:
+            return value
+
+        def call(*args, **kwargs):
+            self._counter.add("DirEntry." + name)
+            return value(*args, **kwargs)
+        return call
+
+    def __fspath__(self):
+        return self._entry.path
+
+
+class CountedScandir:
+    """Iterator of a counted os.scandir"""
+
+    def __init__(self, iterator, counter):
+        self._iterator = iterator
+        self._counter = counter
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return CountedEntry(next(self._iterator), self._counter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._iterator.close()
+
+
+class FsCounter:
+    """
+    Count the calls of the functions of COUNTED while it is active. Only
+    calls of the thread that activated it are counted, not those of the
+    background reaper of deleted areas.
+    """
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.thread = None
+        self.originals = []
+
+    def add(self, name):
+        if threading.get_ident() == self.thread:
+            self.calls[name] += 1
+
+    def wrap(self, name, function):
+        counter = self
+
+        def wrapper(*args, **kwargs):
+            counter.add(name)
+            result = function(*args, **kwargs)
+            if name == "os.scandir":
+                return CountedScandir(result, counter)
+            return result
+        return wrapper
+
+    def __enter__(self):
+        self.calls.clear()
+        self.thread = threading.get_ident()
+        for module, names in COUNTED.items():
+            for name in names:
+                function = getattr(module, name)
+                self.originals.append((module, name, function))
+                setattr(module, name, self.wrap(
+                    "%s.%s" % (module.__name__, name), function))
+        return self
+
+    def __exit__(self, *args):
+        for module, name, function in reversed(self.originals):
+            setattr(module, name, function)
+        self.originals = []
+        self.thread = None
+
+
+class User:
+
+    def __init__(self, id):
+        self.id = id
+
+    def getId(self):
+        return self.id
+
+    def getName(self):
+        return "user_%d" % self.id
+
+
+class Conn:
+    """Stub of the OMERO connection of a user"""
+
+    def __init__(self, user_id):
+        self.user = User(user_id)
+
+    def getUser(self):
+        return self.user
+
+
+def use_urls():
+    """Use the URLs of the app if it is not configured in OMERO.web"""
+    try:
+        reverse("openlink-api-areas")
+    except NoReverseMatch:
+        urls = types.ModuleType("openlink_bench_urls")
+        urls.urlpatterns = [
+            re_path(r"^openlink/", include("omero_openlink.urls"))]
+        set_urlconf(urls)
+
+
+def call(view, request, conn, *args):
+    """Call the view without its login_required decorator"""
+    request.session = {}
+    return view.__wrapped__(request, *args, conn=conn)
+
+
+def get_scenarios(conn, hashnames):
+    """
+    :return: list of (<name>, <function(i)> that returns the response of
+             the i-th request)
+    """
+    factory = RequestFactory()
+    api_url = reverse("openlink-api-areas")
+
+    def listing(query):
+        def run(i):
+            return call(views.api_areas, factory.get(api_url, query), conn)
+        return run
+
+    etag = call(views.api_areas, factory.get(api_url), conn)["ETag"]
+
+    def conditional(i):
+        return call(views.api_areas,
+                    factory.get(api_url, HTTP_IF_NONE_MATCH=etag), conn)
+
+    def size(i):
+        hashname = hashnames[i % len(hashnames)]
+        return call(views.api_area_size,
+                    factory.get(reverse("openlink-api-area-size",
+                                        args=[hashname])),
+                    conn, hashname)
+
+    def debug(i):
+        return call(views.debugoutput, factory.get("/debugoutput/"), conn)
+
+    def index(i):
+        return call(views.openlink, factory.get(reverse("openlink_index")),
+                    conn)
+
+    return [
+        ("openlink", index),
+        ("api_areas", listing({})),
+        ("api_areas name", listing({"sort": "name", "order": "asc"})),
+        ("api_areas size", listing({"sort": "size"})),
+        ("api_areas q", listing({"q": "area_1"})),
+        ("api_areas 304", conditional),
+        ("api_area_size", size),
+        ("debugoutput", debug),
+    ]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def measure(name, function, requests):
+    """
+    Call function(i) for i in range(requests).
+    :return: dict with 'name', 'requests', 'seconds' (list), 'calls'
+             (Counter per request), 'status'
+    """
+    seconds = []
+    calls = collections.Counter()
+    status = collections.Counter()
+    for i in range(requests):
+        with FsCounter() as counter:
+            start = time.perf_counter()
+            response = function(i)
+            seconds.append(time.perf_counter() - start)
+        calls.update(counter.calls)
+        status[response.status_code] += 1
+    return {'name': name, 'requests': requests, 'seconds': seconds,
+            'calls': collections.Counter({k: v / float(requests)
+                                          for k, v in calls.items()}),
+            'status': status}
+
+
+def benchmark(users, areas, files, requests, directory=None, keep=False,
+              with_delete=True):
+    """
+    Generate an OPENLINK_DIR and measure the views for one of its users.
+    :return: list of results of measure
+    """
+    root = tempfile.mkdtemp(prefix="openlink_bench_", dir=directory)
+    openlink_dir = os.path.join(root, "openlink")
+    try:
+        start = time.perf_counter()
+        result = generate(openlink_dir, os.path.join(root, "data"), users,
+                          areas, files)
+        print("# %d areas of %d users with %d symlinks generated in %.1f s"
+              " (%s)" % (users * areas, users, files,
+                         time.perf_counter() - start, root),
+              file=sys.stderr)
+        views.OPENLINK_DIR = openlink_dir
+        user_id = min(result)
+        conn = Conn(user_id)
+        hashnames = result[user_id]
+
+        results = []
+        # the first request creates the registry of all areas
+        results.append(measure(
+            "api_areas cold", lambda i: call(
+                views.api_areas,
+                RequestFactory().get(reverse("openlink-api-areas")), conn),
+            1))
+        for name, function in get_scenarios(conn, hashnames):
+            results.append(measure(name, function, requests))
+        if with_delete:
+            referer = "https://omero.example.org/webclient/"
+
+            def delete(i):
+                request = RequestFactory().post(
+                    reverse("openlink-delete"),
+                    {"hashname_id": hashnames[i]}, HTTP_REFERER=referer)
+                return call(views.delete, request, conn)
+            results.append(measure("delete", delete,
+                                   min(requests, len(hashnames))))
+        return results
+    finally:
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def format_calls(calls):
+    return ", ".join("%s %.1f" % (name.replace("builtins.", "")
+                                  .replace("os.", ""), count)
+                     for name, count in sorted(calls.items()))
+
+
+def print_results(users, areas, files, results):
+    print("%d users x %d areas x %d symlinks" % (users, areas, files))
+    print("  %-16s %6s %9s %9s %9s %9s %9s  %s"
+          % ("view", "n", "p50 ms", "p90 ms", "p99 ms", "max ms",
+             "fs calls", "status"))
+    for r in results:
+        ms = [s * 1000 for s in r['seconds']]
+        print("  %-16s %6d %9.2f %9.2f %9.2f %9.2f %9.1f  %s"
+              % ((r['name'], r['requests']) +
+                 tuple(percentile(ms, p) for p in PERCENTILES) +
+                 (max(ms), sum(r['calls'].values()),
+                  " ".join("%d:%d" % s for s in sorted(r['status'].items())))))
+        if r['calls']:
+            print("  %-16s %s" % ("", format_calls(r['calls'])))
+    print()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the views of OMERO.openlink over a "
+                    "synthetic OPENLINK_DIR")
+    parser.add_argument("--users", type=int, default=10,
+                        help="number of users (default: 10)")
+    parser.add_argument("--areas", type=int, nargs="+", default=[10, 100],
+                        help="areas per user, one run per number "
+                             "(default: 10 100)")
+    parser.add_argument("--files", type=int, default=50,
+                        help="symlinks per area (default: 50)")
+    parser.add_argument("--requests", type=int, default=50,
+                        help="requests per view (default: 50)")
+    parser.add_argument("--no-delete", action="store_true",
+                        help="do not measure the deletion of areas")
+    parser.add_argument("--dir", default=None,
+                        help="directory for the temporary OPENLINK_DIR")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the temporary directories")
+    args = parser.parse_args(argv)
+
+    # dangling symlinks are logged as errors by every scan of an area
+    logging.getLogger("omero_openlink").setLevel(logging.CRITICAL)
+    use_urls()
+    for areas in args.areas:
+        results = benchmark(args.users, areas, args.files, args.requests,
+                            args.dir, args.keep, not args.no_delete)
+        print_results(args.users, areas, args.files, results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Fake OMERO server for benchmarks of Create_OpenLink.py: synthetic data
+(World) and an in-memory BlitzGateway (FakeGateway) that counts its round
+trips. If omero-py is not available, importing the package installs the
+minimal omero modules of omero_stubs.
+"""
+
+from .omero_stubs import install
+
+OMERO_STUBS = install()
+
+from .gateway import FakeGateway, RoundTrips  # noqa: E402
+from .world import World  # noqa: E402
+
+__all__ = ["FakeGateway", "RoundTrips", "World", "OMERO_STUBS"]
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+In-memory stand-in of the BlitzGateway for Create_OpenLink.py.
+
+Only the calls the script makes are implemented. The projection queries
+are answered by handlers that are keyed by the query strings of the
+script (QUERY_* constants), so the fake follows changes of the queries
+and fails loudly on a query it does not know. Every call that would be a
+round trip to the OMERO server is counted.
+"""
+
+import collections
+
+from omero.rtypes import unwrap, wrap
+
+
+class RoundTrips:
+    """Counter of simulated round trips, by call and by query"""
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.queries = collections.Counter()
+
+    def add(self, call, query=None):
+        self.calls[call] += 1
+        if query is not None:
+            self.queries[query] += 1
+
+    @property
+    def total(self):
+        return sum(self.calls.values())
+
+    def reset(self):
+        self.calls.clear()
+        self.queries.clear()
+
+
+def get_ids(params):
+    return [int(id) for id in unwrap(params.map["ids"])]
+
+
+def get_page(params, rows):
+    page = params.theFilter
+    if page is None:
+        return rows
+    offset = unwrap(page.offset) or 0
+    limit = unwrap(page.limit)
+    return rows[offset:] if limit is None else rows[offset:offset + limit]
+
+
+def build_handlers(script, world):
+    """
+    :param script: module of Create_OpenLink.py
+    :param world: World
+    :return: dict of {<query>: (<name>, <handler(params)>)}
+    """
+    handlers = {}
+
+    def names(obj_type):
+        def handler(params):
+            objects = world.names[obj_type]
+            return [[id, objects[id]] for id in get_ids(params)
+                    if id in objects]
+        return handler
+
+    def children(link_type, child_type):
+        def handler(params):
+            links = world.children[link_type]
+            return [[parent_id, child_id, world.names[child_type][child_id]]
+                    for parent_id in sorted(get_ids(params))
+                    for child_id in sorted(links.get(parent_id, []))]
+        return handler
+
+    def parents(link_type, parent_type):
+        def handler(params):
+            links = world.parents[link_type]
+            return [[child_id, parent_id,
+                     world.names[parent_type][parent_id]]
+                    for child_id in sorted(get_ids(params))
+                    for parent_id in sorted(links.get(child_id, []))]
+        return handler
+
+    def image_files(params):
+        rows = []
+        for id in get_ids(params):
+            if id not in world.names["Image"]:
+                continue
+            fileset_id = world.image_fileset.get(id)
+            head = [id, world.names["Image"][id], world.user_id,
+                    next(iter(world.groups)), fileset_id]
+            files = world.filesets.get(fileset_id) or \
+                [(None, None, None, None, None)]
+            rows.extend(head + list(f) for f in files)
+        return rows
+
+    def plate_images(params):
+        rows = []
+        for id in sorted(get_ids(params)):
+            for row, column, sample_id, image_id in \
+                    sorted(world.well_samples.get(id, [])):
+                rows.append([id, row, column, sample_id, image_id,
+                             world.names["Image"][image_id], world.user_id,
+                             next(iter(world.groups)),
+                             world.image_fileset.get(image_id)])
+        return get_page(params, rows)
+
+    def fileset_files(params):
+        return [[id] + list(f) for id in get_ids(params)
+                for f in world.filesets.get(id, [])]
+
+    def group_owners(params):
+        return [[id, owner_id] for id in get_ids(params)
+                for owner_id in world.groups.get(id, ("", []))[1]]
+
+    def attachments(obj_type):
+        def handler(params):
+            return [[id] + list(a) for id in get_ids(params)
+                    for a in world.attachments.get((obj_type, id), [])]
+        return handler
+
+    for obj_type in world.names:
+        handlers[script.QUERY_NAMES % obj_type] = (
+            "names", names(obj_type))
+        handlers[script.QUERY_FILE_ANNOTATIONS % obj_type] = (
+            "attachments", attachments(obj_type))
+    for link_type, child_type in script.CHILD_LINKS.values():
+        handlers[script.QUERY_CHILDREN % link_type] = (
+            "children", children(link_type, child_type))
+    for link_type, parent_type in script.PARENT_LINKS.values():
+        handlers[script.QUERY_PARENTS % link_type] = (
+            "parents", parents(link_type, parent_type))
+    handlers[script.QUERY_IMAGE_FILES] = ("image files", image_files)
+    handlers[script.QUERY_PLATE_IMAGES] = ("plate images", plate_images)
+    handlers[script.QUERY_FILESET_FILES] = ("fileset files", fileset_files)
+    handlers[script.QUERY_GROUP_OWNERS] = ("group owners", group_owners)
+    return handlers
+
+
+class Permissions:
+
+    def __init__(self, perm):
+        self.perm = perm
+
+    def __str__(self):
+        return self.perm
+
+
+class Details:
+
+    def __init__(self, perm):
+        self.perm = perm
+
+    def getPermissions(self):
+        return Permissions(self.perm)
+
+
+class ExperimenterWrapper:
+
+    def __init__(self, id):
+        self.id = id
+
+    def getId(self):
+        return self.id
+
+    def getName(self):
+        return "user_%d" % self.id
+
+    def getFullName(self):
+        return "User %d" % self.id
+
+    def simpleMarshal(self):
+        return {"id": self.id, "omeName": self.getName(),
+                "email": "user_%d@example.org" % self.id}
+
+
+class ExperimenterGroupWrapper:
+
+    def __init__(self, id, perm):
+        self.id = id
+        self.perm = perm
+
+    def getId(self):
+        return self.id
+
+    def getName(self):
+        return "group_%d" % self.id
+
+    def getDetails(self):
+        return Details(self.perm)
+
+
+class QueryService:
+
+    def __init__(self, handlers, round_trips):
+        self.handlers = handlers
+        self.round_trips = round_trips
+
+    def projection(self, query, params, ctx=None):
+        try:
+            name, handler = self.handlers[query]
+        except KeyError:
+            raise NotImplementedError("query not simulated: %s" % query)
+        self.round_trips.add("projection", name)
+        return [wrap(row) for row in handler(params)]
+
+
+class ServiceOpts(dict):
+
+    def setOmeroGroup(self, group):
+        self["omero.group"] = str(group)
+
+
+class FakeGateway:
+    """
+    Connection of the user world.user_id as seen by Create_OpenLink.py
+    """
+
+    def __init__(self, script, world, admin=False):
+        """
+        :param script: module of Create_OpenLink.py (for its queries)
+        :param world: World
+        :param admin: user is full admin
+        """
+        self.world = world
+        self.admin = admin
+        self.round_trips = RoundTrips()
+        self.SERVICE_OPTS = ServiceOpts()
+        self.user = ExperimenterWrapper(world.user_id)
+        self.query_service = QueryService(build_handlers(script, world),
+                                          self.round_trips)
+
+    # the user and the services are loaded on connect
+    def getUser(self):
+        return self.user
+
+    def getQueryService(self):
+        return self.query_service
+
+    def isFullAdmin(self):
+        self.round_trips.add("isFullAdmin")
+        return self.admin
+
+    def getGroupFromContext(self):
+        self.round_trips.add("getGroupFromContext")
+        id = next(iter(self.world.groups))
+        return ExperimenterGroupWrapper(id, self.world.groups[id][0])
+
+    def getObject(self, obj_type, id):
+        self.round_trips.add("getObject", obj_type)
+        return next(iter(self.getObjects(obj_type, [id], count=False)), None)
+
+    def getObjects(self, obj_type, ids, count=True):
+        if count:
+            self.round_trips.add("getObjects", obj_type)
+        if obj_type == "Experimenter":
+            return iter([ExperimenterWrapper(id) for id in ids])
+        if obj_type == "ExperimenterGroup":
+            return iter([ExperimenterGroupWrapper(id,
+                                                  self.world.groups[id][0])
+                         for id in ids if id in self.world.groups])
+        raise NotImplementedError("objects not simulated: %s" % obj_type)
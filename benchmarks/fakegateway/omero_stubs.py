@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Minimal stand-ins of the omero modules that Create_OpenLink.py imports.
+
+They are only installed if omero-py is not available, so the benchmark can
+run on a machine without OMERO. With omero-py installed the real rtypes
+and ParametersI are used and only the gateway is simulated.
+"""
+
+import sys
+import types
+
+
+def rtype(value):
+    return value
+
+
+def wrap(value):
+    return value
+
+
+def unwrap(value):
+    return value
+
+
+class Filter:
+    """Paging of a query (offset, limit), see ParametersI.page"""
+
+    def __init__(self):
+        self.offset = None
+        self.limit = None
+
+
+class ParametersI:
+    """Parameters of a query: named values in map, paging in theFilter"""
+
+    def __init__(self):
+        self.map = {}
+        self.theFilter = None
+
+    def add(self, name, value):
+        self.map[name] = value
+        return self
+
+    def addId(self, id):
+        return self.add("id", id)
+
+    def addIds(self, ids):
+        return self.add("ids", list(ids))
+
+    def addLong(self, name, value):
+        return self.add(name, value)
+
+    def addString(self, name, value):
+        return self.add(name, value)
+
+    def page(self, offset, limit):
+        self.theFilter = Filter()
+        self.theFilter.offset = offset
+        self.theFilter.limit = limit
+        return self
+
+
+class Unavailable:
+    """Classes that need an OMERO server"""
+
+    def __init__(self, *args, **kwargs):
+        raise RuntimeError("OMERO is not available, use the fake gateway")
+
+
+def install():
+    """
+    Install the stand-ins as omero, omero.rtypes, omero.sys, omero.gateway
+    and omero.scripts if omero-py can not be imported.
+    :return: True if the stand-ins were installed
+    """
+    try:
+        import omero  # noqa: F401
+        import omero.rtypes  # noqa: F401
+        return False
+    except ImportError:
+        pass
+
+    omero = types.ModuleType("omero")
+    omero.client = Unavailable
+    omero.constants = types.SimpleNamespace(
+        namespaces=types.SimpleNamespace(NSDYNAMIC="omero.constants.namespaces"
+                                                   ".NSDYNAMIC"))
+
+    rtypes = types.ModuleType("omero.rtypes")
+    for name in ("rstring", "rlong", "rint", "rbool", "rlist"):
+        setattr(rtypes, name, rtype)
+    rtypes.wrap = wrap
+    rtypes.unwrap = unwrap
+
+    sys_ = types.ModuleType("omero.sys")
+    sys_.ParametersI = ParametersI
+
+    gateway = types.ModuleType("omero.gateway")
+    gateway.BlitzGateway = Unavailable
+
+    scripts = types.ModuleType("omero.scripts")
+    scripts.client = Unavailable
+
+    omero.rtypes, omero.sys = rtypes, sys_
+    omero.gateway, omero.scripts = gateway, scripts
+    sys.modules.update({
+        "omero": omero,
+        "omero.rtypes": rtypes,
+        "omero.sys": sys_,
+        "omero.gateway": gateway,
+        "omero.scripts": scripts,
+    })
+    return True
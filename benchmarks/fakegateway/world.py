@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Synthetic OMERO data: Projects, Datasets, Screens, Plates, Images and
+their filesets of configurable size.
+
+The original files of the filesets are written as sparse files into a
+managed repository directory (and the attachments into an OMERO data
+directory), so the symlinks of Create_OpenLink.py point to existing files
+without using disk space.
+"""
+
+import hashlib
+import os
+
+# default owner and group of all objects
+USER_ID = 2
+GROUP_ID = 3
+GROUP_PERMISSIONS = "rwra--"
+
+WELL_ROWS = "ABCDEFGHIJKLMNOP"
+
+
+def ceil_div(a, b):
+    return -(-a // b)
+
+
+def original_file_path(original_rep, file_id):
+    """
+    :return: location of an original file in the OMERO data directory,
+             the file of id 1234567 is stored as Dir-001/Dir-234/1234567
+    """
+    suffix = ""
+    remaining = file_id
+    while remaining > 999:
+        remaining //= 1000
+        if remaining > 0:
+            suffix = os.path.join("Dir-%03d" % (remaining % 1000), suffix)
+    return os.path.join(original_rep, suffix, str(file_id))
+
+
+class World:
+    """
+    Object graph of an OMERO server with <images> images in a
+    Project/Dataset hierarchy and <images> images in a Screen/Plate
+    hierarchy. Containers are filled up in order, the last one may be
+    smaller.
+    """
+
+    def __init__(self, managed_rep, original_rep, images=1000,
+                 images_per_dataset=100, datasets_per_project=10,
+                 fields_per_well=4, wells_per_plate=96, plates_per_screen=10,
+                 multi_file_every=10, files_per_fileset=3,
+                 files_per_plate=2, file_size=1024 * 1024,
+                 attachment_every=100, write_files=True):
+        """
+        :param managed_rep: directory of the filesets (omero.managed.dir)
+        :param original_rep: directory of the attachments (omero.data.dir)
+        :param images: number of images per hierarchy
+        :param multi_file_every: every n-th image of a dataset has a
+                                 fileset of files_per_fileset files, 0 for
+                                 none
+        :param files_per_plate: number of files of the fileset of a plate
+                                (shared by all images of the plate)
+        :param file_size: size of every original file in bytes
+        :param attachment_every: every n-th object has a file attachment,
+                                 0 for none
+        :param write_files: write the (sparse) original files
+        """
+        self.managed_rep = managed_rep
+        self.original_rep = original_rep
+        self.file_size = file_size
+        self.write_files = write_files
+        self.user_id = USER_ID
+        # {<group id>: (<permissions>, [<owner ids>])}
+        self.groups = {GROUP_ID: (GROUP_PERMISSIONS, [])}
+        # {<type>: {<id>: <name>}}
+        self.names = {t: {} for t in ("Project", "Dataset", "Image", "Screen",
+                                      "Plate")}
+        # {<link type>: {<parent id>: [<child ids>]}}
+        self.children = {"ProjectDatasetLink": {}, "DatasetImageLink": {},
+                         "ScreenPlateLink": {}}
+        # {<link type>: {<child id>: [<parent ids>]}}
+        self.parents = {link: {} for link in self.children}
+        # {<image id>: <fileset id>}
+        self.image_fileset = {}
+        # {<fileset id>: [(<path>, <name>, <size>, <hash>, <hasher>)]}
+        self.filesets = {}
+        # {<plate id>: [(<row>, <column>, <well sample id>, <image id>)]}
+        self.well_samples = {}
+        # {(<type>, <id>): [(<file id>, <name>, <size>, <hash>, <hasher>)]}
+        self.attachments = {}
+        self.attachment_every = attachment_every
+        self.next_id = {}
+        self.files = 0
+
+        for project in range(ceil_div(images, images_per_dataset *
+                                      datasets_per_project)):
+            project_id = self.new("Project", "project_%d" % project)
+            for dataset in range(datasets_per_project):
+                first = (project * datasets_per_project + dataset) * \
+                    images_per_dataset
+                if first >= images:
+                    break
+                dataset_id = self.new("Dataset", "dataset_%d" % dataset)
+                self.link("ProjectDatasetLink", project_id, dataset_id)
+                for i in range(min(images_per_dataset, images - first)):
+                    multi = multi_file_every and \
+                        (i + 1) % multi_file_every == 0
+                    image_id = self.new("Image", "image_%d.tif" % (first + i))
+                    self.link("DatasetImageLink", dataset_id, image_id)
+                    self.image_fileset[image_id] = self.new_fileset(
+                        "image_%d" % (first + i),
+                        files_per_fileset if multi else 1)
+
+        per_plate = wells_per_plate * fields_per_well
+        for screen in range(ceil_div(images, per_plate * plates_per_screen)):
+            screen_id = self.new("Screen", "screen_%d" % screen)
+            for plate in range(plates_per_screen):
+                first = (screen * plates_per_screen + plate) * per_plate
+                if first >= images:
+                    break
+                plate_id = self.new("Plate", "plate_%d" % plate)
+                self.link("ScreenPlateLink", screen_id, plate_id)
+                fileset_id = self.new_fileset("plate_%d_%d" % (screen, plate),
+                                              files_per_plate)
+                samples = self.well_samples[plate_id] = []
+                for i in range(min(per_plate, images - first)):
+                    well = i // fields_per_well
+                    image_id = self.new(
+                        "Image", "%s%d [Well %s%d, Field %d]"
+                        % (WELL_ROWS[well // 12 % 16], well % 12 + 1,
+                           WELL_ROWS[well // 12 % 16], well % 12 + 1,
+                           i % fields_per_well + 1))
+                    self.image_fileset[image_id] = fileset_id
+                    samples.append((well // 12, well % 12,
+                                    self.new("WellSample"), image_id))
+
+    def new(self, obj_type, name=None):
+        """:return: id of a new object, ids are counted per type"""
+        id = self.next_id.get(obj_type, 1)
+        self.next_id[obj_type] = id + 1
+        if obj_type in self.names:
+            self.names[obj_type][id] = name
+            if self.attachment_every and id % self.attachment_every == 0:
+                self.attachments[(obj_type, id)] = [
+                    self.new_attachment("%s_%d.pdf" % (obj_type.lower(), id))]
+        return id
+
+    def link(self, link_type, parent_id, child_id):
+        self.children[link_type].setdefault(parent_id, []).append(child_id)
+        self.parents[link_type].setdefault(child_id, []).append(parent_id)
+
+    def new_fileset(self, name, count):
+        """:return: id of a new fileset of count files"""
+        fileset_id = self.new("Fileset")
+        path = "user_%d/Blitz-0-Ice.ThreadPool.Server-%d/%s/" % (
+            self.user_id, fileset_id % 16, fileset_id)
+        files = []
+        for i in range(count):
+            file_name = "%s_%d.tif" % (name, i) if count > 1 \
+                else "%s.tif" % name
+            self.write(os.path.join(self.managed_rep, path, file_name))
+            files.append((path, file_name, self.file_size,
+                          self.checksum(path + file_name), "SHA1-160"))
+        self.filesets[fileset_id] = files
+        return fileset_id
+
+    def new_attachment(self, name):
+        file_id = self.new("OriginalFile")
+        self.write(original_file_path(self.original_rep, file_id))
+        return (file_id, name, self.file_size, self.checksum(name),
+                "SHA1-160")
+
+    def write(self, path):
+        """Write a sparse file of file_size bytes"""
+        self.files += 1
+        if not self.write_files:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.truncate(self.file_size)
+
+    @staticmethod
+    def checksum(name):
+        return hashlib.sha1(name.encode("utf-8")).hexdigest()
+
+    def count(self, obj_type):
+        return len(self.names[obj_type])
+
+    def ids(self, obj_type):
+        """
+        :return: ids of all objects of obj_type, for images only the images
+                 of datasets (images of plates are added with their plates)
+        """
+        if obj_type == "Image":
+            return list(self.parents["DatasetImageLink"])
+        return list(self.names[obj_type])
+
+    def images_of(self, obj_type, ids):
+        """:return: number of images of the given objects"""
+        if obj_type == "Image":
+            return len(ids)
+        if obj_type == "Plate":
+            return sum(len(self.well_samples[id]) for id in ids)
+        link = {"Project": "ProjectDatasetLink", "Dataset": "DatasetImageLink",
+                "Screen": "ScreenPlateLink"}[obj_type]
+        child_type = {"Project": "Dataset", "Dataset": "Image",
+                      "Screen": "Plate"}[obj_type]
+        return sum(self.images_of(child_type,
+                                  self.children[link].get(id, []))
+                   for id in ids)
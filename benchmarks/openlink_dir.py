@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Generate a synthetic OPENLINK_DIR: <users> users with <areas> areas each,
+every area with <files> symlinks to (sparse) files of a data directory.
+
+    $ python benchmarks/openlink_dir.py /tmp/openlink /tmp/data \\
+          --users 10 --areas 100 --files 50
+
+The areas look like areas of Create_OpenLink.py (content index, curl file,
+manifest and metadata sidecar). Every n-th symlink is dangling (its file
+was removed from OMERO) and every n-th area was created by an older
+version of the script (no metadata sidecar), so views that scan areas
+meet both. No registry is written, it is created by the first request of
+the web app.
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+from omero_openlink.areas import AREA_INFO_FILE, AREA_INFO_VERSION, \
+    CONTENT_FILE, CONTENT_VERSION, CURL_FILE, MANIFEST_FILE  # noqa: E402
+
+FILE_SIZE = 1024 * 1024
+HASH_LENGTH = 12
+FILES_PER_DIR = 1000
+
+
+def make_hashname(rand, user_id, name):
+    return "rn_%s_%d_%s" % ("".join(rand.choices(
+        string.ascii_uppercase + string.digits, k=HASH_LENGTH)),
+        user_id, name)
+
+
+def write_sources(data_dir, user_id, files, file_size=FILE_SIZE):
+    """
+    Write the files of a user that are linked by the areas as sparse files.
+    :return: list of paths
+    """
+    paths = []
+    for i in range(files):
+        path = os.path.join(data_dir, "user_%d" % user_id,
+                            "fileset_%d" % (i // FILES_PER_DIR),
+                            "image_%d.tif" % i)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.truncate(file_size)
+        paths.append(path)
+    return paths
+
+
+def write_area(openlink_dir, hashname, sources, dangling_every=20,
+               legacy=False, file_size=FILE_SIZE):
+    """
+    Write an area with one symlink per source file, every dangling_every-th
+    symlink points to a missing file.
+    :param legacy: area of an older version of the script without metadata
+                   sidecar
+    :return: path of the area
+    """
+    path = os.path.join(openlink_dir, hashname)
+    dataset = os.path.join(path, "Dataset_1")
+    os.makedirs(dataset)
+    size = 0
+    files = 0
+    curl = []
+    manifest = [{"manifest": 1}]
+    for i, source in enumerate(sources):
+        if dangling_every and (i + 1) % dangling_every == 0:
+            source += ".removed"
+        else:
+            size += file_size
+            files += 1
+        name = os.path.basename(source)
+        os.symlink(source, os.path.join(dataset, name))
+        curl.append('create-dirs\noutput="%s/Dataset_1/%s"\ncontinue-at -\n'
+                    'url="https://data.example.org/%s/Dataset_1/%s"\n'
+                    % (hashname, name, hashname, name))
+        manifest.append({"path": "Dataset_1/%s" % name,
+                         "output": "%s/Dataset_1/%s" % (hashname, name),
+                         "size": file_size, "revision": 1})
+    with open(os.path.join(path, CURL_FILE), "w") as f:
+        f.write("\n".join(curl))
+    with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+        f.writelines(json.dumps(e) + "\n" for e in manifest)
+    with open(os.path.join(path, CONTENT_FILE), "w") as f:
+        f.write(json.dumps({"version": CONTENT_VERSION}) + "\n")
+        f.write(json.dumps({"path": "Dataset_1", "type": "Dataset",
+                            "id": 1}) + "\n")
+    if not legacy:
+        with open(os.path.join(path, AREA_INFO_FILE), "w") as f:
+            json.dump({"version": AREA_INFO_VERSION,
+                       "generator": "benchmarks", "size": size,
+                       "files": files,
+                       "modified": time.time()}, f)
+    return path
+
+
+def generate(openlink_dir, data_dir, users=10, areas=100, files=50,
+             dangling_every=20, legacy_every=10, seed=0,
+             file_size=FILE_SIZE):
+    """
+    Generate a synthetic OPENLINK_DIR.
+    :param openlink_dir: OPENLINK_DIR, created if missing
+    :param data_dir: directory of the linked files
+    :param users: number of users, ids 2..users+1
+    :param areas: number of areas per user
+    :param files: number of symlinks per area
+    :param dangling_every: every n-th symlink is dangling, 0 for none
+    :param legacy_every: every n-th area has no metadata sidecar, 0 for
+                         none
+    :return: dict of {<user id>: [<hashnames>]}
+    """
+    rand = random.Random(seed)
+    os.makedirs(openlink_dir, exist_ok=True)
+    result = {}
+    for user_id in range(2, users + 2):
+        sources = write_sources(data_dir, user_id, files, file_size)
+        hashnames = result[user_id] = []
+        for i in range(areas):
+            hashname = make_hashname(rand, user_id, "area_%d" % i)
+            write_area(openlink_dir, hashname, sources, dangling_every,
+                       legacy_every and (i + 1) % legacy_every == 0,
+                       file_size)
+            hashnames.append(hashname)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic OPENLINK_DIR")
+    parser.add_argument("openlink_dir", help="OPENLINK_DIR to create")
+    parser.add_argument("data_dir", help="directory of the linked files")
+    parser.add_argument("--users", type=int, default=10,
+                        help="number of users (default: 10)")
+    parser.add_argument("--areas", type=int, default=100,
+                        help="areas per user (default: 100)")
+    parser.add_argument("--files", type=int, default=50,
+                        help="symlinks per area (default: 50)")
+    parser.add_argument("--dangling-every", type=int, default=20,
+                        help="every n-th symlink is dangling (default: 20, "
+                             "0 for none)")
+    parser.add_argument("--legacy-every", type=int, default=10,
+                        help="every n-th area has no metadata sidecar "
+                             "(default: 10, 0 for none)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    result = generate(args.openlink_dir, args.data_dir, args.users,
+                      args.areas, args.files, args.dangling_every,
+                      args.legacy_every)
+    print("%d areas of %d users generated in %.1f s"
+          % (sum(len(a) for a in result.values()), len(result),
+             time.perf_counter() - start))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
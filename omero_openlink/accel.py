@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Authenticated downloads served by nginx.
+
+OMERO.web only checks the access to a file of an area (OMERO session of
+the owner or a signed share token) and answers with an X-Accel-Redirect
+header to an internal nginx location (omero.web.openlink.accel_location)
+that aliases OPENLINK_DIR. nginx then sends the file itself (sendfile), so
+no bytes pass through OMERO.web. See scripts/nginx/openlink-accel.conf.
+"""
+
+import os
+import posixpath
+import urllib.parse
+
+from django.core import signing
+
+# salt of the share tokens, tokens of other apps are not valid here
+SHARE_TOKEN_SALT = "omero_openlink.share"
+
+
+def clean_path(path):
+    """
+    Normalise the path of a file or directory in an area.
+    :param path: path relative to the area, "" for the area itself
+    :return: normalised path ("" for the area, ends with "/" for
+             directories as in the request)
+    :raise ValueError: if the path leaves the area or contains hidden
+                       files
+    """
+    if "\\" in path or "\x00" in path or path.startswith("/"):
+        raise ValueError("invalid path")
+    is_dir = path == "" or path.endswith("/")
+    parts = [p for p in path.split("/") if p not in ("", ".")]
+    if any(p == ".." or p.startswith(".") for p in parts):
+        raise ValueError("invalid path")
+    clean = "/".join(parts)
+    if is_dir and clean:
+        clean += "/"
+    return clean
+
+
+def build_accel_headers(location, hashname, path):
+    """
+    Return headers of a response that lets nginx serve a file or directory
+    of an area.
+    :param location: internal nginx location of OPENLINK_DIR
+    :param hashname: name of the area directory
+    :param path: path in the area as returned by clean_path
+    :return: dict of headers
+    """
+    # directory of the area itself ends with "/" as well
+    target = posixpath.join("/" + location.strip("/"), hashname, path)
+    headers = {'X-Accel-Redirect': urllib.parse.quote(target)}
+    if path and not path.endswith("/"):
+        filename = os.path.basename(path)
+        headers['Content-Disposition'] = \
+            "attachment; filename*=UTF-8''%s" % urllib.parse.quote(filename)
+    return headers
+
+
+def make_share_token(hashname):
+    """Return a signed token that grants access to the area <hashname>"""
+    return signing.dumps(hashname, salt=SHARE_TOKEN_SALT, compress=True)
+
+
+def read_share_token(token, max_age):
+    """
+    :param max_age: lifetime of tokens in seconds, None for unlimited
+    :return: name of the area the token grants access to
+    :raise signing.BadSignature: if the token is invalid or expired
+    """
+    return signing.loads(token, salt=SHARE_TOKEN_SALT, max_age=max_age)
@@ -0,0 +1,464 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Streaming archives (store-only ZIP64 and TAR) of an OpenLink area.
+
+The archive is generated chunk by chunk while it is sent, nothing is
+compressed and no temporary copy is written, so memory use does not depend
+on the size of the files. The layout is deterministic (members sorted by
+path, times and sizes of the linked files), so the size of the archive is
+known in advance and an interrupted download can be resumed with a byte
+range:
+- TAR: the archive is a sequence of headers and file contents, a range
+  starts directly at the matching position of the matching file.
+- ZIP: the CRC-32 of every member is written behind its data and in the
+  central directory. While a member is read, its CRC-32 (and every
+  CRC_CHECKPOINT bytes the CRC-32 of the part read so far) is appended to
+  ARCHIVE_CRC_FILE in the area, together with the validator of the
+  members (Archive.validator). A
+  range starts at the matching position of the matching file, too, only
+  CRCs that are not known yet are computed again (usually the part of the
+  file that was sent when the download was interrupted since the last
+  checkpoint).
+"""
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import tarfile
+import time
+import zlib
+
+from .areas import ARCHIVE_CRC_FILE, DELTA_CURL_PATTERN, LISTING_FILES, \
+    SHARD_CURL_PATTERN, SKIP_FILES
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+# the CRC-32 of a member is stored every CRC_CHECKPOINT bytes
+CRC_CHECKPOINT = 64 * CHUNK_SIZE
+
+# member of an archive: name in the archive, path of the (linked) file
+Member = collections.namedtuple('Member', 'arcname path size mtime')
+
+
+def list_members(path, prefix):
+    """
+    List the files of an area in archive order, symlinks are resolved.
+    Files written by Create_OpenLink.py (and directory listings) and hidden
+    files in the area itself are skipped.
+    :param path: path to area
+    :param prefix: top directory of the members in the archive
+    :return: list of Member
+    """
+    members = []
+    for dirpath, dirnames, filenames in os.walk(path, followlinks=True):
+        dirnames.sort()
+        rel_dir = os.path.relpath(dirpath, path)
+        for name in sorted(filenames):
+            if name in LISTING_FILES:
+                continue
+            if rel_dir == "." and (name in SKIP_FILES or
+                                   name.startswith(".") or
+                                   re.match(DELTA_CURL_PATTERN, name) or
+                                   re.match(SHARD_CURL_PATTERN, name)):
+                continue
+            file_path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(file_path)
+            except OSError as e:
+                logger.error('Cannot access %s: %s', file_path, e)
+                continue
+            arcname = os.path.normpath(os.path.join(prefix, rel_dir, name))
+            members.append(Member(arcname.replace(os.sep, "/"), file_path,
+                                  st.st_size, int(st.st_mtime)))
+    return members
+
+
+def read_file(member, offset=0):
+    """
+    Yield the content of a member from offset in chunks. If the file became
+    shorter in the meantime, the missing bytes are sent as zeros so the
+    layout of the archive does not change.
+    """
+    remaining = member.size - offset
+    try:
+        with open(member.path, "rb") as f:
+            f.seek(offset)
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+    except OSError as e:
+        logger.error('Cannot read %s: %s', member.path, e)
+    if remaining > 0:
+        logger.error('%s is shorter than %d bytes', member.path, member.size)
+        while remaining > 0:
+            chunk = min(CHUNK_SIZE, remaining)
+            remaining -= chunk
+            yield bytes(chunk)
+
+
+class Archive:
+    """Deterministic archive of a list of members"""
+
+    content_type = "application/octet-stream"
+    extension = ""
+
+    def __init__(self, members, path=None):
+        """
+        :param members: list of Member
+        :param path: path to the area, None if nothing is stored in the area
+        """
+        self.members = members
+        self.path = path
+
+    @property
+    def validator(self):
+        """Validator of the members, changes if a member is added or changed
+        (see get_etag for the ETag of an archive without its members)"""
+        validator = hashlib.sha1(self.extension.encode())
+        for m in self.members:
+            validator.update(('%s:%d:%d;' % (m.arcname, m.size, m.mtime))
+                             .encode())
+        return validator.hexdigest()
+
+    @property
+    def size(self):
+        raise NotImplementedError
+
+    def chunks(self, start=0, end=None):
+        """
+        Yield the bytes start..end (inclusive) of the archive.
+        :param end: last byte, None for the end of the archive
+        """
+        raise NotImplementedError
+
+
+class TarArchive(Archive):
+    """POSIX (pax) TAR archive"""
+
+    content_type = "application/x-tar"
+    extension = "tar"
+
+    def __init__(self, members, path=None):
+        super().__init__(members, path)
+        # [(header, member, padding)]
+        self.parts = []
+        for member in members:
+            info = tarfile.TarInfo(member.arcname)
+            info.size = member.size
+            info.mtime = member.mtime
+            info.mode = 0o644
+            header = info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8")
+            padding = -member.size % tarfile.BLOCKSIZE
+            self.parts.append((header, member, padding))
+        self.trailer = bytes(2 * tarfile.BLOCKSIZE)
+
+    @property
+    def size(self):
+        return sum(len(h) + m.size + p for h, m, p in self.parts) + \
+            len(self.trailer)
+
+    def chunks(self, start=0, end=None):
+        if end is None:
+            end = self.size - 1
+        position = 0
+        for header, member, padding in self.parts:
+            pieces = ((header, None), (member, member.size),
+                      (bytes(padding), None))
+            for piece, length in pieces:
+                if length is None:
+                    length = len(piece)
+                if position + length <= start:
+                    position += length
+                    continue
+                if position > end:
+                    return
+                offset = max(start - position, 0)
+                if isinstance(piece, Member):
+                    data = read_file(piece, offset)
+                else:
+                    data = [piece[offset:]]
+                position += offset
+                for chunk in data:
+                    if position + len(chunk) > end + 1:
+                        chunk = chunk[:end + 1 - position]
+                    position += len(chunk)
+                    if chunk:
+                        yield chunk
+                    if position > end:
+                        return
+        offset = max(start - position, 0)
+        yield self.trailer[offset:end + 1 - position]
+
+
+def dos_time(mtime):
+    """:return: (time, date) of a timestamp in MS-DOS format (UTC)"""
+    t = time.gmtime(max(mtime, 315532800))
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class ZipArchive(Archive):
+    """Store-only ZIP64 archive with data descriptors"""
+
+    content_type = "application/zip"
+    extension = "zip"
+
+    VERSION = 45
+    # data descriptor, UTF-8 names
+    FLAGS = 0x0808
+    LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+    ZIP64_LOCAL_EXTRA = struct.Struct("<HHQQ")
+    DATA_DESCRIPTOR = struct.Struct("<IIQQ")
+    CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+    ZIP64_CENTRAL_EXTRA = struct.Struct("<HHQQQ")
+    ZIP64_END = struct.Struct("<IQHHIIQQQQ")
+    ZIP64_LOCATOR = struct.Struct("<IIQI")
+    END = struct.Struct("<IHHHHIIH")
+
+    def __init__(self, members, path=None):
+        super().__init__(members, path)
+        self.names = [m.arcname.encode("utf-8") for m in members]
+        self.offsets = []
+        offset = 0
+        for name, member in zip(self.names, members):
+            self.offsets.append(offset)
+            offset += self.LOCAL_HEADER.size + len(name) + \
+                self.ZIP64_LOCAL_EXTRA.size + member.size + \
+                self.DATA_DESCRIPTOR.size
+        self.central_offset = offset
+        self.central_size = sum(
+            self.CENTRAL_HEADER.size + len(name) +
+            self.ZIP64_CENTRAL_EXTRA.size for name in self.names)
+
+    @property
+    def size(self):
+        return self.central_offset + self.central_size + \
+            self.ZIP64_END.size + self.ZIP64_LOCATOR.size + self.END.size
+
+    def local_header(self, name, member):
+        mod_time, mod_date = dos_time(member.mtime)
+        return self.LOCAL_HEADER.pack(
+            0x04034b50, self.VERSION, self.FLAGS, 0, mod_time, mod_date, 0,
+            0xFFFFFFFF, 0xFFFFFFFF, len(name), self.ZIP64_LOCAL_EXTRA.size) + \
+            name + self.ZIP64_LOCAL_EXTRA.pack(1, 16, 0, 0)
+
+    def central_header(self, name, member, crc, offset):
+        mod_time, mod_date = dos_time(member.mtime)
+        return self.CENTRAL_HEADER.pack(
+            0x02014b50, (3 << 8) | self.VERSION, self.VERSION, self.FLAGS, 0,
+            mod_time, mod_date, crc, 0xFFFFFFFF, 0xFFFFFFFF, len(name),
+            self.ZIP64_CENTRAL_EXTRA.size, 0, 0, 0, 0o100644 << 16,
+            0xFFFFFFFF) + name + self.ZIP64_CENTRAL_EXTRA.pack(
+                1, 24, member.size, member.size, offset)
+
+    def end_records(self):
+        count = len(self.members)
+        zip64_end = self.central_offset + self.central_size
+        return self.ZIP64_END.pack(
+            0x06064b50, self.ZIP64_END.size - 12, self.VERSION, self.VERSION,
+            0, 0, count, count, self.central_size, self.central_offset) + \
+            self.ZIP64_LOCATOR.pack(0x07064b50, 0, zip64_end, 1) + \
+            self.END.pack(0x06054b50, 0, 0, 0xFFFF, 0xFFFF, 0xFFFFFFFF,
+                          0xFFFFFFFF, 0)
+
+    def member_data(self, index, member, crcs, start, end, need_crc):
+        """
+        Yield the bytes start..end (inclusive, relative to the member) of the
+        content of a member. The CRC-32 is computed (and added to crcs) if it
+        is needed or can be computed on the way, i.e. if the content is read
+        from a checkpoint.
+        """
+        crc_offset, crc = crcs.get(index)
+        known = crc_offset == member.size
+        track = not known and (need_crc or crc_offset == start)
+        if start > end and not track:
+            return
+        position = crc_offset if track else start
+        for chunk in read_file(member, position):
+            chunk_start = position
+            position += len(chunk)
+            if track:
+                crc = zlib.crc32(chunk, crc)
+                if position == member.size or \
+                        position // CRC_CHECKPOINT > \
+                        chunk_start // CRC_CHECKPOINT:
+                    crcs.add(index, position, crc)
+            if start <= end and chunk_start <= end and position > start:
+                yield chunk[max(start - chunk_start, 0):end + 1 - chunk_start]
+            if position > end and not (track and need_crc):
+                return
+
+    def chunks(self, start=0, end=None):
+        if end is None:
+            end = self.size - 1
+        crcs = CrcCache(self.path, self.validator)
+        try:
+            # the central directory needs the CRC-32 of every member
+            central = end >= self.central_offset
+            for index, (name, member, offset) in enumerate(
+                    zip(self.names, self.members, self.offsets)):
+                if offset > end:
+                    return
+                header = self.local_header(name, member)
+                data_offset = offset + len(header)
+                descriptor_offset = data_offset + member.size
+                if descriptor_offset + self.DATA_DESCRIPTOR.size <= start \
+                        and not central:
+                    continue
+                yield from slice_bytes(header, offset, start, end)
+                yield from self.member_data(
+                    index, member, crcs, max(start - data_offset, 0),
+                    min(end, descriptor_offset - 1) - data_offset,
+                    central or descriptor_offset <= end)
+                if descriptor_offset <= end:
+                    yield from slice_bytes(self.DATA_DESCRIPTOR.pack(
+                        0x08074b50, crcs.get(index)[1], member.size,
+                        member.size), descriptor_offset, start, end)
+            position = self.central_offset
+            for index, (name, member, offset) in enumerate(
+                    zip(self.names, self.members, self.offsets)):
+                header = self.central_header(name, member,
+                                             crcs.get(index)[1], offset)
+                yield from slice_bytes(header, position, start, end)
+                position += len(header)
+            yield from slice_bytes(self.end_records(), position, start, end)
+        finally:
+            crcs.close()
+
+
+def slice_bytes(data, position, start, end):
+    """
+    :param position: position of data in the archive
+    :return: list with the part of data in the range start..end (inclusive)
+    """
+    if position + len(data) <= start or position > end:
+        return []
+    return [data[max(start - position, 0):end + 1 - position]]
+
+
+class CrcCache:
+    """
+    CRC-32 checkpoints of the members of a ZIP archive, stored in
+    ARCHIVE_CRC_FILE of an area. The first line holds the validator of the
+    archive, every other line [<index of member>, <offset>, <CRC-32 of the
+    bytes before offset>].
+    The file is replaced when the validator changes.
+    """
+
+    def __init__(self, path, validator):
+        """
+        :param path: path to the area, None to keep the checkpoints in memory
+        :param validator: validator of the members (Archive.validator)
+        """
+        self.file = os.path.join(path, ARCHIVE_CRC_FILE) if path else None
+        self.validator = validator
+        # {<index>: (<offset>, <crc>)}
+        self.checkpoints = {}
+        self.out = None
+        self.valid = False
+        if self.file is not None:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.file) as f:
+                if json.loads(f.readline()).get('validator') != \
+                        self.validator:
+                    return
+                self.valid = True
+                for line in f:
+                    try:
+                        index, offset, crc = json.loads(line)
+                    except ValueError:
+                        # last line of an interrupted write
+                        continue
+                    if offset > self.get(index)[0]:
+                        self.checkpoints[index] = (offset, crc)
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def get(self, index):
+        """:return: (offset, CRC-32) of the last checkpoint of a member"""
+        return self.checkpoints.get(index, (0, 0))
+
+    def add(self, index, offset, crc):
+        if offset <= self.get(index)[0]:
+            return
+        self.checkpoints[index] = (offset, crc)
+        if self.file is None:
+            return
+        try:
+            if self.out is None:
+                if not self.valid:
+                    tmp_file = "%s.%d" % (self.file, os.getpid())
+                    with open(tmp_file, "w") as f:
+                        f.write(json.dumps({'validator': self.validator})
+                                + "\n")
+                    os.replace(tmp_file, self.file)
+                    self.valid = True
+                self.out = open(self.file, "a")
+            self.out.write(json.dumps([index, offset, crc]) + "\n")
+            self.out.flush()
+        except OSError as e:
+            logger.error('Cannot write %s: %s', self.file, e)
+            self.file = None
+
+    def close(self):
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+
+
+ARCHIVES = {cls.extension: cls for cls in (ZipArchive, TarArchive)}
+
+
+def get_etag(fmt, info):
+    """
+    Return ETag of the archive of an area from its metadata, it changes with
+    every run of Create_OpenLink.py on the area, so conditional requests do
+    not need to walk the area.
+    :param fmt: key of ARCHIVES
+    :param info: metadata of the area (see areas.get_area_info)
+    """
+    return hashlib.sha1(('%s:%s:%s:%s' % (
+        fmt, info.get('modified'), info.get('size'), info.get('files')))
+        .encode()).hexdigest()
+
+
+def get_archive(path, prefix, fmt):
+    """
+    :param fmt: key of ARCHIVES
+    :return: Archive of the area in path
+    """
+    return ARCHIVES[fmt](list_members(path, prefix), path)
+
+
+def parse_range(header, size):
+    """
+    Parse a Range header with a single byte range.
+    :return: (start, end) (inclusive), None for the whole archive or
+             ValueError if the range is not satisfiable
+    """
+    match = re.match(r'^bytes=(\d*)-(\d*)$', (header or "").strip())
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+    if match.group(1) == "":
+        length = int(match.group(2))
+        if length == 0:
+            raise ValueError("empty range")
+        return max(size - length, 0), size - 1
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Helpers to inspect OpenLink areas on the filesystem.
+
+An area is a directory OPENLINK_DIR/rn_<randomNumber>_<userID>_<areaName>
+that is filled with symlinks by the script Create_OpenLink.py.
+"""
+
+import datetime
+import glob
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# index of object directories, written by Create_OpenLink.py
+CONTENT_FILE = "content.jsonl"
+CONTENT_VERSION = 2
+# flat {<absolute path>: <id>} dict of older versions of Create_OpenLink.py
+LEGACY_CONTENT_FILE = "content.json"
+CURL_FILE = "batch_download.curl"
+
+# area metadata sidecar, written by Create_OpenLink.py next to CONTENT_FILE
+AREA_INFO_FILE = ".area_info.json"
+AREA_INFO_VERSION = 1
+AREA_INFO_GENERATOR = "omero_openlink.web"
+
+# size and checksum of all files, curl files of every revision of the area
+MANIFEST_FILE = "manifest.jsonl"
+DELTA_CURL_PATTERN = r"^delta_(\d+)\.curl$"
+# curl files with a part of the files of the area, balanced by size
+SHARD_CURL_PATTERN = r"^batch_download_(\d+)\.curl$"
+
+# progress of an unfinished run of Create_OpenLink.py in the area
+JOURNAL_FILE = ".journal.jsonl"
+
+# listing of every directory of the area for the static viewer of nginx
+LISTING_FILE = ".listing.json"
+LISTING_FILES = (LISTING_FILE, LISTING_FILE + ".gz")
+
+# phases of the last run of Create_OpenLink.py (Chrome trace) and its
+# optional profile
+TRACE_FILE = ".trace.json"
+PROFILE_FILE = ".profile.pstats"
+
+# CRC-32 of the members of the ZIP archive of the area, written by the web
+# app (see omero_openlink.archive)
+ARCHIVE_CRC_FILE = ".archive_crc.jsonl"
+
+SKIP_FILES = [CONTENT_FILE, LEGACY_CONTENT_FILE, CURL_FILE, AREA_INFO_FILE,
+              MANIFEST_FILE, TRACE_FILE, PROFILE_FILE, ARCHIVE_CRC_FILE]
+
+# deleted areas in OPENLINK_DIR, removed in the background (see
+# omero_openlink.trash)
+TRASH_DIR = ".trash"
+
+
+def find_areas(openlink_dir, user_id=None):
+    """
+    List area directories in openlink_dir.
+    :param openlink_dir: path to OPENLINK_DIR
+    :param user_id: only list areas of this OMERO user id
+    :return: list of paths
+    """
+    if user_id is None:
+        user_id = "*"
+    pattern = os.path.join(openlink_dir, "rn_*_%s_*" % user_id)
+    return [p for p in glob.glob(pattern) if os.path.isdir(p)]
+
+
+def scan_area(path, skip_files=True):
+    """Return total size and number of files in path and subdirs.
+    Symlinks are followed. If is_dir() or stat() fails, log an error
+    and assume zero size (for example, file has been deleted).
+    :param path: directory to scan
+    :param skip_files: skip files of SKIP_FILES, delta and shard curl files
+                       (only in path itself), listings are always skipped
+    :return: (total size in bytes, number of files)
+    """
+    total = 0
+    count = 0
+    for entry in os.scandir(path):
+        if entry.name in LISTING_FILES:
+            continue
+        if skip_files and (entry.name in SKIP_FILES or
+                           re.match(DELTA_CURL_PATTERN, entry.name) or
+                           re.match(SHARD_CURL_PATTERN, entry.name)):
+            continue
+        try:
+            is_dir = entry.is_dir(follow_symlinks=True)
+        except OSError as error:
+            logger.error('Error calling is_dir(): %s', error)
+            continue
+        if is_dir:
+            size, files = scan_area(entry.path, skip_files=False)
+            total += size
+            count += files
+        else:
+            try:
+                total += entry.stat(follow_symlinks=True).st_size
+                count += 1
+            except OSError as error:
+                logger.error('Error calling stat(): %s', error)
+
+    return total, count
+
+
+def get_area_size(path):
+    """Return total size of files in path and subdirs."""
+    return scan_area(path)[0]
+
+
+def read_area_info(path):
+    """
+    Read the metadata sidecar of an area.
+    :param path: path to area
+    :return: dict with keys size, files, modified, generator, version,
+             expires (optional), shards (optional, bytes per shard curl
+             file) and segmented (optional, number of files that are
+             downloaded in byte-range segments) or None if the sidecar is
+             missing, unreadable or stale
+    """
+    info_file = os.path.join(path, AREA_INFO_FILE)
+    try:
+        with open(info_file, "r") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(info, dict) or \
+            info.get("version") != AREA_INFO_VERSION:
+        return None
+
+    # content was changed after the sidecar was written (for example by
+    # an older version of Create_OpenLink.py)
+    for name in (CONTENT_FILE, LEGACY_CONTENT_FILE):
+        try:
+            content_mtime = os.path.getmtime(os.path.join(path, name))
+        except OSError:
+            continue
+        if content_mtime > info.get("modified", 0):
+            return None
+
+    return info
+
+
+def read_content_index(path):
+    """
+    Read the index of object directories of an area.
+    :param path: path to area
+    :return: list of dicts {'path': <path relative to area>,
+             'type': <object type or None>, 'id': <object id>}
+    """
+    entries = []
+    try:
+        with open(os.path.join(path, CONTENT_FILE), "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # incomplete line of an interrupted write
+                    continue
+                if "path" in entry:
+                    entries.append(entry)
+        return entries
+    except OSError:
+        pass
+
+    # area of an older version of Create_OpenLink.py
+    try:
+        with open(os.path.join(path, LEGACY_CONTENT_FILE), "r") as f:
+            content = json.load(f)
+    except (OSError, ValueError):
+        return entries
+    for p, id in content.items():
+        entries.append({'path': os.path.relpath(p, path), 'type': None,
+                        'id': id})
+    return entries
+
+
+def count_segmented_files(path):
+    """
+    Return number of files of the manifest of an area that are downloaded
+    in byte-range segments (and have to be joined by
+    omero_openlink.reassemble after a download with curl).
+    """
+    count = 0
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), "r") as f:
+            for line in f:
+                try:
+                    if json.loads(line).get("segments"):
+                        count += 1
+                except ValueError:
+                    # incomplete line of an interrupted write
+                    continue
+    except OSError:
+        pass
+    return count
+
+
+def write_area_info(path, info):
+    """Write the metadata sidecar of an area atomically."""
+    info_file = os.path.join(path, AREA_INFO_FILE)
+    tmp_file = "%s.%s.tmp" % (info_file, os.getpid())
+    with open(tmp_file, "w") as f:
+        json.dump(info, f)
+    os.replace(tmp_file, info_file)
+
+
+def rebuild_area_info(path):
+    """
+    Scan area on the filesystem and (re)write its metadata sidecar.
+    :param path: path to area
+    :return: dict of the new sidecar
+    """
+    size, files = scan_area(path)
+    info = {
+        "version": AREA_INFO_VERSION,
+        "generator": AREA_INFO_GENERATOR,
+        "size": size,
+        "files": files,
+        "segmented": count_segmented_files(path),
+        "modified": datetime.datetime.now().timestamp(),
+    }
+    # keep expiry date of a stale sidecar
+    try:
+        with open(os.path.join(path, AREA_INFO_FILE), "r") as f:
+            expires = json.load(f).get("expires")
+    except (OSError, ValueError, AttributeError):
+        expires = None
+    if expires is not None:
+        info["expires"] = expires
+    try:
+        write_area_info(path, info)
+    except OSError as e:
+        logger.error('Cannot write area info for %s: %s', path, e)
+    return info
+
+
+def get_area_info(path):
+    """
+    Return metadata of an area from its sidecar. Rebuild the sidecar only
+    if it is missing or stale.
+    """
+    info = read_area_info(path)
+    if info is None:
+        info = rebuild_area_info(path)
+    return info
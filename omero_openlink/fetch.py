@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Download an OpenLink area without curl.
+
+    $ python -m omero_openlink.fetch https://omero-data.myfacility.com/<area>/
+
+The files of the area are read from its manifest (manifest.jsonl) and
+downloaded with a pool of threads into the same layout as the batch
+download with curl. Files that are already present with the size and
+checksum of the manifest are skipped, partial files are resumed with HTTP
+range requests, so the command can simply be run again after a network
+drop. Files with byte-range segments are downloaded segment by segment and
+joined (see omero_openlink.reassemble). Only the standard library is used.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from .areas import MANIFEST_FILE
+from .reassemble import CHUNK_SIZE, join_parts, read_manifest, safe_path, \
+    verify_file
+
+# seconds between two progress reports
+REPORT_INTERVAL = 5
+TIMEOUT = 60
+
+# state of a file in the download directory
+COMPLETE = "complete"
+PARTIAL = "partial"
+CORRUPT = "corrupt"
+
+
+class Progress:
+    """Thread-safe counter of downloaded bytes with a periodic report"""
+
+    def __init__(self, total_files=0, out=sys.stderr):
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.files = 0
+        self.total_files = total_files
+        self.start = time.time()
+        self.out = out
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def add(self, count):
+        with self.lock:
+            self.bytes += count
+
+    def file_done(self):
+        with self.lock:
+            self.files += 1
+
+    def throughput(self):
+        """:return: average bytes per second since the start"""
+        return self.bytes / max(time.time() - self.start, 1e-6)
+
+    def report(self):
+        print("%s downloaded (%s/s), %d of %d files done"
+              % (format_size(self.bytes), format_size(self.throughput()),
+                 self.files, self.total_files), file=self.out)
+
+    def _run(self):
+        while not self.stopped.wait(REPORT_INTERVAL):
+            self.report()
+
+    def start_reports(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop_reports(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if size < 1024 or unit == "TB":
+            return "%.1f %s" % (size, unit)
+        size /= 1024.0
+
+
+def get_area_urls(url):
+    """
+    :param url: URL of an area or of its manifest
+    :return: (URL of the area ending with "/", URL of the manifest)
+    """
+    if url.endswith("/" + MANIFEST_FILE):
+        url = url[:-len(MANIFEST_FILE)]
+    if not url.endswith("/"):
+        url += "/"
+    return url, url + MANIFEST_FILE
+
+
+def get_file_url(area_url, entry):
+    return area_url + urllib.parse.quote(entry["path"])
+
+
+def get_state(entry, path):
+    """
+    Compare a file in the download directory with its manifest entry.
+    :return: COMPLETE, PARTIAL (missing or to be resumed) or CORRUPT (to be
+             downloaded again)
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return PARTIAL
+    expected = entry.get("size")
+    if expected is None or size < expected:
+        return PARTIAL
+    if size > expected:
+        return CORRUPT
+    return COMPLETE if verify_file(path, entry) is None else CORRUPT
+
+
+def download(url, path, progress, start=0, length=None):
+    """
+    Download (the byte range start..start+length-1 of) url into path,
+    resume if path already holds the first bytes.
+    :param length: number of bytes, None for all bytes from start
+    """
+    try:
+        have = os.path.getsize(path)
+    except OSError:
+        have = 0
+    if length is not None and have >= length:
+        if have == length:
+            return
+        have = 0
+    request = urllib.request.Request(url)
+    if start + have > 0 or length is not None:
+        end = "" if length is None else str(start + length - 1)
+        request.add_header("Range", "bytes=%d-%s" % (start + have, end))
+    try:
+        response = urllib.request.urlopen(request, timeout=TIMEOUT)
+    except urllib.error.HTTPError as e:
+        # nothing left to download
+        if e.code == 416 and length is None and have > 0:
+            return
+        raise
+    with response:
+        if response.status == 200 and start + have > 0:
+            if start > 0:
+                raise IOError("server does not support range requests")
+            # range was ignored, download again
+            have = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "ab" if have > 0 else "wb") as f:
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                progress.add(len(chunk))
+
+
+def fetch_file(area_url, entry, directory, progress):
+    """
+    Download a file that is not segmented and verify it.
+    :return: error message or None
+    """
+    path = safe_path(directory, entry["output"])
+    try:
+        download(get_file_url(area_url, entry), path, progress)
+        error = verify_file(path, entry)
+    except (OSError, urllib.error.URLError) as e:
+        error = str(e)
+    progress.file_done()
+    return error
+
+
+def fetch_segment(area_url, entry, segment, directory, progress):
+    """
+    Download a byte-range segment of a file into its part.
+    :return: error message or None
+    """
+    start, end, part = segment
+    try:
+        download(get_file_url(area_url, entry),
+                 safe_path(directory, part), progress,
+                 start, end - start + 1)
+    except (OSError, urllib.error.URLError) as e:
+        return "%s: %s" % (part, e)
+    return None
+
+
+def fetch(url, directory=".", workers=4, progress=None):
+    """
+    Download the files of an area that are missing, incomplete or corrupt
+    in directory.
+    :param url: URL of the area or of its manifest
+    :param workers: number of parallel downloads
+    :return: dict with number of 'downloaded', 'skipped' and 'failed'
+             files, downloaded 'bytes', 'seconds' and the list of 'errors'
+    """
+    area_url, manifest_url = get_area_urls(url)
+    entries = read_manifest(manifest_url)
+    if progress is None:
+        progress = Progress()
+    progress.total_files = len(entries)
+    result = {'downloaded': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+
+    def failed(entry, error):
+        result['failed'] += 1
+        result['errors'].append("%s: %s" % (entry["output"], error))
+
+    # entries whose file and parts are in directory
+    paths = {}
+    for i, entry in enumerate(entries):
+        try:
+            paths[i] = safe_path(directory, entry["output"])
+            for segment in entry.get("segments") or []:
+                safe_path(directory, segment[2])
+        except ValueError as e:
+            paths.pop(i, None)
+            failed(entry, e)
+            progress.file_done()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        states = dict(zip(paths, executor.map(
+            get_state, [entries[i] for i in paths], paths.values())))
+        files = {}
+        segments = {}
+        for i in paths:
+            entry = entries[i]
+            if states[i] == COMPLETE:
+                result['skipped'] += 1
+                progress.file_done()
+                continue
+            if states[i] == CORRUPT:
+                os.remove(paths[i])
+            if entry.get("segments"):
+                segments[i] = [
+                    executor.submit(fetch_segment, area_url, entry, segment,
+                                    directory, progress)
+                    for segment in entry["segments"]]
+            else:
+                files[i] = executor.submit(fetch_file, area_url, entry,
+                                           directory, progress)
+
+        joins = {}
+        for i, futures in segments.items():
+            errors = [e for e in (f.result() for f in futures) if e]
+            if errors:
+                failed(entries[i], "; ".join(errors))
+                progress.file_done()
+                continue
+            joins[i] = executor.submit(join_parts, entries[i], directory)
+        for i, future in list(files.items()) + list(joins.items()):
+            try:
+                error = future.result()
+            except OSError as e:
+                error = str(e)
+            if i in joins:
+                progress.file_done()
+            if error is not None:
+                failed(entries[i], error)
+            else:
+                result['downloaded'] += 1
+
+    result['bytes'] = progress.bytes
+    result['seconds'] = time.time() - progress.start
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Download the files of an OpenLink area, resume partial "
+                    "files and skip files that are already complete")
+    parser.add_argument("url", help="URL of the OpenLink area")
+    parser.add_argument("--dir", default=".",
+                        help="download directory (default: current)")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="number of parallel downloads (default: 4)")
+    args = parser.parse_args(argv)
+
+    progress = Progress()
+    progress.start_reports()
+    try:
+        result = fetch(args.url, args.dir, args.workers, progress)
+    except (OSError, urllib.error.URLError) as e:
+        print("ERROR: can't read manifest of %s: %s" % (args.url, e),
+              file=sys.stderr)
+        return 1
+    finally:
+        progress.stop_reports()
+    for error in result['errors']:
+        print("ERROR: %s" % error, file=sys.stderr)
+    print("%d files downloaded, %d skipped, %d failed: %s in %.1f s (%s/s)"
+          % (result['downloaded'], result['skipped'], result['failed'],
+             format_size(result['bytes']), result['seconds'],
+             format_size(progress.throughput())))
+    return 1 if result['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
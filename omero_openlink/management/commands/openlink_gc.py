@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Remove expired OpenLink areas: areas whose own expiry date (set in
+Create_OpenLink.py) has passed or, without own expiry date, that are older
+than omero.web.openlink.expiry_days.
+"""
+
+import datetime
+import os
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from omero_openlink import openlink_settings
+from omero_openlink.registry import get_expiry, list_expired_areas, \
+    reconcile
+from omero_openlink.trash import move_to_trash, reap
+
+
+class Command(BaseCommand):
+    help = "Remove expired OpenLink areas"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=8,
+            help="Number of areas that are removed in parallel")
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Only list expired areas")
+
+    def handle(self, *args, **options):
+        openlink_dir = openlink_settings.OPENLINK_DIR.rstrip("/")
+        if not os.path.isdir(openlink_dir):
+            raise CommandError("No such OpenLink directory: %s"
+                               % openlink_dir)
+        default_days = openlink_settings.EXPIRY_DAYS
+
+        try:
+            reconcile(openlink_dir)
+            expired = list_expired_areas(openlink_dir, default_days)
+        except (OSError, sqlite3.Error) as e:
+            raise CommandError("Cannot read area registry: %s" % e)
+
+        self.stdout.write("%d expired areas" % len(expired))
+        moved = 0
+        for row in expired:
+            expires = datetime.datetime.fromtimestamp(
+                get_expiry(row, default_days))
+            self.stdout.write("%s: expired %s" % (
+                row["hashname"], expires.strftime("%Y-%m-%d %H:%M")))
+            if options["dry_run"]:
+                continue
+            try:
+                move_to_trash(openlink_dir, row["hashname"])
+                moved += 1
+            except OSError as e:
+                self.stderr.write("ERROR: %s: %s" % (row["hashname"], e))
+        if options["dry_run"]:
+            return
+
+        # removes also areas that were deleted before
+        result = reap(openlink_dir, options["workers"])
+        self.stdout.write("Removed %d areas: %s in %d inodes reclaimed" % (
+            result["removed"], filesizeformat(result["bytes"]),
+            result["inodes"]))
+        if result["failed"] or moved < len(expired):
+            raise CommandError("Remove failed for %d areas" % (
+                result["failed"] + len(expired) - moved))
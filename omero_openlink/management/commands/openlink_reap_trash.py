@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Remove the deleted OpenLink areas in OPENLINK_DIR/.trash, for example from
+a cron job if the background reaper of OMERO.web is not running.
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from omero_openlink import openlink_settings
+from omero_openlink.trash import reap
+
+
+class Command(BaseCommand):
+    help = "Remove deleted OpenLink areas from the trash"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=8,
+            help="Number of areas that are removed in parallel")
+
+    def handle(self, *args, **options):
+        openlink_dir = openlink_settings.OPENLINK_DIR.rstrip("/")
+        if not os.path.isdir(openlink_dir):
+            raise CommandError("No such OpenLink directory: %s"
+                               % openlink_dir)
+
+        result = reap(openlink_dir, options["workers"])
+        self.stdout.write("Removed %d areas from the trash: %s in %d inodes"
+                          % (result["removed"],
+                             filesizeformat(result["bytes"]),
+                             result["inodes"]))
+        if result["failed"]:
+            raise CommandError("Remove failed for %d areas"
+                               % result["failed"])
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Rebuild the metadata sidecar (size, number of files) of existing OpenLink
+areas, for example for areas that were created by an older version of
+Create_OpenLink.py.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from omero_openlink import openlink_settings
+from omero_openlink.areas import (find_areas, read_area_info,
+                                  rebuild_area_info)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the metadata sidecar of existing OpenLink areas"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, default=None,
+            help="Only rebuild areas of the OMERO user with this id")
+        parser.add_argument(
+            "--workers", type=int, default=8,
+            help="Number of areas that are scanned in parallel")
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Rebuild also valid sidecars")
+
+    def handle(self, *args, **options):
+        openlink_dir = openlink_settings.OPENLINK_DIR.rstrip("/")
+        if not os.path.isdir(openlink_dir):
+            raise CommandError("No such OpenLink directory: %s"
+                               % openlink_dir)
+
+        areas = find_areas(openlink_dir, options["user"])
+        if not options["force"]:
+            areas = [p for p in areas if read_area_info(p) is None]
+        self.stdout.write("Rebuild area info of %d areas" % len(areas))
+
+        workers = max(1, options["workers"])
+        failed = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(rebuild_area_info, p): p
+                       for p in areas}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    info = future.result()
+                except OSError as e:
+                    failed += 1
+                    self.stderr.write("ERROR: %s: %s" % (path, e))
+                    continue
+                self.stdout.write("%s: %s in %d files" % (
+                    os.path.basename(path), filesizeformat(info["size"]),
+                    info["files"]))
+
+        if failed:
+            raise CommandError("Rebuild failed for %d areas" % failed)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Repair drift between the registry of OpenLink areas and the areas in
+OPENLINK_DIR (areas created by an older version of Create_OpenLink.py,
+areas removed by hand, ...). Creates the registry if it does not exist.
+"""
+
+import os
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+
+from omero_openlink import openlink_settings
+from omero_openlink.registry import get_registry_path, reconcile
+
+
+class Command(BaseCommand):
+    help = "Reconcile the registry of OpenLink areas with OPENLINK_DIR"
+
+    def handle(self, *args, **options):
+        openlink_dir = openlink_settings.OPENLINK_DIR.rstrip("/")
+        if not os.path.isdir(openlink_dir):
+            raise CommandError("No such OpenLink directory: %s"
+                               % openlink_dir)
+
+        try:
+            result = reconcile(openlink_dir)
+        except (OSError, sqlite3.Error) as e:
+            raise CommandError("Cannot reconcile %s: %s"
+                               % (get_registry_path(openlink_dir), e))
+        self.stdout.write("Areas added: %(added)d, removed: %(removed)d, "
+                          "updated: %(updated)d" % result)
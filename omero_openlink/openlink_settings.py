@@ -13,7 +13,18 @@ OPENLINK_SETTINGS_MAPPINGS = {
     'omero.web.openlink.dir': ['OPENLINK_DIR', '', str_not_empty, None],
     # $ omero config set omero.web.openlink.dir '{""}'
     'omero.web.openlink.servername': ['SERVER_NAME', '', str_not_empty, None],
-    'omero.web.openlink.type_http': ['TYPE_HTTP', '', str_not_empty, None]
+    'omero.web.openlink.type_http': ['TYPE_HTTP', '', str_not_empty, None],
+    # default lifetime of areas in days (0: never expire), areas can set
+    # their own lifetime in Create_OpenLink.py
+    'omero.web.openlink.expiry_days': ['EXPIRY_DAYS', 0, int, None],
+    # parallel downloads of the curl --parallel command for areas without
+    # shard curl files, areas have CURL_SHARDS of Create_OpenLink.py
+    'omero.web.openlink.parallel_max': ['PARALLEL_MAX', 4, int, None],
+    # internal nginx location of OPENLINK_DIR for downloads authorized by
+    # OMERO.web (X-Accel-Redirect), empty to disable them
+    'omero.web.openlink.accel_location': ['ACCEL_LOCATION', '', str, None],
+    # lifetime of share links in days (0: unlimited)
+    'omero.web.openlink.share_token_days': ['SHARE_TOKEN_DAYS', 7, int, None]
 }
 
 process_custom_settings(sys.modules[__name__], 'OPENLINK_SETTINGS_MAPPINGS')
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Reassemble and verify files that were downloaded in byte-range segments.
+
+Files larger than SEGMENT_THRESHOLD of Create_OpenLink.py are listed as
+segments in the curl files of an area, curl writes every segment to its own
+<output>.partNNNN file. Run in the directory in which curl was run:
+
+    $ python -m omero_openlink.reassemble <area url>/manifest.jsonl
+
+The parts of every segmented file in manifest.jsonl are checked, joined
+into the file and removed. The joined files (or with --all every file of
+the manifest) are verified with size and checksum of the manifest.
+Only the standard library is used, so the module can also be run on a
+client without omero_openlink.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import urllib.request
+
+CHUNK_SIZE = 1024 * 1024
+
+# checksum algorithms of OMERO that can be verified
+HASHERS = {
+    'SHA1-160': hashlib.sha1,
+    'MD5-128': hashlib.md5,
+}
+
+
+def safe_path(directory, path):
+    """
+    Join a path of the manifest to the download directory. The manifest is
+    read from a server, so its paths must not lead outside the directory.
+    :return: path in directory
+    :raise ValueError: if path is absolute or outside directory
+    """
+    root = os.path.realpath(directory)
+    joined = os.path.normpath(os.path.join(root, path))
+    if os.path.isabs(path) or os.path.commonpath([root, joined]) != root:
+        raise ValueError("path outside the download directory: %s" % path)
+    return joined
+
+
+def read_manifest(location):
+    """
+    Read the manifest of an area.
+    :param location: path or URL of manifest.jsonl
+    :return: list of file entries
+    """
+    if "://" in location:
+        with urllib.request.urlopen(location) as response:
+            lines = response.read().decode("utf-8").splitlines()
+    else:
+        with open(location, "r") as f:
+            lines = f.read().splitlines()
+    entries = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if "path" in entry:
+            entries.append(entry)
+    return entries
+
+
+def new_hasher(entry):
+    """Return hash object for the checksum of the entry, None if unknown"""
+    if not entry.get("hash") or entry.get("hasher") not in HASHERS:
+        return None
+    return HASHERS[entry["hasher"]]()
+
+
+def check_result(entry, size, hasher):
+    """
+    Compare size and checksum of a file with its manifest entry.
+    :return: error message or None
+    """
+    if entry.get("size") is not None and size != entry["size"]:
+        return "size %d, expected %d" % (size, entry["size"])
+    if hasher is not None and hasher.hexdigest() != entry["hash"].lower():
+        return "checksum mismatch (%s)" % entry["hasher"]
+    return None
+
+
+def verify_file(path, entry):
+    """
+    Verify size and checksum of a downloaded file.
+    :return: error message or None
+    """
+    hasher = new_hasher(entry)
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+    return check_result(entry, size, hasher)
+
+
+def check_parts(entry, directory):
+    """
+    Check that all parts of a segmented file are complete.
+    :return: list of error messages
+    :raise ValueError: if a part is outside directory (see safe_path)
+    """
+    errors = []
+    for start, end, output in entry["segments"]:
+        part = safe_path(directory, output)
+        try:
+            size = os.path.getsize(part)
+        except OSError:
+            errors.append("missing %s" % output)
+            continue
+        if size != end - start + 1:
+            errors.append("incomplete %s (%d of %d bytes)"
+                          % (output, size, end - start + 1))
+    return errors
+
+
+def join_parts(entry, directory, keep_parts=False):
+    """
+    Join the parts of a segmented file and verify the result. The file is
+    only replaced if it is complete and valid.
+    :param keep_parts: do not remove the parts
+    :return: error message or None
+    :raise ValueError: if the file or a part is outside directory (see
+                       safe_path)
+    """
+    output = safe_path(directory, entry["output"])
+    parts = [safe_path(directory, part) for start, end, part in
+             entry["segments"]]
+    tmp_file = "%s.%d.tmp" % (output, os.getpid())
+    hasher = new_hasher(entry)
+    size = 0
+    with open(tmp_file, "wb") as target:
+        for part in parts:
+            with open(part, "rb") as f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    size += len(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+    error = check_result(entry, size, hasher)
+    if error is not None:
+        os.remove(tmp_file)
+        return error
+    os.replace(tmp_file, output)
+    if not keep_parts:
+        for part in parts:
+            os.remove(part)
+    return None
+
+
+def reassemble(entries, directory, keep_parts=False, verify_all=False):
+    """
+    Join the segmented files of a manifest and verify the files.
+    :param entries: entries of read_manifest
+    :param directory: directory in which the download was run
+    :param keep_parts: do not remove the parts of joined files
+    :param verify_all: also verify files that are not segmented
+    :return: dict with number of 'joined', 'verified' and 'failed' files
+             and the list of 'errors'
+    """
+    result = {'joined': 0, 'verified': 0, 'failed': 0, 'errors': []}
+    for entry in entries:
+        if not entry.get("segments") and not verify_all:
+            continue
+        try:
+            output = safe_path(directory, entry["output"])
+            errors = check_parts(entry, directory) \
+                if entry.get("segments") else []
+        except ValueError as e:
+            result['failed'] += 1
+            result['errors'].append("%s: %s" % (entry["output"], e))
+            continue
+        if entry.get("segments"):
+            # joined by a previous run
+            if errors and os.path.exists(output) and \
+                    all(e.startswith("missing ") for e in errors):
+                errors = []
+                error = verify_file(output, entry)
+                if error is not None:
+                    errors.append(error)
+                else:
+                    result['verified'] += 1
+            elif not errors:
+                error = join_parts(entry, directory, keep_parts)
+                if error is not None:
+                    errors.append(error)
+                else:
+                    result['joined'] += 1
+        else:
+            try:
+                error = verify_file(output, entry)
+            except OSError as e:
+                error = str(e)
+            errors = [] if error is None else [error]
+            if error is None:
+                result['verified'] += 1
+        if errors:
+            result['failed'] += 1
+            result['errors'].extend("%s: %s" % (entry["output"], e)
+                                    for e in errors)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Join and verify files of an OpenLink area that were "
+                    "downloaded in byte-range segments")
+    parser.add_argument("manifest",
+                        help="path or URL of manifest.jsonl of the area")
+    parser.add_argument("--dir", default=".",
+                        help="directory in which the download was run")
+    parser.add_argument("--keep-parts", action="store_true",
+                        help="do not remove the parts of joined files")
+    parser.add_argument("--all", action="store_true",
+                        help="verify all files of the manifest")
+    args = parser.parse_args(argv)
+
+    result = reassemble(read_manifest(args.manifest), args.dir,
+                        args.keep_parts, args.all)
+    for error in result['errors']:
+        print("ERROR: %s" % error, file=sys.stderr)
+    print("%d files joined, %d verified, %d failed"
+          % (result['joined'], result['verified'], result['failed']))
+    return 1 if result['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Registry of the OpenLink areas in OPENLINK_DIR.
+
+The registry is a SQLite file in OPENLINK_DIR that maps the OMERO user id
+to the areas of the user and their metadata, so listing the areas of a
+user does not need to read the whole (shared) OPENLINK_DIR. It is updated
+by Create_OpenLink.py when an area is created or extended and by the web
+app when an area is deleted. Drift (for example areas that were created by
+an older version of Create_OpenLink.py or removed by hand) is repaired by
+reconcile().
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import time
+
+from .areas import JOURNAL_FILE, TRASH_DIR, count_segmented_files, \
+    read_area_info
+
+logger = logging.getLogger(__name__)
+
+# registry file in OPENLINK_DIR, also written by Create_OpenLink.py
+REGISTRY_FILE = ".openlink_registry.sqlite"
+REGISTRY_VERSION = 5
+
+# status of an area
+STATUS_ACTIVE = "active"
+# created by Create_OpenLink.py, the run is not complete yet (or was
+# interrupted, a rerun with the same parameters resumes it)
+STATUS_BUILDING = "building"
+# moved to the trash, not yet removed (see omero_openlink.trash)
+STATUS_DELETING = "deleting"
+
+# rn_<randomNumber>_<userID>_<areaName>
+AREA_PATTERN = r'^rn_[A-Z,0-9]+_(\d+)_(.+)'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS areas (
+    hashname TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    created REAL NOT NULL,
+    modified REAL NOT NULL,
+    size INTEGER,
+    files INTEGER
+);
+CREATE INDEX IF NOT EXISTS areas_user_id ON areas (user_id);
+"""
+
+# {<version>: <statements to migrate from the previous version>}
+MIGRATIONS = {
+    2: "ALTER TABLE areas ADD COLUMN status TEXT NOT NULL DEFAULT '%s';"
+       % STATUS_ACTIVE,
+    # expiry date of the area (timestamp), NULL: default expiry
+    3: "ALTER TABLE areas ADD COLUMN expires REAL;",
+    # number of shard curl files of the area
+    4: "ALTER TABLE areas ADD COLUMN shards INTEGER;",
+    # number of files that are downloaded in byte-range segments
+    5: "ALTER TABLE areas ADD COLUMN segmented INTEGER;",
+}
+
+COLUMNS = ('hashname', 'user_id', 'name', 'created', 'modified', 'size',
+           'files', 'expires', 'shards', 'segmented')
+
+
+def get_registry_path(openlink_dir):
+    return os.path.join(openlink_dir, REGISTRY_FILE)
+
+
+def connect(openlink_dir):
+    """
+    Open the registry of openlink_dir, create its tables if necessary.
+    :return: sqlite3 connection
+    """
+    conn = sqlite3.connect(get_registry_path(openlink_dir), timeout=30)
+    conn.row_factory = sqlite3.Row
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < REGISTRY_VERSION:
+        with conn:
+            if version == 0:
+                conn.executescript(SCHEMA)
+                version = 1
+            for v in range(version + 1, REGISTRY_VERSION + 1):
+                conn.executescript(MIGRATIONS[v])
+            conn.execute("PRAGMA user_version = %d" % REGISTRY_VERSION)
+    return conn
+
+
+def parse_area_name(hashname):
+    """
+    :return: (user id, area name) of an area directory name or None
+    """
+    match = re.search(AREA_PATTERN, hashname)
+    if match is None:
+        return None
+    return int(match.group(1)), match.group(2)
+
+
+def get_area_row(path, info=None):
+    """
+    Return registry row of the area in path.
+    :param info: metadata sidecar of the area, read if not given
+    :return: dict of COLUMNS or None if path is not an area
+    """
+    hashname = os.path.basename(path)
+    parsed = parse_area_name(hashname)
+    if parsed is None:
+        return None
+    st = os.stat(path)
+    if info is None:
+        info = read_area_info(path) or {}
+    segmented = info.get('segmented')
+    if segmented is None:
+        # sidecar of an older version
+        segmented = count_segmented_files(path)
+    return {'hashname': hashname,
+            'user_id': parsed[0],
+            'name': parsed[1],
+            'created': st.st_ctime,
+            'modified': info.get('modified', st.st_mtime),
+            'size': info.get('size'),
+            'files': info.get('files'),
+            'expires': info.get('expires'),
+            'shards': len(info.get('shards') or []),
+            'segmented': segmented}
+
+
+def _upsert(conn, row, status=STATUS_ACTIVE):
+    conn.execute(
+        "INSERT OR REPLACE INTO areas (%s, status) VALUES (%s, ?)"
+        % (", ".join(COLUMNS), ", ".join("?" * len(COLUMNS))),
+        [row[c] for c in COLUMNS] + [status])
+
+
+def register_area(openlink_dir, path, info=None):
+    """Add or update the area in path in the registry"""
+    row = get_area_row(path, info)
+    if row is None:
+        return
+    conn = connect(openlink_dir)
+    try:
+        with conn:
+            _upsert(conn, row)
+    finally:
+        conn.close()
+
+
+def update_area_info(openlink_dir, hashname, info):
+    """Update size, number of files and modification time of an area"""
+    if not os.path.exists(get_registry_path(openlink_dir)):
+        return
+    conn = connect(openlink_dir)
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE areas SET size = ?, files = ?, modified = ? "
+                "WHERE hashname = ? AND (size IS NOT ? OR files IS NOT ? "
+                "OR modified IS NOT ?)",
+                (info.get('size'), info.get('files'), info.get('modified'),
+                 hashname, info.get('size'), info.get('files'),
+                 info.get('modified')))
+    finally:
+        conn.close()
+
+
+def set_status(openlink_dir, hashname, status):
+    """Set status of the area <hashname>"""
+    if not os.path.exists(get_registry_path(openlink_dir)):
+        return
+    conn = connect(openlink_dir)
+    try:
+        with conn:
+            conn.execute("UPDATE areas SET status = ?, modified = ? "
+                         "WHERE hashname = ?",
+                         (status, time.time(), hashname))
+    finally:
+        conn.close()
+
+
+def unregister_area(openlink_dir, hashname):
+    """Remove the area <hashname> from the registry"""
+    if not os.path.exists(get_registry_path(openlink_dir)):
+        return
+    conn = connect(openlink_dir)
+    try:
+        with conn:
+            conn.execute("DELETE FROM areas WHERE hashname = ?", (hashname,))
+    finally:
+        conn.close()
+
+
+def get_expiry(row, default_days=0):
+    """
+    Return expiry date of a registry row: its own expiry date or
+    <default_days> after its creation.
+    :param default_days: default lifetime of areas in days, 0 for never
+    :return: timestamp or None if the area does not expire
+    """
+    if row.get('expires') is not None:
+        return row['expires']
+    if default_days and default_days > 0:
+        return row['created'] + default_days * 86400
+    return None
+
+
+def list_expired_areas(openlink_dir, default_days=0, now=None):
+    """
+    List areas of all users whose expiry date has passed and that are not
+    deleted yet (including areas of interrupted runs).
+    :param default_days: default lifetime of areas in days, 0 for never
+    :return: list of dicts of COLUMNS
+    """
+    if now is None:
+        now = time.time()
+    conn = connect(openlink_dir)
+    try:
+        rows = [dict(row) for row in conn.execute(
+            "SELECT * FROM areas WHERE status != ?", (STATUS_DELETING,))]
+    finally:
+        conn.close()
+    expired = []
+    for row in rows:
+        expires = get_expiry(row, default_days)
+        if expires is not None and expires <= now:
+            expired.append(row)
+    return expired
+
+
+def list_areas(openlink_dir, user_id):
+    """
+    List the areas of a user. The registry is created by reconcile() if it
+    does not exist yet.
+    :param user_id: OMERO user id
+    :return: list of dicts of COLUMNS
+    """
+    if not os.path.exists(get_registry_path(openlink_dir)):
+        reconcile(openlink_dir)
+    conn = connect(openlink_dir)
+    try:
+        rows = conn.execute(
+            "SELECT * FROM areas WHERE user_id = ?", (int(user_id),))
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def get_area(openlink_dir, hashname):
+    """
+    :return: dict of COLUMNS and status of the area <hashname> or None if it
+             is not registered (or the registry does not exist)
+    """
+    if not os.path.exists(get_registry_path(openlink_dir)):
+        return None
+    conn = connect(openlink_dir)
+    try:
+        row = conn.execute("SELECT * FROM areas WHERE hashname = ?",
+                           (hashname,)).fetchone()
+        return None if row is None else dict(row)
+    finally:
+        conn.close()
+
+
+def in_trash(openlink_dir, hashname):
+    """Return true if the area <hashname> is still in the trash"""
+    trash_dir = os.path.join(openlink_dir, TRASH_DIR)
+    try:
+        names = os.listdir(trash_dir)
+    except OSError:
+        return False
+    return any(n.startswith(hashname + ".") for n in names)
+
+
+def reconcile(openlink_dir):
+    """
+    Repair drift between the registry and the areas in openlink_dir: add
+    missing areas, remove areas that no longer exist and update the
+    metadata of changed areas.
+    Areas that are moved to the trash keep their row (with STATUS_DELETING)
+    until they are removed from the trash, areas with STATUS_BUILDING keep
+    their status while the journal of their run exists.
+    :return: dict with number of 'added', 'removed' and 'updated' areas
+    """
+    found = {}
+    with os.scandir(openlink_dir) as entries:
+        for entry in entries:
+            if entry.is_dir() and parse_area_name(entry.name) is not None:
+                found[entry.name] = entry.path
+
+    result = {'added': 0, 'removed': 0, 'updated': 0}
+    conn = connect(openlink_dir)
+    try:
+        with conn:
+            registered = {row['hashname']: dict(row) for row in
+                          conn.execute("SELECT * FROM areas")}
+            for hashname in set(registered) - set(found):
+                # created after the scan of openlink_dir
+                if os.path.isdir(os.path.join(openlink_dir, hashname)):
+                    continue
+                if registered[hashname]['status'] == STATUS_DELETING and \
+                        in_trash(openlink_dir, hashname):
+                    continue
+                conn.execute("DELETE FROM areas WHERE hashname = ?",
+                             (hashname,))
+                result['removed'] += 1
+            for hashname, path in found.items():
+                try:
+                    row = get_area_row(path)
+                except OSError as e:
+                    logger.error('Cannot read area %s: %s', path, e)
+                    continue
+                old = registered.get(hashname)
+                status = STATUS_ACTIVE
+                if old is not None and old['status'] == STATUS_BUILDING and \
+                        os.path.exists(os.path.join(path, JOURNAL_FILE)):
+                    status = STATUS_BUILDING
+                if old is None:
+                    result['added'] += 1
+                elif old == dict(row, status=status):
+                    continue
+                else:
+                    result['updated'] += 1
+                _upsert(conn, row, status)
+    finally:
+        conn.close()
+    return result
@@ -14,13 +14,14 @@ import sys
 import random
 import string
 import omero
-from omero.rtypes import rstring, rlong
+from omero.rtypes import rstring, rlong, unwrap
+from omero.sys import ParametersI
 import time
 import omero.scripts as scripts
 from omero.gateway import BlitzGateway
 import datetime
 import re
-import subprocess
+import shutil
 from pathlib import Path
 
 import smtplib
@@ -29,6 +30,13 @@ from email.mime.text import MIMEText
 from email.utils import formatdate
 import json
 import glob
+import gzip
+import sqlite3
+import hashlib
+import heapq
+import contextlib
+import functools
+import cProfile
 
 
 # -------------------------------------------------
@@ -50,6 +58,16 @@ ADMIN_EMAIL = "myemail@yourfacilitydomain"
 
 # length of hash string used in the openlink url
 LENGTH_HASH = 12
+
+# default number of curl files (shards, balanced by size) the files of an
+# area are split into for parallel downloads, 0 or 1 for none
+CURL_SHARDS = 4
+
+# files larger than SEGMENT_THRESHOLD bytes are downloaded in byte-range
+# segments of SEGMENT_SIZE bytes that can be downloaded in parallel, 0 for
+# never
+SEGMENT_THRESHOLD = 16 * 1024**3
+SEGMENT_SIZE = 2 * 1024**3
 # --------------------------------------------------
 
 
@@ -60,6 +78,10 @@ PARAM_SLOTS = "Choose_existing_OpenLink"
 PARAM_ADD_TO_SLOT = "Add_to_existing_OpenLink"
 PARAM_SLOT_NAME = "OpenLink_Name"
 PARAM_ATTACH = "Add_attachments"
+PARAM_REBUILD_CURL = "Rebuild_download_file"
+PARAM_EXPIRY = "Expire_after_days"
+PARAM_SHARDS = "Download_shards"
+PARAM_PROFILE = "Profile_run"
 
 # email server IP adress
 SMTP_IP = "127.0.0.1"
@@ -71,13 +93,157 @@ URL = "%s://%s%s" % (TYPE_HTTP, SERVER_NAME, NGINX_LOCATION)
 OPENLINK_PATTERN = "rn_*_"
 GET_SLOTNAME_PATTERN = r"^rn_[A-Z,0-9]+_\d+_(.+)"
 CURL_FILE = "batch_download.curl"
-CONTENT_FILE = "content.json"
+# index of object directories in the area (see ContentIndex)
+CONTENT_FILE = "content.jsonl"
+CONTENT_VERSION = 2
+# flat {<absolute path>: <id>} dict of older versions, converted on load
+LEGACY_CONTENT_FILE = "content.json"
+# area metadata sidecar (total size, number of files, ...) next to CONTENT_FILE
+AREA_INFO_FILE = ".area_info.json"
+AREA_INFO_VERSION = 1
+SCRIPT_VERSION = "2.1.2"
+# progress of an unfinished run in the area (see Journal)
+JOURNAL_FILE = ".journal.jsonl"
+JOURNAL_VERSION = 1
+# size and checksum of all files of the area, appended by every revision
+# (run that adds files to the area)
+MANIFEST_FILE = "manifest.jsonl"
+MANIFEST_VERSION = 1
+# curl file with the files of one revision
+DELTA_CURL_FILE = "delta_%d.curl"
+DELTA_CURL_PATTERN = r"^delta_(\d+)\.curl$"
+# curl files with a part of the files of the area (see writeShardCurlFiles)
+SHARD_CURL_FILE = "batch_download_%d.curl"
+SHARD_CURL_PATTERN = r"^batch_download_(\d+)\.curl$"
+# registry of all areas in OPENLINK_DIR, created by the web app (see
+# omero_openlink.registry)
+REGISTRY_FILE = ".openlink_registry.sqlite"
+# status of an area in the registry: a new area is registered as building
+# when it is created (so a rerun finds the journal of an interrupted run)
+# and as active when the run is complete
+STATUS_ACTIVE = "active"
+STATUS_BUILDING = "building"
+# listing of a directory of the area for the static viewer of nginx, written
+# in every directory of the area (and gzip compressed with suffix ".gz")
+LISTING_FILE = ".listing.json"
+LISTING_VERSION = 1
+# trace of the phases of the last run in Chrome trace format (see Tracer)
+TRACE_FILE = ".trace.json"
+# profile of the last run with option PARAM_PROFILE (read with python -m
+# pstats)
+PROFILE_FILE = ".profile.pstats"
+# CRC-32 of the members of the ZIP archive of the area, written by the web app
+ARCHIVE_CRC_FILE = ".archive_crc.jsonl"
 CURL_PATTERN = 'create-dirs\noutput="%s%s%s"\ncontinue-at -\nurl="%s/%s/%s"\n'
+# byte-range segment of a file, curl can't resume a range
+SEGMENT_CURL_PATTERN = 'create-dirs\noutput="%s%s%s%s"\nrange=%d-%d\nurl="%s/%s/%s"\n'
+# suffix of the client side output of a segment, see omero_openlink.reassemble
+SEGMENT_SUFFIX = ".part%04d"
 
 CMD = "curl -s %s/%s/%s | curl -K-"
+CMD_PARALLEL = "curl -s %s/%s/%s | curl --parallel --parallel-max %d -K-"
+CMD_SHARDS = (
+    "for i in $(seq 1 %d); do (curl -s %s/%s/batch_download_$i.curl | curl -K-) &"
+    " done; wait"
+)
+# join the segments of the downloaded files (see omero_openlink.reassemble,
+# reassemble.py runs standalone with Python 3 on clients without OMERO.openlink)
+CMD_REASSEMBLE = "python -m omero_openlink.reassemble %s/%s/%s"
 
 MAX_PATHLENGTH = 200  # max pathlength in windows:256
 
+# max number of ids per query
+BATCH_SIZE = 1000
+# max number of rows per page of a paged query
+PAGE_SIZE = 10000
+
+# owner, group, fileset and all original files (with checksum) of the given
+# images
+QUERY_IMAGE_FILES = (
+    "select i.id, i.name, i.details.owner.id, i.details.group.id, fs.id, "
+    "f.path, f.name, f.size, f.hash, h.value "
+    "from Image i "
+    "left outer join i.fileset fs "
+    "left outer join fs.usedFiles u "
+    "left outer join u.originalFile f "
+    "left outer join f.hasher h "
+    "where i.id in (:ids)"
+)
+
+# all original files (with checksum) of the given filesets
+QUERY_FILESET_FILES = (
+    "select fs.id, f.path, f.name, f.size, f.hash, h.value "
+    "from Fileset fs "
+    "join fs.usedFiles u "
+    "join u.originalFile f "
+    "left outer join f.hasher h "
+    "where fs.id in (:ids)"
+)
+
+# container links of the object hierarchy: {<parent type>: (<link type>,
+# <child type>)}, images of plates are loaded by loadPlateImages
+CHILD_LINKS = {
+    "Project": ("ProjectDatasetLink", "Dataset"),
+    "Dataset": ("DatasetImageLink", "Image"),
+    "Screen": ("ScreenPlateLink", "Plate"),
+}
+PARENT_LINKS = {
+    "Dataset": ("ProjectDatasetLink", "Project"),
+    "Image": ("DatasetImageLink", "Dataset"),
+    "Plate": ("ScreenPlateLink", "Screen"),
+}
+
+# names of the given objects, format with object type
+QUERY_NAMES = "select o.id, o.name from %s o where o.id in (:ids)"
+
+# children of the given parents, format with link type
+QUERY_CHILDREN = (
+    "select pa.id, ch.id, ch.name from %s l "
+    "join l.parent pa join l.child ch "
+    "where pa.id in (:ids) order by pa.id, ch.id"
+)
+
+# parents of the given children, format with link type
+QUERY_PARENTS = (
+    "select ch.id, pa.id, pa.name from %s l "
+    "join l.parent pa join l.child ch "
+    "where ch.id in (:ids) order by ch.id, pa.id"
+)
+
+# well samples with image (owner, group) and fileset of the given plates
+QUERY_PLATE_IMAGES = (
+    "select p.id, w.row, w.column, ws.id, i.id, i.name, i.details.owner.id, "
+    "i.details.group.id, fs.id "
+    "from WellSample ws "
+    "join ws.well w "
+    "join w.plate p "
+    "join ws.image i "
+    "left outer join i.fileset fs "
+    "where p.id in (:ids) "
+    "order by p.id, w.row, w.column, ws.id"
+)
+
+# owners of the given groups
+QUERY_GROUP_OWNERS = (
+    "select m.parent.id, m.child.id from GroupExperimenterMap m "
+    "where m.owner = true and m.parent.id in (:ids)"
+)
+
+GROUP_PERMISSION_NAMES = {
+    "rw----": "PRIVATE",
+    "rwr---": "READ-ONLY",
+    "rwra--": "READ-ANNOTATE",
+    "rwrw--": "READ-WRITE",
+}
+
+# file attachments of the given objects, format with object type
+QUERY_FILE_ANNOTATIONS = (
+    "select l.parent.id, f.id, f.name, f.size, f.hash, h.value "
+    "from %sAnnotationLink l, FileAnnotation a join a.file f "
+    "left outer join f.hasher h "
+    "where l.child.id = a.id and l.parent.id in (:ids)"
+)
+
 
 NON_VALID_CHAR = r"[@ `!#$%^&+=*()<>?/\\|}{~:ÃƒÆ’Ã…Â¸,]"
 
@@ -92,6 +258,41 @@ ERRORS = False
 # dict of {'<userID>':{'images':<list_of_imageIds>,'email':<mail>}} for mail
 # notification
 NOTIFICATION_LIST = {}
+# planned symlinks of the current run (see LinkPlan)
+LINK_PLAN = None
+# object directories of the current area (see ContentIndex)
+CONTENT_INDEX = None
+# progress of the current run (see Journal)
+JOURNAL = None
+# sharing permissions of the current user (see PermissionContext)
+PERMISSIONS = None
+# size and number of files of the links created in this run
+AREA_STATS = {"size": 0, "files": 0, "segmented": 0}
+# dict of {<imageID>: {'name':, 'owner':, 'group':, 'fileset':,
+# 'files': [(<path>, <name>, <size>, <hash>, <hasher>)]}} resolved by
+# resolveImages
+RESOLVED_IMAGES = {}
+# dict of {<path relative to the area>: <escaped path>} of getEscapedPath,
+# the curl, shard, delta and manifest entries of a file share the path
+ESCAPED_PATHS = {}
+# dict of {<userID>: <experimenter object>} for owners of shared data
+OWNERS = {}
+# object hierarchy of the selected objects loaded by loadGraph:
+# dict of {(<objectType>, <objectID>): <name>}
+OBJECT_NAMES = {}
+# dict of {(<objectType>, <objectID>): [<childIDs>]}
+OBJECT_CHILDREN = {}
+# dict of {(<objectType>, <objectID>): (<parentType>, <parentID>)}, first
+# parent only
+OBJECT_PARENTS = {}
+# dict of {(<parentDir>, <objectType>, <objectID>): <dir>} of created dirs
+OBJECT_DIRS = {}
+# dict of {(<objectType>, <objectID>): [(<fileID>, <name>, <size>, <hash>,
+# <hasher>)]} of file attachments loaded by loadAttachments
+ATTACHMENTS = {}
+# dict of {'<fileID>': [<paths>]} of all files in ORIGINAL_REP, only built if
+# a file is not found at its expected location
+ORIGINAL_FILE_INDEX = None
 
 
 # -------------------------------------------------------------------
@@ -107,6 +308,159 @@ def setError():
     ERRORS = True
 
 
+class Tracer:
+    """
+    Spans of the phases of a run (path discovery, hierarchy loading,
+    permission checks, ...) with the number of Ice calls ("ice.<call>") and
+    filesystem operations ("fs.<operation>") in every span. The spans are
+    written as Chrome trace (chrome://tracing, Perfetto) TRACE_FILE into the
+    area. Counts of a span include the counts of its nested spans, the
+    summary of a phase counts only its outermost spans.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.start = time.perf_counter()
+        self.events = []
+        # dict of {<counter>: <count>} since the start
+        self.counts = {}
+        # dict of {<phase>: [<seconds>, <spans>, <ice calls>, <fs operations>]}
+        self.phases = {}
+        # phases with an open span, nested spans of the same phase are not
+        # added to phases twice
+        self.open = set()
+        # area of the run
+        self.base = None
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """Record the block as span <name> with the given args"""
+        begin = time.perf_counter()
+        before = dict(self.counts)
+        outer = name not in self.open
+        self.open.add(name)
+        try:
+            yield
+        finally:
+            if outer:
+                self.open.discard(name)
+            end = time.perf_counter()
+            for key, value in self.counts.items():
+                if value != before.get(key, 0):
+                    args[key] = value - before.get(key, 0)
+            self.events.append(
+                {
+                    "name": name,
+                    "cat": "phase",
+                    "ph": "X",
+                    "ts": round((begin - self.start) * 1e6, 1),
+                    "dur": round((end - begin) * 1e6, 1),
+                    "pid": os.getpid(),
+                    "tid": 1,
+                    "args": args,
+                }
+            )
+            if not outer:
+                return
+            phase = self.phases.setdefault(name, [0.0, 0, 0, 0])
+            phase[0] += end - begin
+            phase[1] += 1
+            phase[2] += sum(v for k, v in args.items() if k.startswith("ice."))
+            phase[3] += sum(v for k, v in args.items() if k.startswith("fs."))
+
+    def write(self, base):
+        """Write the trace as TRACE_FILE into the area base atomically"""
+        trace = {
+            "traceEvents": [
+                {
+                    "name": "process_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "args": {"name": "Create_OpenLink.py %s" % os.path.basename(base)},
+                }
+            ]
+            + self.events,
+            "displayTimeUnit": "ms",
+            "otherData": {"version": SCRIPT_VERSION, "counts": self.counts},
+        }
+        traceFile = os.path.join(base, TRACE_FILE)
+        tmpFile = "%s.tmp" % traceFile
+        f = open(tmpFile, "w")
+        try:
+            json.dump(trace, f)
+        finally:
+            f.close()
+        os.replace(tmpFile, traceFile)
+
+    def report(self):
+        """Print duration, Ice calls and filesystem operations per phase"""
+        print("# INFO: phases of this run (trace in %s):" % TRACE_FILE)
+        for name, (seconds, spans, ice, fs) in self.phases.items():
+            print(
+                "#   %-20s %8.2f s %7d spans %8d Ice calls %8d fs operations"
+                % (name, seconds, spans, ice, fs)
+            )
+
+
+# phases of the current run
+TRACER = Tracer()
+
+
+def traced(phase):
+    """Decorator that records every call of the function as span <phase>"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with TRACER.span(phase):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# calls of the BlitzGateway and its services that are round trips to the
+# OMERO server
+ICE_CALLS = (
+    "getObject",
+    "getObjects",
+    "isFullAdmin",
+    "getGroupFromContext",
+    "projection",
+    "findAllByQuery",
+    "findByQuery",
+)
+
+
+class TracedConnection:
+    """
+    BlitzGateway (or service of it) that counts its calls of ICE_CALLS in
+    TRACER, all other attributes are passed through.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        value = getattr(self._conn, name)
+        if name == "getQueryService":
+            return lambda *args, **kwargs: TracedConnection(value(*args, **kwargs))
+        if name not in ICE_CALLS:
+            return value
+
+        def call(*args, **kwargs):
+            TRACER.count("ice." + name)
+            return value(*args, **kwargs)
+
+        return call
+
+
 def get_realpath(path):
     """return target of symlink"""
     return Path(path).resolve().as_posix()
@@ -122,6 +476,7 @@ def get_omero_paths(client):
     """
     resources = client.sf.sharedResources()
     repos = resources.repositories()
+    TRACER.count("ice.repositories")
     managed_repo_dir = None
     orig_repo_dir = None
 
@@ -138,8 +493,10 @@ def get_omero_paths(client):
         managed_repo_dir = client.sf.getConfigService().getConfigValue(
             "omero.managed.dir"
         )
+        TRACER.count("ice.getConfigValue")
     if not orig_repo_dir:
         orig_repo_dir = client.sf.getConfigService().getConfigValue("omero.data.dir")
+        TRACER.count("ice.getConfigValue")
 
     # catching empty paths
     if not managed_repo_dir:
@@ -198,121 +555,928 @@ def get_file_paths(directory, file_paths):
     return file_paths
 
 
+def getSegments(size):
+    """
+    Return byte-range segments (index, first byte, last byte) of a file of
+    the given size, None if the file is downloaded in one piece.
+    """
+    if not SEGMENT_THRESHOLD or size is None or size <= SEGMENT_THRESHOLD:
+        return None
+    return [
+        (index, start, min(start + SEGMENT_SIZE, size) - 1)
+        for index, start in enumerate(range(0, size, SEGMENT_SIZE))
+    ]
+
+
+def getCurlEntry(relPath, accessAreaName, hashName, segment=None):
+    """
+    Return entry of the curl file for the given file.
+    Args:
+        relPath: path of the file relative to the openlink area
+        accessAreaName: name of the openlink area specified by user
+        hashName: name of openlink area dir
+        segment: (index, first byte, last byte) of getSegments to download
+            only this segment of the file
+    """
+    relPath = relPath.replace("\\", "/")
+    escapedPath = getEscapedPath(relPath)
+
+    # replace whitespaces
+    if segment is not None:
+        entry = SEGMENT_CURL_PATTERN % (
+            accessAreaName,
+            os.sep,
+            escapedPath,
+            SEGMENT_SUFFIX % segment[0],
+            segment[1],
+            segment[2],
+            URL,
+            hashName.replace(" ", "%20"),
+            relPath.replace(" ", "%20"),
+        )
+        return entry + "\n"
+    entry = CURL_PATTERN % (
+        accessAreaName,
+        os.sep,
+        escapedPath,
+        URL,
+        hashName.replace(" ", "%20"),
+        relPath.replace(" ", "%20"),
+    )
+    return entry + "\n"
+
+
+def getCurlEntries(relPath, accessAreaName, hashName, size=None):
+    """Return entries of the curl file for the given file, one per segment
+    if the file is larger than SEGMENT_THRESHOLD"""
+    segments = getSegments(size)
+    if segments is None:
+        return getCurlEntry(relPath, accessAreaName, hashName)
+    return "".join(
+        getCurlEntry(relPath, accessAreaName, hashName, segment)
+        for segment in segments
+    )
+
+
+def getEscapedPath(relPath):
+    """
+    Return path of the given file relative to the area on the client side:
+    special characters are replaced (reported once per file), see
+    ESCAPED_PATHS.
+    Args:
+        relPath: path of the file relative to the openlink area with "/"
+    """
+    escapedPath = ESCAPED_PATHS.get(relPath)
+    if escapedPath is None:
+        if len(relPath) > MAX_PATHLENGTH:
+            print(
+                "WARNING: pathlength is in the critical range! This "
+                "could generate download issues for %s" % relPath
+            )
+            setWarning()
+        escapedPath = replace_special_char_in_tokens(relPath).lstrip("/")
+        ESCAPED_PATHS[relPath] = escapedPath
+    return escapedPath
+
+
+def getOutputPath(relPath, accessAreaName):
+    """Return path of the given file on the client side (see getCurlEntry)"""
+    return "%s%s%s" % (
+        accessAreaName,
+        os.sep,
+        getEscapedPath(relPath.replace("\\", "/")),
+    )
+
+
+def isAreaFile(name):
+    """Return true for files in the area root that are written by the script
+    (also their tmp files while they are written)"""
+    if name.endswith(".tmp"):
+        name = name[: -len(".tmp")]
+    return name in (
+        CURL_FILE,
+        CONTENT_FILE,
+        LEGACY_CONTENT_FILE,
+        AREA_INFO_FILE,
+        JOURNAL_FILE,
+        MANIFEST_FILE,
+        LISTING_FILE,
+        LISTING_FILE + ".gz",
+        TRACE_FILE,
+        PROFILE_FILE,
+        ARCHIVE_CRC_FILE,
+    ) or bool(
+        re.match(DELTA_CURL_PATTERN, name) or re.match(SHARD_CURL_PATTERN, name)
+    )
+
+
+@traced("curl generation")
 def addToCurlFile(base, hashName):
     """
+    Rebuild the whole curl file from the files in the openlink area. The
+    curl file is replaced atomically.
     Args:
         base: absolute path to openlink area
         hashName: name of openlink area dir
     """
 
     curlFile = os.path.join(base, CURL_FILE)
-    contentFile = os.path.join(base, CONTENT_FILE)
-    fileList = get_file_paths(base, [])
+    tmpFile = "%s.tmp" % curlFile
     accessAreaName = parseAreaNames(hashName)
+    with open(tmpFile, "w") as tFile:
+        TRACER.count("fs.write")
+        for relPath, size in getAreaFileSizes(base):
+            tFile.write(getCurlEntries(relPath, accessAreaName, hashName, size))
+    os.replace(tmpFile, curlFile)
+
+
+def getLinkedFiles(plan, link):
+    """
+    Return paths of the files behind the given link (relative to the link,
+    "" for a link to a file). Only walks the filesystem if the files of the
+    link target are unknown.
+    """
+    manifest = plan.manifest.get(link)
+    if manifest is not None:
+        return [entry[0] for entry in manifest]
+    if not os.path.isdir(link):
+        return [""]
+    return [os.path.relpath(f, link) for f in get_file_paths(link, [])]
+
+
+@traced("curl generation")
+def appendToCurlFile(base, hashName, plan):
+    """
+    Append entries for the links created in this run to the curl file. The
+    curl file is replaced atomically.
+    Args:
+        base: absolute path to openlink area
+        hashName: name of openlink area dir
+        plan: LinkPlan of this run
+    """
+    curlFile = os.path.join(base, CURL_FILE)
+    tmpFile = "%s.tmp" % curlFile
+    accessAreaName = parseAreaNames(hashName)
+    if os.path.exists(curlFile):
+        shutil.copyfile(curlFile, tmpFile)
+    tFile = open(tmpFile, "a")
+    TRACER.count("fs.write")
     try:
-        tFile = open(curlFile, "w")
-        for file in fileList:
-            if os.path.basename(file) == os.path.basename(contentFile):
-                continue
-            if not os.path.basename(file) == os.path.basename(curlFile):
-                relPath = os.path.relpath(file, base)
-                relPath = relPath.replace("\\", "/")
-                if len(relPath) > MAX_PATHLENGTH:
-                    print(
-                        "WARNING: pathlength is in the critical range! This "
-                        "could generate download issues for %s" % relPath
-                    )
-                    setWarning()
-
-                # replace whitespaces
-                entry = CURL_PATTERN % (
-                    accessAreaName,
-                    os.sep,
-                    replace_special_char_in_tokens(relPath),
-                    URL,
-                    hashName.replace(" ", "%20"),
-                    relPath.replace(" ", "%20"),
-                )
-                tFile.write(entry)
-                tFile.write("\n")
+        for relPath, size in getCreatedFileSizes(base, plan):
+            tFile.write(getCurlEntries(relPath, accessAreaName, hashName, size))
         tFile.flush()
     finally:
         tFile.close()
+    os.replace(tmpFile, curlFile)
 
 
-# get location of sources in managed rep
-# TODO: filenames with special characters makes problems
-def getOriginalFile(imageObj):
-    """Get location of sources in managed rep.
-    Args:
-        imageObj: image object
+def getNextRevision(base):
+    """Return number of the next revision of the given area"""
+    revisions = [0]
+    for name in os.listdir(base):
+        match = re.match(DELTA_CURL_PATTERN, name)
+        if match:
+            revisions.append(int(match.group(1)))
+    return max(revisions) + 1
+
+
+@traced("curl generation")
+def writeDeltaCurlFile(base, hashName, plan, revision):
+    """
+    Write curl file DELTA_CURL_FILE with the files of the links created in
+    this run, so clients that downloaded the previous revisions only fetch
+    the new files.
     Returns:
-        path: path to file
-        name: name of the file
+        name of the delta curl file
     """
-    fileset = imageObj.getFileset()
+    deltaFile = os.path.join(base, DELTA_CURL_FILE % revision)
+    tmpFile = "%s.tmp" % deltaFile
+    accessAreaName = parseAreaNames(hashName)
+    tFile = open(tmpFile, "w")
+    TRACER.count("fs.write")
+    try:
+        for relPath, size in getCreatedFileSizes(base, plan):
+            tFile.write(getCurlEntries(relPath, accessAreaName, hashName, size))
+        tFile.flush()
+    finally:
+        tFile.close()
+    os.replace(tmpFile, deltaFile)
+    return os.path.basename(deltaFile)
 
-    for origFile in fileset.listFiles():
-        # print(origFile.__dict__)
-        name = origFile.getName()
-        path = origFile.getPath()
 
-    return path, name
+@traced("curl generation")
+def appendToManifest(base, hashName, plan, revision):
+    """
+    Append path, client side output path, size and checksum (as stored in
+    OMERO, nothing is read from disk) of the files of the links created in
+    this run to the manifest MANIFEST_FILE of the area. Files of links with
+    unknown content (links of older runs) are listed without size and hash.
+    Files that are downloaded in byte-range segments list their segments
+    [first byte, last byte, client side output path].
+    """
+    manifestFile = os.path.join(base, MANIFEST_FILE)
+    accessAreaName = parseAreaNames(hashName)
+    newFile = not os.path.exists(manifestFile)
+    f = open(manifestFile, "a")
+    TRACER.count("fs.write")
+    try:
+        if newFile:
+            f.write(json.dumps({"version": MANIFEST_VERSION}) + "\n")
+        for link in plan.created:
+            relLink = os.path.relpath(link, base)
+            manifest = plan.manifest.get(link)
+            if manifest is None:
+                manifest = [
+                    [file, None, None, None] for file in getLinkedFiles(plan, link)
+                ]
+            for file, size, fHash, hasher in manifest:
+                relPath = (os.path.join(relLink, file) if file else relLink).replace(
+                    "\\", "/"
+                )
+                output = getOutputPath(relPath, accessAreaName)
+                entry = {
+                    "path": relPath,
+                    "output": output,
+                    "size": size,
+                    "hash": fHash,
+                    "hasher": hasher,
+                    "revision": revision,
+                }
+                segments = getSegments(
+                    size if size is not None else getLinkedFileSize(base, relPath)
+                )
+                if segments is not None:
+                    entry["segments"] = [
+                        [start, end, output + SEGMENT_SUFFIX % index]
+                        for index, start, end in segments
+                    ]
+                f.write(json.dumps(entry) + "\n")
+        f.flush()
+    finally:
+        f.close()
 
 
-def writeDictContent(path):
-    global CONTENT_DICT
-    f = open(path, "w")
-    json.dump(CONTENT_DICT, f)
-    f.close()
+def getLinkedFileSize(base, relPath):
+    """Return size of the linked file on disk, 0 if it is not accessible"""
+    TRACER.count("fs.stat")
+    try:
+        return os.path.getsize(os.path.join(base, relPath))
+    except OSError:
+        return 0
 
 
-def loadDictContent(path):
-    global CONTENT_DICT
-    if os.path.exists(path):
-        f = open(path, "r")
-        CONTENT_DICT = json.load(f)
+def getCreatedFileSizes(base, plan):
+    """
+    Yield (path relative to base, size) of the files of the links created in
+    this run. Sizes are taken from OMERO, only files of links with unknown
+    content are stat'ed.
+    """
+    for link in plan.created:
+        relLink = os.path.relpath(link, base)
+        manifest = plan.manifest.get(link)
+        if manifest is None:
+            manifest = [
+                [file, None, None, None] for file in getLinkedFiles(plan, link)
+            ]
+        for file, size, fHash, hasher in manifest:
+            relPath = os.path.join(relLink, file) if file else relLink
+            if size is None:
+                size = getLinkedFileSize(base, relPath)
+            yield relPath, size
+
+
+def countSegmentedFiles(base, plan=None):
+    """
+    Return number of files that are downloaded in byte-range segments: of
+    the links created in this run or, without plan, of the manifest of the
+    area.
+    """
+    if plan is not None:
+        return sum(
+            1 for relPath, size in getCreatedFileSizes(base, plan) if getSegments(size)
+        )
+    count = 0
+    try:
+        f = open(os.path.join(base, MANIFEST_FILE), "r")
+    except OSError:
+        return 0
+    try:
+        for line in f:
+            try:
+                if json.loads(line).get("segments"):
+                    count += 1
+            except ValueError:
+                # incomplete line of an interrupted write
+                continue
+    finally:
         f.close()
+    return count
+
+
+def getAreaFileSizes(base):
+    """Yield (path relative to base, size) of all files in the openlink area"""
+    for file in get_file_paths(base, []):
+        if os.path.dirname(file) == base and isAreaFile(os.path.basename(file)):
+            continue
+        try:
+            size = os.path.getsize(file)
+        except OSError:
+            size = 0
+        yield os.path.relpath(file, base), size
+
+
+def assignShards(files, totals):
+    """
+    Distribute files over shards so that the shards hold about the same
+    number of bytes: the largest files are assigned first, each to the shard
+    with the smallest total.
+    Args:
+        files: list of (key, size)
+        totals: bytes per shard before this run, updated in place
+    Returns:
+        list of keys per shard (in the order of files)
+    """
+    heap = [(total, i) for i, total in enumerate(totals)]
+    heapq.heapify(heap)
+    shards = [[] for total in totals]
+    order = sorted(range(len(files)), key=lambda i: files[i][1], reverse=True)
+    for index in order:
+        total, i = heapq.heappop(heap)
+        shards[i].append(index)
+        totals[i] = total + files[index][1]
+        heapq.heappush(heap, (totals[i], i))
+    return [[files[index][0] for index in sorted(shard)] for shard in shards]
+
+
+@traced("curl generation")
+def writeShardCurlFiles(base, hashName, files, totals, rebuild=False):
+    """
+    Add the given files to the shard curl files SHARD_CURL_FILE of the area,
+    so the download can be split into len(totals) parallel downloads. All
+    shard curl files are written before they replace the old ones. The
+    byte-range segments of large files are distributed over the shards
+    separately.
+    Args:
+        base: absolute path to openlink area
+        hashName: name of openlink area dir
+        files: list of (path relative to base, size) to add
+        totals: bytes per shard before this run (zeros if rebuild), updated
+            in place
+        rebuild: replace the shard curl files instead of appending to them,
+            shard curl files beyond len(totals) are removed
+    """
+    accessAreaName = parseAreaNames(hashName)
+    units = []
+    for relPath, size in files:
+        segments = getSegments(size)
+        if segments is None:
+            units.append(((relPath, None), size))
+        else:
+            units.extend(
+                ((relPath, segment), segment[2] - segment[1] + 1)
+                for segment in segments
+            )
+    tmpFiles = []
+    for i, entries in enumerate(assignShards(units, totals)):
+        shardFile = os.path.join(base, SHARD_CURL_FILE % (i + 1))
+        tmpFile = "%s.tmp" % shardFile
+        if not rebuild and not entries:
+            continue
+        if not rebuild and os.path.exists(shardFile):
+            shutil.copyfile(shardFile, tmpFile)
+        tFile = open(tmpFile, "a" if not rebuild else "w")
+        TRACER.count("fs.write")
+        try:
+            for relPath, segment in entries:
+                tFile.write(getCurlEntry(relPath, accessAreaName, hashName, segment))
+            tFile.flush()
+        finally:
+            tFile.close()
+        tmpFiles.append((tmpFile, shardFile))
+    for tmpFile, shardFile in tmpFiles:
+        os.replace(tmpFile, shardFile)
+    if rebuild:
+        for name in os.listdir(base):
+            match = re.match(SHARD_CURL_PATTERN, name)
+            if match and int(match.group(1)) > len(totals):
+                os.remove(os.path.join(base, name))
+
+
+def getListingEntries(path, sizes, top=False):
+    """
+    Return listing entries {"name", "size"} of the files and {"name", "dir",
+    "files"} of the directories in path, sorted by name. Directories of the
+    area have their own listing, linked directories (filesets) are listed
+    with their content. Hidden files are skipped.
+    Args:
+        path: absolute path of the directory
+        sizes: {absolute path: size} of files with known size, all other
+            files are stat'ed
+        top: skip files of the area root that are written by the script
+    """
+    entries = []
+    TRACER.count("fs.scandir")
+    for entry in sorted(os.scandir(path), key=lambda e: e.name):
+        if entry.name.startswith(".") or (top and isAreaFile(entry.name)):
+            continue
+        try:
+            if entry.is_dir(follow_symlinks=True):
+                item = {"name": entry.name, "dir": True}
+                if entry.is_symlink():
+                    item["files"] = getListingEntries(entry.path, sizes)
+            else:
+                size = sizes.get(entry.path)
+                if size is None:
+                    size = entry.stat(follow_symlinks=True).st_size
+                item = {"name": entry.name, "size": size}
+        except OSError as e:
+            print("# WARNING: can't access %s: %s" % (entry.path, e))
+            item = {"name": entry.name, "size": None}
+        entries.append(item)
+    return entries
+
+
+def writeListing(base, path, sizes):
+    """
+    Write listing LISTING_FILE (and its gzip compressed copy for nginx
+    gzip_static) of a directory of the area atomically.
+    """
+    listing = {
+        "version": LISTING_VERSION,
+        "path": os.path.relpath(path, base).replace("\\", "/"),
+        "modified": time.time(),
+        "entries": getListingEntries(path, sizes, top=path == base),
+    }
+    data = json.dumps(listing, separators=(",", ":")).encode("utf-8")
+    listingFile = os.path.join(path, LISTING_FILE)
+    for name, content in (
+        (listingFile + ".gz", gzip.compress(data, mtime=0)),
+        (listingFile, data),
+    ):
+        tmpFile = "%s.tmp" % name
+        f = open(tmpFile, "wb")
+        TRACER.count("fs.write")
+        try:
+            f.write(content)
+        finally:
+            f.close()
+        os.replace(tmpFile, name)
+
+
+@traced("listing")
+def writeListings(base, plan, rebuild=False):
+    """
+    Write the listings of the directories of the area that got new links in
+    this run (and of their parents) or of all directories of the area.
+    Sizes of the new files are taken from OMERO.
+    Args:
+        base: absolute path to openlink area
+        plan: LinkPlan of this run
+        rebuild: write the listings of all directories
+    """
+    sizes = {}
+    for link, manifest in plan.manifest.items():
+        for file, size, fHash, hasher in manifest or []:
+            if size is not None:
+                sizes[os.path.join(link, file) if file else link] = size
+    if rebuild or not os.path.exists(os.path.join(base, LISTING_FILE)):
+        # linked directories are not walked (followlinks=False)
+        dirs = [dirpath for dirpath, dirnames, filenames in os.walk(base)]
     else:
-        print("INFO: create new content dict")
-        CONTENT_DICT = {}
+        dirs = set()
+        for link in plan.created:
+            path = os.path.dirname(link)
+            while path not in dirs and path.startswith(base):
+                dirs.add(path)
+                if path == base:
+                    break
+                path = os.path.dirname(path)
+    for path in dirs:
+        writeListing(base, path, sizes)
+
+
+class ContentIndex:
+    """
+    Index of the object directories of an openlink area, keyed by relative
+    path and by (object type, id).
+    The index is stored as append-only log CONTENT_FILE in the area: the
+    first line is a header with the format version, every following line
+    one entry {"path": <relative path>, "type": <object type>, "id": <id>}.
+    The file is loaded on first access, save() only appends new entries.
+    """
 
+    def __init__(self, base):
+        self.base = base
+        self.file = os.path.join(base, CONTENT_FILE)
+        # dict of {<relative path>: (<object type>, <id>)}
+        self.paths = None
+        # dict of {(<object type>, <id>): [<relative paths>]}
+        self.objects = None
+        # entries added since the last save
+        self.unsaved = []
+
+    def load(self):
+        if self.paths is not None:
+            return
+        self.paths = {}
+        self.objects = {}
+        if os.path.exists(self.file):
+            f = open(self.file, "r")
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # incomplete line of an interrupted write
+                    continue
+                if "path" in entry:
+                    self.index(entry["path"], entry.get("type"), entry["id"])
+            f.close()
+        elif os.path.exists(os.path.join(self.base, LEGACY_CONTENT_FILE)):
+            self.convertLegacy()
+        else:
+            print("INFO: create new content index")
+
+    def convertLegacy(self):
+        """Convert flat content dict of older versions (without types)"""
+        legacyFile = os.path.join(self.base, LEGACY_CONTENT_FILE)
+        print("INFO: convert %s to %s" % (LEGACY_CONTENT_FILE, CONTENT_FILE))
+        f = open(legacyFile, "r")
+        content = json.load(f)
+        f.close()
+        for path, id in content.items():
+            relPath = os.path.relpath(path, self.base)
+            self.index(relPath, None, id)
+            self.unsaved.append((relPath, None, id))
+        self.save()
+        os.remove(legacyFile)
+
+    def index(self, relPath, objType, id):
+        self.paths[relPath] = (objType, id)
+        self.objects.setdefault((objType, id), []).append(relPath)
+
+    def add(self, path, objType, id):
+        """Add absolute path of the directory of the given object"""
+        self.load()
+        relPath = os.path.relpath(path, self.base)
+        self.index(relPath, objType, id)
+        self.unsaved.append((relPath, objType, id))
+
+    def contains(self, path, objType, id):
+        """True if absolute path is the directory of the given object"""
+        self.load()
+        entry = self.paths.get(os.path.relpath(path, self.base))
+        # entries of older versions have no type
+        return entry in ((objType, id), (None, id))
+
+    def getPaths(self, objType, id):
+        """Return absolute paths of the directories of the given object"""
+        self.load()
+        relPaths = self.objects.get((objType, id), []) + self.objects.get(
+            (None, id), []
+        )
+        return [os.path.join(self.base, p) for p in relPaths]
+
+    @traced("content write")
+    def save(self):
+        """Append new entries to CONTENT_FILE"""
+        if not self.unsaved:
+            return
+        newFile = not os.path.exists(self.file)
+        f = open(self.file, "a")
+        TRACER.count("fs.write")
+        if newFile:
+            f.write(json.dumps({"version": CONTENT_VERSION}) + "\n")
+        for relPath, objType, id in self.unsaved:
+            f.write(json.dumps({"path": relPath, "type": objType, "id": id}) + "\n")
+        f.close()
+        self.unsaved = []
 
-def existsInDictContent(path, id):
-    global CONTENT_DICT
-    if not CONTENT_DICT:
-        return False
 
-    if CONTENT_DICT.get(path) is not None and CONTENT_DICT.get(path) == id:
+class Journal:
+    """
+    Progress of a run in an openlink area, stored as JSON lines log
+    JOURNAL_FILE in the area, so that an interrupted run can be resumed.
+    The first line is a header with the signature of the run parameters,
+    the following lines record created directories ("dir"), links before
+    they are created ("link"), owners to notify ("notify"), processed
+    objects ("done") and finished steps of the finalisation ("final", with
+    optional result "data" of the step).
+    The journal is removed after the run is complete.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.file = os.path.join(base, JOURNAL_FILE)
+        self.header = None
+        self.dirs = []
+        self.links = []
+        self.notify = []
+        self.done = set()
+        self.final = {}
+        self.f = None
+
+    @staticmethod
+    def readHeader(base):
+        """Return header of the journal in the given area or None"""
+        journalFile = os.path.join(base, JOURNAL_FILE)
+        if not os.path.exists(journalFile):
+            return None
+        try:
+            f = open(journalFile, "r")
+            header = json.loads(f.readline())
+            f.close()
+        except (OSError, ValueError):
+            return None
+        if header.get("version") != JOURNAL_VERSION:
+            return None
+        return header
+
+    def load(self, signature):
+        """
+        Load progress of an unfinished run. Processed objects are only
+        restored if the run had the same signature.
+        Returns:
+            True if there is an unfinished run
+        """
+        self.header = Journal.readHeader(self.base)
+        if self.header is None:
+            return False
+        sameRun = self.header.get("signature") == signature
+        f = open(self.file, "r")
+        f.readline()
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # incomplete line of an interrupted write
+                continue
+            if "dir" in record:
+                self.dirs.append(record)
+            elif "link" in record:
+                self.links.append(record)
+            elif "notify" in record:
+                self.notify.append(record["notify"])
+            elif "done" in record and sameRun:
+                self.done.update((record["done"], id) for id in record["ids"])
+            elif "final" in record and sameRun:
+                self.final[record["final"]] = record.get("data")
+        f.close()
         return True
-    return False
 
+    def start(self, signature, areaInfo, newArea, revision):
+        """Open journal for writing, write header for a new run"""
+        if self.header is None:
+            self.header = {
+                "version": JOURNAL_VERSION,
+                "signature": signature,
+                "areaInfo": areaInfo,
+                "newArea": newArea,
+                "revision": revision,
+            }
+            self.f = open(self.file, "w")
+            self.write(self.header)
+            self.checkpoint()
+        else:
+            self.f = open(self.file, "a")
+
+    def write(self, record):
+        self.f.write(json.dumps(record) + "\n")
+
+    def checkpoint(self):
+        """Write all records to disk"""
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def markDone(self, objType, ids):
+        """Record processed objects and write checkpoint"""
+        ids = list(ids)
+        self.done.update((objType, id) for id in ids)
+        self.write({"done": objType, "ids": ids})
+        self.checkpoint()
+
+    def isDone(self, objType, id):
+        return (objType, id) in self.done
+
+    def markFinal(self, step, data=None):
+        self.final[step] = data
+        self.write({"final": step, "data": data})
+        self.checkpoint()
+
+    def remove(self):
+        self.f.close()
+        os.remove(self.file)
+
+
+def getRunSignature(params):
+    """Return signature of the run parameters to identify a rerun"""
+    values = {
+        "type": params.get(PARAM_DATATYPE),
+        "ids": sorted(params.get(PARAM_ID) or []),
+        "name": params.get(PARAM_SLOT_NAME),
+        "addToSlot": bool(params.get(PARAM_ADD_TO_SLOT)),
+        "slot": params.get(PARAM_SLOTS) if params.get(PARAM_ADD_TO_SLOT) else None,
+        "attach": bool(params.get(PARAM_ATTACH)),
+    }
+    return hashlib.sha1(json.dumps(values, sort_keys=True).encode()).hexdigest()
+
+
+def restoreFromJournal(conn, journal):
+    """
+    Restore directories, links and notifications of an unfinished run
+    and create links that were planned but not created.
+    """
+    for record in journal.dirs:
+        CONTENT_INDEX.add(
+            os.path.join(journal.base, record["dir"]), record["type"], record["id"]
+        )
+    for record in journal.links:
+        LINK_PLAN.restoreLink(
+            os.path.join(journal.base, record["link"]),
+            record["target"],
+            record["size"],
+            record["files"],
+            record.get("manifest"),
+        )
+    createSymlinks(LINK_PLAN)
+    resolveImages(conn, journal.notify)
+    for image_ID in journal.notify:
+        addToNotifyList(get_owner_of_data(conn, image_ID), image_ID)
+    print(
+        "# INFO: resume unfinished run: %d objects done, %d links restored"
+        % (len(journal.done), len(journal.links))
+    )
+
+
+def scanArea(path):
+    """
+    Return total size and number of files in path and subdirs (follows
+    symlinks). Only used if the area info of an existing area is missing.
+    """
+    total = 0
+    count = 0
+    TRACER.count("fs.scandir")
+    for entry in os.scandir(path):
+        if isAreaFile(entry.name):
+            continue
+        try:
+            if entry.is_dir(follow_symlinks=True):
+                size, files = scanArea(entry.path)
+                total += size
+                count += files
+            else:
+                total += entry.stat(follow_symlinks=True).st_size
+                count += 1
+        except OSError as e:
+            print("# WARNING: can't access %s: %s" % (entry.path, e))
+
+    return total, count
+
+
+def readAreaInfo(base):
+    """
+    Read area info sidecar of the given area.
+    Returns:
+        dict of area info or None if sidecar is missing or stale
+    """
+    infoFile = os.path.join(base, AREA_INFO_FILE)
+    if not os.path.exists(infoFile):
+        return None
+    try:
+        f = open(infoFile, "r")
+        info = json.load(f)
+        f.close()
+    except (OSError, ValueError):
+        return None
+    if info.get("version") != AREA_INFO_VERSION:
+        return None
+    # content was modified after the sidecar was written
+    for name in (CONTENT_FILE, LEGACY_CONTENT_FILE):
+        contentFile = os.path.join(base, name)
+        if (
+            os.path.exists(contentFile)
+            and os.path.getmtime(contentFile) > info.get("modified", 0)
+        ):
+            return None
+    return info
 
-def getContentFromDictById(id):
-    global CONTENT_DICT
-    if not CONTENT_DICT:
-        return False
-    paths = [k for k, v in CONTENT_DICT.items() if v == id]
 
-    return paths
+@traced("content write")
+def writeAreaInfo(base, previousInfo, expires=None, shards=None):
+    """
+    Write area info sidecar (total size, number of files, number of files
+    that are downloaded in segments, last modified, generator version, bytes
+    per shard curl file) of the given area. Sizes are taken from the
+    OriginalFiles in OMERO, the area itself is only scanned if the area info
+    of an existing area is missing.
+    Args:
+        base: absolute path to openlink area
+        previousInfo: area info before this run, None if not available
+        expires: expiry date (timestamp) of the area, None to keep the
+            expiry date of previousInfo (default expiry of the web app if
+            not available)
+        shards: bytes per shard curl file, None to keep the shards of
+            previousInfo
+    """
+    if previousInfo is None:
+        print("# INFO: scan area to rebuild area info")
+        size, files = scanArea(base)
+    else:
+        size = previousInfo.get("size", 0) + AREA_STATS["size"]
+        files = previousInfo.get("files", 0) + AREA_STATS["files"]
+    if previousInfo is None or "segmented" not in previousInfo:
+        # area info of an older version, the manifest includes this run
+        segmented = countSegmentedFiles(base)
+    else:
+        segmented = previousInfo["segmented"] + AREA_STATS["segmented"]
+
+    info = {
+        "version": AREA_INFO_VERSION,
+        "generator": "Create_OpenLink.py %s" % SCRIPT_VERSION,
+        "size": size,
+        "files": files,
+        "segmented": segmented,
+        "modified": time.time(),
+    }
+    if expires is None and previousInfo is not None:
+        expires = previousInfo.get("expires")
+    if expires is not None:
+        info["expires"] = expires
+    if shards is None and previousInfo is not None:
+        shards = previousInfo.get("shards")
+    if shards is not None:
+        info["shards"] = shards
+    infoFile = os.path.join(base, AREA_INFO_FILE)
+    tmpFile = "%s.tmp" % infoFile
+    f = open(tmpFile, "w")
+    TRACER.count("fs.write")
+    json.dump(info, f)
+    f.close()
+    os.replace(tmpFile, infoFile)
+    return info
 
 
-def addToDictContent(path, id):
-    global CONTENT_DICT
-    CONTENT_DICT.update({path: id})
+@traced("content write")
+def registerArea(base, info, status=STATUS_ACTIVE):
+    """
+    Add or update the given area in the registry of OPENLINK_DIR. If the
+    registry does not exist yet, the web app creates it from all areas.
+    Args:
+        base: absolute path to openlink area
+        info: area info written by writeAreaInfo
+        status: STATUS_BUILDING for a new area of an unfinished run
+    """
+    registryFile = os.path.join(OPENLINK_DIR, REGISTRY_FILE)
+    if not os.path.exists(registryFile):
+        return
+    hashName = os.path.basename(base)
+    match = re.search(GET_SLOTNAME_PATTERN, hashName)
+    row = {
+        "hashname": hashName,
+        "user_id": int(hashName.split("_")[2]),
+        "name": match.group(1),
+        "created": os.path.getctime(base),
+        "modified": info["modified"],
+        "size": info["size"],
+        "files": info["files"],
+        "expires": info.get("expires"),
+        "shards": len(info.get("shards") or []),
+        "segmented": info.get("segmented", 0),
+        "status": status,
+    }
+    try:
+        registry = sqlite3.connect(registryFile, timeout=30)
+        try:
+            # registry of an older version of the web app
+            columns = [
+                c[1]
+                for c in registry.execute("PRAGMA table_info(areas)")
+                if c[1] in row
+            ]
+            with registry:
+                registry.execute(
+                    "INSERT OR REPLACE INTO areas (%s) VALUES (%s)"
+                    % (", ".join(columns), ", ".join("?" * len(columns))),
+                    [row[c] for c in columns],
+                )
+        finally:
+            registry.close()
+    except (OSError, sqlite3.Error) as e:
+        print("# WARNING: can't update OpenLink registry: %s" % e)
+        setWarning()
 
 
-def createObjectDir(ppath, object, name):
+def createObjectDir(ppath, objType, id, name):
     """
     Create new directory of <name> in <ppath> and add this path and the
-    object id to global dict CONTENT_DICT .
+    object to the content index CONTENT_INDEX.
     Normally <name> is the name of the given object.
     If the directory still exists, but was created from a different object,
     append object id to the name of the dir.
 
     Args:
         ppath: path to directory where the new directory should be created
-        object: omero object
+        objType: type of omero object
+        id: id of omero object
         name: name of the new directory
     RETURN:
         absolute path of created dir
@@ -328,118 +1492,365 @@ def createObjectDir(ppath, object, name):
     path = os.path.join(ppath, name)
     if not os.path.exists(path):
         try:
-            os.mkdir(path)
-            addToDictContent(path, object.getId())
+            with TRACER.span("mkdir/symlink"):
+                os.mkdir(path)
+                TRACER.count("fs.mkdir")
+            CONTENT_INDEX.add(path, objType, id)
+            JOURNAL.write(
+                {"dir": os.path.relpath(path, JOURNAL.base), "type": objType, "id": id}
+            )
             return path
         except:
             print(
                 "ERROR: Cannot create directory for ID:%s: %s in %s (possible problems:length of name, or name contains special char)"
-                % (object.getId(), name, ppath)
+                % (id, name, ppath)
             )
             setError()
             return None
     else:
         # check if existing object is the same
-        if not existsInDictContent(path, object.getId()):
+        if not CONTENT_INDEX.contains(path, objType, id):
             # check if there is another name for this object
-            existing_paths = getContentFromDictById(object.getId())
+            existing_paths = CONTENT_INDEX.getPaths(objType, id)
             if len(existing_paths) == 0:
                 # create alternativ name (append id)
-                alter_dir_name = "%s_%s" % (object.getName(), object.getId())
-                return createObjectDir(ppath, object, alter_dir_name)
+                alter_dir_name = "%s_%s" % (OBJECT_NAMES.get((objType, id)), id)
+                return createObjectDir(ppath, objType, id, alter_dir_name)
             else:
                 return existing_paths[0]
     return path
 
 
-def getPath(image, slot):
+def getObjectDir(ppath, objType, id):
     """
-    Generate directory structure like in omero (project/dataset/) for given
-    <image> in directory <slot> if it not exist.
-    RETURN: absolute path to dataset
+    Return directory of the given object in <ppath>, create it if it not
+    exists. Directories are memoised for the run.
     """
-    datasetObj = image.getParent()
-    projectObj = datasetObj.getParent()
-
-    linkDir = slot
+    key = (ppath, objType, id)
+    if key not in OBJECT_DIRS:
+        OBJECT_DIRS[key] = createObjectDir(
+            ppath, objType, id, OBJECT_NAMES.get((objType, id))
+        )
+    return OBJECT_DIRS[key]
 
-    if projectObj is not None:
-        linkDir = createObjectDir(linkDir, projectObj, projectObj.getName())
 
-    if linkDir is not None:
-        linkDir = createObjectDir(linkDir, datasetObj, datasetObj.getName())
+def getParentDir(slot, objType, id):
+    """
+    Generate directory structure like in omero (project/dataset/) for the
+    parents of the given object in directory <slot> if it not exist.
+    RETURN: absolute path to parent dir, <slot> if object has no parent
+    """
+    parent = OBJECT_PARENTS.get((objType, id))
+    if parent is None:
+        return slot
+    parentDir = getParentDir(slot, parent[0], parent[1])
+    if parentDir is None:
+        return None
+    return getObjectDir(parentDir, parent[0], parent[1])
 
-    if linkDir is None:
-        print("ERROR: can't create Project directory for ", image.getName())
-        setError()
 
-    return linkDir
+def batches(ids, size=BATCH_SIZE):
+    """Split list of ids in lists of max. <size> ids"""
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i : i + size]
 
 
-def userIsOwner(conn, userName, id):
+@traced("hierarchy loading")
+def loadGraph(conn, objType, ids):
     """
-    Check if owner of the image == calling user.
+    Load names and parent/child relations of the given objects, of all
+    their subordinate containers and of their parents with one projection
+    query per hierarchy level (and BATCH_SIZE objects) into OBJECT_NAMES,
+    OBJECT_CHILDREN and OBJECT_PARENTS.
     Args:
-        conn: BlitzGateway object
-        userName: name of the user
-        id: image Id
+        conn: BlitzGateway connection
+        objType: type of objects (Project, Dataset, Image, Screen, Plate)
+        ids: list of object ids
     Returns:
-        True if user is onwer, else false
+        list of ids of the given objects that are available
     """
-    image = conn.getObject("Image", id)
-    if image.getOwnerOmeName() == userName:
-        return True
-    return False
+    queryService = conn.getQueryService()
+
+    def query(q, ids):
+        for batch in batches(ids):
+            params = ParametersI()
+            params.addIds(batch)
+            for row in queryService.projection(q, params, conn.SERVICE_OPTS):
+                yield unwrap(row)
+
+    for id, name in query(QUERY_NAMES % objType, ids):
+        OBJECT_NAMES[(objType, id)] = name
+    available = [id for id in ids if (objType, id) in OBJECT_NAMES]
+
+    # subordinate containers
+    level, levelIds = objType, available
+    while level in CHILD_LINKS and levelIds:
+        linkType, childType = CHILD_LINKS[level]
+        for id in levelIds:
+            OBJECT_CHILDREN[(level, id)] = []
+        childIds = []
+        for parentId, childId, childName in query(QUERY_CHILDREN % linkType, levelIds):
+            OBJECT_CHILDREN[(level, parentId)].append(childId)
+            OBJECT_NAMES[(childType, childId)] = childName
+            childIds.append(childId)
+        level, levelIds = childType, childIds
+
+    # parents
+    level, levelIds = objType, available
+    while level in PARENT_LINKS and levelIds:
+        linkType, parentType = PARENT_LINKS[level]
+        parentIds = []
+        for childId, parentId, parentName in query(QUERY_PARENTS % linkType, levelIds):
+            if (level, childId) in OBJECT_PARENTS:
+                continue
+            OBJECT_PARENTS[(level, childId)] = (parentType, parentId)
+            OBJECT_NAMES[(parentType, parentId)] = parentName
+            parentIds.append(parentId)
+        level, levelIds = parentType, parentIds
 
+    return available
 
-def userIsFullAdmin(conn):
-    # Check if you are an full administrator
 
-    if not conn.isFullAdmin():
-        return False
-    else:
-        return True
+def resolveImages(conn, ids):
+    """
+    Load owner, group, fileset and original files of the given images with
+    one projection query per BATCH_SIZE images and add them to
+    RESOLVED_IMAGES. Images that are already resolved are skipped.
+    Args:
+        conn: BlitzGateway connection
+        ids: list of image ids
+    """
+    missing = [id for id in set(ids) if id not in RESOLVED_IMAGES]
+    if not missing:
+        return
+    with TRACER.span("fileset resolution"):
+        queryService = conn.getQueryService()
+        for batch in batches(missing):
+            params = ParametersI()
+            params.addIds(batch)
+            rows = queryService.projection(
+                QUERY_IMAGE_FILES, params, conn.SERVICE_OPTS
+            )
+            for row in rows:
+                (
+                    iId,
+                    iName,
+                    ownerId,
+                    groupId,
+                    fsId,
+                    fPath,
+                    fName,
+                    fSize,
+                    fHash,
+                    hasher,
+                ) = unwrap(row)
+                image = RESOLVED_IMAGES.get(iId)
+                if image is None:
+                    image = {
+                        "name": iName,
+                        "owner": ownerId,
+                        "group": groupId,
+                        "fileset": fsId,
+                        "files": [],
+                    }
+                    RESOLVED_IMAGES[iId] = image
+                if fName is not None:
+                    image["files"].append((fPath, fName, fSize or 0, fHash, hasher))
 
 
-def groupAllowedToShareData(conn, userID):
+@traced("fileset resolution")
+def loadPlateImages(conn, plateIds):
     """
-    Return true if the current group is read-annotate or (if the user is owner
-    of the group and the group is not private)
+    Load well samples of the given plates with one paged query (per
+    BATCH_SIZE plates) and the files of their filesets with one query per
+    BATCH_SIZE filesets into RESOLVED_IMAGES, so the images of the plates
+    are not resolved again by resolveImages. The images of a plate usually
+    share one fileset, its files are loaded only once.
     Args:
         conn: BlitzGateway connection
-        userID: user ID
-
-    """
-    group = conn.getGroupFromContext()
-    print("# INFO:  Current group: %s" % group.getName())
-    # if current group is a private group -> return false
-    group_perms = group.getDetails().getPermissions()
-    perm_string = str(group_perms)
-    permission_names = {
-        "rw----": "PRIVATE",
-        "rwr---": "READ-ONLY",
-        "rwra--": "READ-ANNOTATE",
-        "rwrw--": "READ-WRITE",
-    }
-    print(
-        "# INFO: Group Permission: %s (%s)"
-        % (permission_names[perm_string], perm_string)
-    )
-
-    # private group?
-    if permission_names[perm_string] == permission_names["rw----"]:
-        return False
-    # read-write group?
-    if permission_names[perm_string] == permission_names["rwrw--"]:
-        return True
+        plateIds: list of plate ids
+    Returns:
+        dict of {<plateID>: [<imageIDs>]} ordered by row, column and well sample
+    """
+    plateImages = dict((id, []) for id in plateIds)
+    # dict of {<filesetID>: [(<path>, <name>, <size>, <hash>, <hasher>)]}
+    filesets = {}
+    queryService = conn.getQueryService()
+    for batch in batches(plateIds):
+        offset = 0
+        while True:
+            params = ParametersI()
+            params.addIds(batch)
+            params.page(offset, PAGE_SIZE)
+            rows = queryService.projection(
+                QUERY_PLATE_IMAGES, params, conn.SERVICE_OPTS
+            )
+            for row in rows:
+                plateId, wRow, wColumn, wsId, iId, iName, ownerId, groupId, fsId = (
+                    unwrap(row)
+                )
+                plateImages[plateId].append(iId)
+                if iId in RESOLVED_IMAGES:
+                    continue
+                if fsId is not None:
+                    files = filesets.setdefault(fsId, [])
+                else:
+                    files = []
+                RESOLVED_IMAGES[iId] = {
+                    "name": iName,
+                    "owner": ownerId,
+                    "group": groupId,
+                    "fileset": fsId,
+                    "files": files,
+                }
+            if len(rows) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+
+    for batch in batches(list(filesets)):
+        params = ParametersI()
+        params.addIds(batch)
+        rows = queryService.projection(QUERY_FILESET_FILES, params, conn.SERVICE_OPTS)
+        for row in rows:
+            fsId, fPath, fName, fSize, fHash, hasher = unwrap(row)
+            filesets[fsId].append((fPath, fName, fSize or 0, fHash, hasher))
+    return plateImages
+
+
+class PermissionContext:
+    """
+    Sharing permissions of the current user, evaluated once per run.
+    Images can be shared if the user is full admin, owner of the image or
+    if the group of the image allows to share data of other members (the
+    group is read-write or the user is owner of the not private group).
+    Permissions and owners of groups are loaded once for all groups of a
+    batch of images.
+    """
 
-    # user is owner of this group?
-    owners, members = group.groupSummary()
-    for own in owners:
-        if userID == own.getId():
+    def __init__(self, conn):
+        self.conn = conn
+        self.userId = conn.getUser().getId()
+        self.isAdmin = conn.isFullAdmin()
+        # dict of {<groupID>: <permission string>}
+        self.permissions = {}
+        # dict of {<groupID>: set of <userIDs>}
+        self.owners = {}
+        # list of {'id':, 'owner':, 'group':, 'reason':} of rejected images
+        self.rejected = []
+
+        group = conn.getGroupFromContext()
+        perm_string = str(group.getDetails().getPermissions())
+        print("# INFO:  Current group: %s" % group.getName())
+        print(
+            "# INFO: Group Permission: %s (%s)"
+            % (GROUP_PERMISSION_NAMES.get(perm_string, "UNKNOWN"), perm_string)
+        )
+        self.permissions[group.getId()] = perm_string
+        self.loadGroups([])
+
+    def loadGroups(self, groupIds):
+        """Load permissions and owners of the given groups if not known"""
+        groupIds = [
+            id for id in set(groupIds) if id is not None and id not in self.owners
+        ]
+        unknown = [id for id in groupIds if id not in self.permissions]
+        if unknown:
+            for group in self.conn.getObjects("ExperimenterGroup", unknown):
+                self.permissions[group.getId()] = str(
+                    group.getDetails().getPermissions()
+                )
+        # owners of the groups, including the group of the context
+        groupIds += [id for id in self.permissions if id not in self.owners]
+        if not groupIds:
+            return
+        for id in groupIds:
+            self.owners[id] = set()
+        queryService = self.conn.getQueryService()
+        for batch in batches(groupIds):
+            params = ParametersI()
+            params.addIds(batch)
+            for row in queryService.projection(
+                QUERY_GROUP_OWNERS, params, self.conn.SERVICE_OPTS
+            ):
+                groupId, ownerId = unwrap(row)
+                self.owners[groupId].add(ownerId)
+
+    def groupAllowsSharing(self, groupId):
+        """
+        Return true if the group is read-write or (if the user is owner
+        of the group and the group is not private)
+        """
+        perm_string = self.permissions.get(groupId)
+        # private group or unknown group?
+        if perm_string is None or perm_string == "rw----":
+            return False
+        # read-write group?
+        if perm_string == "rwrw--":
             return True
-
-    return False
+        # user is owner of this group?
+        return self.userId in self.owners.get(groupId, ())
+
+    def userIsOwner(self, imageId):
+        """Return true if the user is owner of the (resolved) image"""
+        image = RESOLVED_IMAGES.get(imageId)
+        return image is not None and image["owner"] == self.userId
+
+    @traced("permission checks")
+    def evaluate(self, imageIds):
+        """
+        Decide which of the given (resolved) images can be shared.
+        Args:
+            imageIds: list of image ids, resolved by resolveImages
+        Returns:
+            list of ids of shareable images, list of
+            {'id':, 'owner':, 'group':, 'reason':} of rejected images
+        """
+        self.loadGroups(
+            [RESOLVED_IMAGES[id]["group"] for id in imageIds if id in RESOLVED_IMAGES]
+        )
+        allowed = []
+        rejected = []
+        for id in imageIds:
+            image = RESOLVED_IMAGES.get(id)
+            if image is None:
+                rejected.append(
+                    {"id": id, "owner": None, "group": None, "reason": "not found"}
+                )
+            elif (
+                self.isAdmin
+                or image["owner"] == self.userId
+                or self.groupAllowsSharing(image["group"])
+            ):
+                allowed.append(id)
+            else:
+                perm_string = self.permissions.get(image["group"])
+                rejected.append(
+                    {
+                        "id": id,
+                        "owner": image["owner"],
+                        "group": image["group"],
+                        "reason": "not owner, group permission: %s"
+                        % GROUP_PERMISSION_NAMES.get(perm_string, "UNKNOWN"),
+                    }
+                )
+        self.rejected.extend(rejected)
+        return allowed, rejected
+
+    def report(self):
+        """Print one summary warning for all rejected images of the run"""
+        if not self.rejected:
+            return
+        reasons = {}
+        for entry in self.rejected:
+            reasons.setdefault(entry["reason"], []).append(str(entry["id"]))
+        print(
+            "# WARNING: You are not allowed to share %d image(s):"
+            % len(self.rejected)
+        )
+        for reason, ids in reasons.items():
+            print("#   %s: %s" % (reason, ", ".join(ids)))
+        setWarning()
 
 
 def replace_special_char(name):
@@ -464,7 +1875,8 @@ def replace_special_char_in_tokens(name):
 
         # merge tokens
         replaced_name = replaced_name + "/" + token
-    print("WARNING: replaced_tokens:\n [%s] -> [%s]" % (name, replaced_name))
+    if replaced_name != "/" + name:
+        print("WARNING: replaced_tokens:\n [%s] -> [%s]" % (name, replaced_name))
 
     return replaced_name
 
@@ -476,125 +1888,277 @@ def getFilesetPath(conn, id):
     Args:
         conn: BlitzGateway connection
         id: image id
-
+    Returns:
+        filesetPath: common path of all files of the fileset
+        fName: name of the file if the fileset contains only one file
+        size: size of all files of the fileset in bytes
+        file_count: number of files in the fileset
     """
-    image = conn.getObject("Image", id)
-    # this will include pre-FS data IF images were archived on import
-    # specifically count Fileset files
-    file_count = image.countFilesetFiles()
+    resolveImages(conn, [id])
+    image = RESOLVED_IMAGES.get(id)
+    files = image["files"] if image is not None else []
+    file_count = len(files)
     # list files
     filePaths = []
     fName = ""
+    size = 0
     if file_count > 0:
         if file_count > 1:
-            for orig_file in image.getImportedImageFiles():
-                path = orig_file.getPath()
+            for path, name, fSize, fHash, hasher in files:
                 filePaths.append(path)
+                size += fSize
         else:
-            path, fName = getOriginalFile(image)
+            path, fName, size, fHash, hasher = files[0]
             filePaths.append(path)
 
     filesetPath = os.path.commonprefix(filePaths)
 
-    return filesetPath, fName
+    return filesetPath, fName, size, file_count
 
 
-def checkLinks(target, dir, name, linkNames, linkTargets, id):
+class LinkPlan:
     """
-     Decide if symlink and target will be added to the lists of names and
-     targets, or change symlink name if necessary
-     Args:
-         target: path that should be linked
-         dir: dir where the link should be created
-         name: name of link
-         linkNames: list of symlinks
-         linkTargets: list of link targets
-         id: id of object that should be linked
-    Return:
-        linkNames: list of symlinks
-        linkTarget: list of link targets
+    Symlinks planned for an openlink area: link path -> target path.
+    Lookups by link path and by target (per directory) are O(1), links are
+    kept in the order they were added.
     """
-    name, message = replace_special_char(name)
-    symlink = os.path.join(dir, name)
-    if target not in linkTargets:
-        if symlink not in linkNames:
-            # ("accept : %s"%name)
-            linkNames.append(symlink)
-            linkTargets.append(target)
-            if message:
-                print(message)
-        else:  # link of same name still exists -> rename
-            fName, extension = os.path.splitext(name)
-            name = "%s_%s%s" % (fName, id, extension)
-            print("# INFO: rename : %s [new: %s]" % (fName, name))
-            linkNames, linkTarget = checkLinks(
-                target, dir, name, linkNames, linkTargets, id
-            )
-    else:  # link to target still exists
-        if symlink not in linkNames:  # ignore
-            # print("# INFO: ignore %s (src exists, dest not)"%name)
-            pass
-        else:  # ignore
-            # print("# INFO: ignore %s (src exists, dest exists)"%name)
-            pass
 
-    return linkNames, linkTargets
+    def __init__(self):
+        # dict of {<link>: <target>}
+        self.links = {}
+        # dict of {(<dir>, <target>): <link>}
+        self.targets = {}
+        # dict of {<link>: (<size in bytes>, <number of files>)}
+        self.sizes = {}
+        # dict of {<link>: [[<path of file relative to link>, <size>, <hash>,
+        # <hasher>]]} of the files behind the link, path is "" for a link to
+        # a file
+        self.manifest = {}
+        # links that are not yet created on the filesystem
+        self.pending = []
+        # links that were created on the filesystem
+        self.created = []
+
+    def __len__(self):
+        return len(self.links)
+
+    def __contains__(self, link):
+        return link in self.links
+
+    def restoreLink(self, link, target, size, files, manifest=None):
+        """
+        Add link of an interrupted run (see Journal), links that exist on
+        the filesystem are marked as created.
+        """
+        if link in self.links:
+            return
+        self.links[link] = target
+        self.targets[(os.path.dirname(link), target)] = link
+        self.sizes[link] = (size, files)
+        if manifest is not None:
+            self.manifest[link] = manifest
+        if os.path.lexists(link):
+            self.created.append(link)
+            AREA_STATS["size"] += size
+            AREA_STATS["files"] += files
+        else:
+            self.pending.append(link)
+
+    def getLink(self, dir, target):
+        """Return link to target in dir or None if not planned"""
+        return self.targets.get((dir, target))
+
+    def getTarget(self, link):
+        """Return target of link or None if not planned"""
+        return self.links.get(link)
+
+    def uniqueName(self, dir, name, id):
+        """
+        Return name for a new link in dir. If a link of the same name is
+        still planned, the id (and a counter if necessary) is appended.
+        """
+        if os.path.join(dir, name) not in self.links:
+            return name
+        fName, extension = os.path.splitext(name)
+        newName = "%s_%s%s" % (fName, id, extension)
+        counter = 1
+        while os.path.join(dir, newName) in self.links:
+            counter += 1
+            newName = "%s_%s_%d%s" % (fName, id, counter, extension)
+        print("# INFO: rename : %s [new: %s]" % (fName, newName))
+        return newName
+
+    def addLink(self, target, dir, name, id, size=0, files=1, manifest=None):
+        """
+        Add link to target in dir. Targets that are still linked in dir are
+        ignored, links of the same name get a new name.
+        Args:
+            target: path that should be linked
+            dir: dir where the link should be created
+            name: name of link
+            id: id of object that should be linked
+            size: size of target in bytes
+            files: number of files of target
+            manifest: [<path relative to target>, <size>, <hash>, <hasher>]
+                of the files of target
+        Returns:
+            path of the link or None if target is still linked in dir
+        """
+        if (dir, target) in self.targets:
+            return None
+        name, message = replace_special_char(name)
+        if message:
+            print(message)
+        symlink = os.path.join(dir, self.uniqueName(dir, name, id))
+        self.links[symlink] = target
+        self.targets[(dir, target)] = symlink
+        self.sizes[symlink] = (size, files)
+        if manifest is not None:
+            self.manifest[symlink] = manifest
+        self.pending.append(symlink)
+        return symlink
+
+
+@traced("mkdir/symlink")
+def createSymlinks(plan):
+    """
+    Create pending symlinks of the given plan on the system if not exists.
+    Args:
+        plan: LinkPlan
+    """
+    pending = plan.pending
+    plan.pending = []
+    for dest in pending:
+        src = plan.links[dest]
+        size, files = plan.sizes[dest]
+        # print("# create link: %s ->\n\t%s"%(dest,src))
+        JOURNAL.write(
+            {
+                "link": os.path.relpath(dest, JOURNAL.base),
+                "target": src,
+                "size": size,
+                "files": files,
+                "manifest": plan.manifest.get(dest),
+            }
+        )
+        try:
+            # if src path is a symlink (for inplace imported data)
+            if os.path.islink(src):
+                # use string representing the path to which the symbolic link points
+                src = os.readlink(src)
+
+            os.symlink(src, dest)
+            TRACER.count("fs.symlink")
+            plan.created.append(dest)
+            AREA_STATS["size"] += size
+            AREA_STATS["files"] += files
+        except FileExistsError:
+            print("# INFO: skip:: Link still exists: ", src)
+
+
+@traced("fileset resolution")
+def loadAttachments(conn, objType, ids):
+    """
+    Load file attachments of the given objects with one projection query per
+    BATCH_SIZE objects and add them to ATTACHMENTS. Objects that are already
+    loaded are skipped.
+    Args:
+        conn: BlitzGateway connection
+        objType: type of objects (Project, Dataset, Image, Screen, Plate)
+        ids: list of object ids
+    """
+    missing = [id for id in set(ids) if (objType, id) not in ATTACHMENTS]
+    if not missing:
+        return
+    queryService = conn.getQueryService()
+    query = QUERY_FILE_ANNOTATIONS % objType
+    for batch in batches(missing):
+        for id in batch:
+            ATTACHMENTS[(objType, id)] = []
+        params = ParametersI()
+        params.addIds(batch)
+        rows = queryService.projection(query, params, conn.SERVICE_OPTS)
+        for row in rows:
+            parentId, fileId, name, size, fHash, hasher = unwrap(row)
+            ATTACHMENTS[(objType, parentId)].append(
+                (fileId, name, size or 0, fHash, hasher)
+            )
 
 
-def createSymlinks(linkNames, linkTarget):
+def getOriginalFilePath(fileId):
     """
-    Create symlink on the system if not exists.
+    Return expected location of an original file in ORIGINAL_REP.
+    OMERO stores the file of id 1234567 as Dir-001/Dir-234/1234567.
     Args:
-        linkNames: name of symlink
-        linkTarget: target where the link points to
+        fileId: id of original file
     """
-    if linkNames is not None and len(linkNames) > 0:
-        for src, dest in zip(linkTarget, linkNames):
-            # print("# create link: %s ->\n\t%s"%(dest,src))
-            try:
-                # if src path is a symlink (for inplace imported data)
-                if os.path.islink(src):
-                    # use string representing the path to which the symbolic link points
-                    src = os.readlink(src)
+    suffix = ""
+    remaining = fileId
+    while remaining > 999:
+        remaining //= 1000
+        if remaining > 0:
+            suffix = os.path.join("Dir-%03d" % (remaining % 1000), suffix)
+    return os.path.join(ORIGINAL_REP, suffix, str(fileId))
+
+
+def buildOriginalFileIndex():
+    """Index all files of ORIGINAL_REP by name (only once per run)."""
+    global ORIGINAL_FILE_INDEX
+    print("# INFO: index files in %s" % ORIGINAL_REP)
+    ORIGINAL_FILE_INDEX = {}
+    for dirpath, dirnames, filenames in os.walk(ORIGINAL_REP):
+        for name in filenames:
+            ORIGINAL_FILE_INDEX.setdefault(name, []).append(
+                os.path.join(dirpath, name)
+            )
 
-                os.symlink(src, dest)
-            except FileExistsError:
-                print("# INFO: skip:: Link still exists: ", src)
 
+def findOriginalFile(fileId):
+    """
+    Return path of the original file in ORIGINAL_REP or None if not found.
+    """
+    path = getOriginalFilePath(fileId)
+    if os.path.exists(path):
+        return path
 
-def addAttachment(obj, tdir):
+    # fallback: search for file in index
+    if ORIGINAL_FILE_INDEX is None:
+        buildOriginalFileIndex()
+    paths = ORIGINAL_FILE_INDEX.get(str(fileId), [])
+    if len(paths) == 0:
+        return None
+    if len(paths) > 1:
+        print(
+            "# WARNING: file annotation target is not unique: %s --> use first match"
+            % ("\n".join(paths))
+        )
+        setWarning()
+    return paths[0]
+
+
+def addAttachment(conn, objType, objId, tdir):
     """
     Args:
-        obj: object with attachments
+        conn: BlitzGateway connection
+        objType: type of object with attachments
+        objId: id of object with attachments
         tdir: path where links to the attachments should be created
     Returns:
     """
-    global ORIGINAL_REP
     if tdir is not None:
-        for ann in obj.listAnnotations():
-            if isinstance(ann, omero.gateway.FileAnnotationWrapper):
-                print(
-                    "# INFO: Annotation File ID:",
-                    ann.getFile().getId(),
-                    ann.getFile().getName(),
-                )
-                # TODO: link - if file still exists - skip
-                carg = "find %s -name %s" % (ORIGINAL_REP, ann.getFile().getId())
-                paths = [
-                    line[0:]
-                    for line in subprocess.check_output(carg, shell=True).splitlines()
-                ]
-                if len(paths) > 1:
-                    print(
-                        "# WARNING: file annotation target is not unique: %s --> use first match"
-                        % ("\n".join(paths))
-                    )
-                    setWarning()
-                linkNames = []
-                linkNames.append(os.path.join(tdir, ann.getFile().getName()))
-                linkTarget = []
-                linkTarget.append(str(paths[0].decode("utf-8")))
-                createSymlinks(linkNames, linkTarget)
+        loadAttachments(conn, objType, [objId])
+        for fileId, name, size, fHash, hasher in ATTACHMENTS[(objType, objId)]:
+            print("# INFO: Annotation File ID:", fileId, name)
+            # TODO: link - if file still exists - skip
+            path = findOriginalFile(fileId)
+            if path is None:
+                print("# WARNING: file of annotation not found: %s" % fileId)
+                setWarning()
+                continue
+            LINK_PLAN.addLink(
+                path, tdir, name, fileId, size, manifest=[["", size, fHash, hasher]]
+            )
+        createSymlinks(LINK_PLAN)
 
 
 def addToNotifyList(user, image_ID):
@@ -638,223 +2202,273 @@ def addToNotifyList(user, image_ID):
                 )
 
 
-def get_owner_of_data(image):
-    return image.getDetails().getOwner()
+def get_owner_of_data(conn, image_ID):
+    """Return owner (experimenter object) of the given image"""
+    ownerId = RESOLVED_IMAGES[image_ID]["owner"]
+    if ownerId not in OWNERS:
+        OWNERS[ownerId] = conn.getObject("Experimenter", ownerId)
+    return OWNERS[ownerId]
 
 
-def addImages(conn, slot, images, user, addAttachments, allowedToShare, targetDir=None):
+def addImages(conn, slot, imageIds, user, addAttachments, targetDir):
     """
-    Check if parent dir (dataset) exists (and create one if not) and afterwards calls createObjectDir for given image objects
+    Add links to the filesets of the given images to targetDir
     Args:
         conn: BlitzGateway connection
         slot: path to access area
-        images: List of OMERO dataset objects
+        imageIds: List of OMERO image ids
         user: user object
         addAttachments (bool):
-        allowedToShare (bool):
-        targetDir: parent dataset dir if exists
+        targetDir: parent dataset dir
     """
-    linkNames = []
-    linkTarget = []
-    userName = user.getName()
     global MANAGED_REP
 
-    # proof images
-    for image in images:
-        user_is_owner = userIsOwner(conn, userName, image.id)
-        user_is_fulladmin = userIsFullAdmin(conn)
-        # share data
-        share = allowedToShare or user_is_owner
-        if user_is_fulladmin:
-            share = True
-        if share:
-            if not targetDir:
-                targetDir = getPath(image, slot)
-                # failed path
-                if not targetDir:
-                    continue
+    # skip images of an interrupted run
+    imageIds = [id for id in imageIds if not JOURNAL.isDone("Image", id)]
+    # load owner and filesets of all images at once
+    resolveImages(conn, imageIds)
+    if addAttachments:
+        loadAttachments(conn, "Image", imageIds)
+
+    # proof images, rejected images are reported at the end of the run
+    allowedIds = PERMISSIONS.evaluate(imageIds)[0]
+    for imageId in allowedIds:
+        src_filesetPath, src_fName, src_size, src_count = getFilesetPath(
+            conn, imageId
+        )
 
-            src_filesetPath, src_fName = getFilesetPath(conn, image.id)
+        # add to link plan
+        if src_filesetPath:
+            if src_count > 1:
+                name, extension = os.path.splitext(
+                    RESOLVED_IMAGES[imageId]["name"]
+                )
+                src = os.path.join(MANAGED_REP, src_filesetPath)
+                manifest = [
+                    [os.path.join(path[len(src_filesetPath) :], fName), fSize, h, hr]
+                    for path, fName, fSize, h, hr in RESOLVED_IMAGES[imageId]["files"]
+                ]
+                LINK_PLAN.addLink(
+                    src, targetDir, name, imageId, src_size, src_count, manifest
+                )
 
-            # add tp linkNames and linkTarget list
-            if src_filesetPath:
-                if image.countFilesetFiles() > 1:
-                    name, extension = os.path.splitext(image.getName())
-                    src = os.path.join(MANAGED_REP, src_filesetPath)
+            else:
+                src = os.path.join(
+                    os.path.join(MANAGED_REP, src_filesetPath), src_fName
+                )
+                fileInfo = RESOLVED_IMAGES[imageId]["files"][0]
+                LINK_PLAN.addLink(
+                    src,
+                    targetDir,
+                    src_fName,
+                    imageId,
+                    src_size,
+                    manifest=[["", src_size, fileInfo[3], fileInfo[4]]],
+                )
 
-                    linkNames, linkTarget = checkLinks(
-                        src, targetDir, name, linkNames, linkTarget, image.id
-                    )
+            # if data owned by others - owner of this data should be notify
+            isOwner = PERMISSIONS.userIsOwner(imageId)
+            group = RESOLVED_IMAGES[imageId]["group"]
+            if not isOwner and PERMISSIONS.groupAllowsSharing(group):
+                addToNotifyList(get_owner_of_data(conn, imageId), imageId)
+                JOURNAL.write({"notify": imageId})
+        else:
+            print("# WARNING: No raw file or fileset available")
+            setWarning()
 
-                else:
-                    src = os.path.join(
-                        os.path.join(MANAGED_REP, src_filesetPath), src_fName
-                    )
+        # add available attachments if required
+        if addAttachments:
+            addAttachment(conn, "Image", imageId, targetDir)
 
-                    linkNames, linkTarget = checkLinks(
-                        src, targetDir, src_fName, linkNames, linkTarget, image.id
-                    )
+    # create links from proof images
+    createSymlinks(LINK_PLAN)
+    JOURNAL.markDone("Image", imageIds)
 
-                # if data owned by others - owner of this data should be notify
-                if not user_is_owner and allowedToShare:
-                    addToNotifyList(get_owner_of_data(image), image.id)
-            else:
-                print("# WARNING: No raw file or fileset available")
-                setWarning()
 
-            # add available attachments if required
-            if addAttachments:
-                addAttachment(image, targetDir)
-        else:
+def addImagesToPaths(conn, slot, imageIds, user, addAttachments):
+    """
+    Create directory structure like in omero (project/dataset/) for the given
+    images and add the images to their dataset dirs
+    Args:
+        conn: BlitzGateway connection
+        slot: path to access area
+        imageIds: List of OMERO image ids
+        user: user object
+        addAttachments (bool):
+    """
+    # dict of {<targetDir>: [<imageIds>]}
+    imagesOfDir = {}
+    for imageId in imageIds:
+        if JOURNAL.isDone("Image", imageId):
+            continue
+        targetDir = getParentDir(slot, "Image", imageId)
+        # failed path
+        if not targetDir:
             print(
-                f"# WARNING: You are not allowed to share image: {image.getId()}. (ownership: {user_is_owner}, group permission: {allowedToShare})"
+                "ERROR: can't create Project directory for ",
+                OBJECT_NAMES.get(("Image", imageId)),
             )
-            setWarning()
+            setError()
+            continue
+        imagesOfDir.setdefault(targetDir, []).append(imageId)
 
-    # create links from proof images
-    createSymlinks(linkNames, linkTarget)
+    # load owner and filesets of all images at once
+    resolveImages(conn, [id for ids in imagesOfDir.values() for id in ids])
+    for targetDir, ids in imagesOfDir.items():
+        addImages(conn, slot, ids, user, addAttachments, targetDir)
 
 
-def addDatasets(
-    conn, slot, datasets, user, addAttachments, allowedToShare, targetDir=None
-):
+def addDatasets(conn, slot, datasetIds, user, addAttachments, targetDir=None):
     """
-    TODO: doubled with addPath?
-    Check if parent project dir exists (and create one if not) and afterwards calls createObjectDir for given dataset objects
+    Check if parent project dir exists (and create one if not) and afterwards calls createObjectDir for given datasets
     and add images
     Args:
       conn: BlitzGateway connection
       slot: path to access area
-      projects: List of OMERO dataset objects
+      datasetIds: List of OMERO dataset ids
       user: user object
       addAttachments (bool):
-      allowedToShare (bool):
       targetDir: parent project dir if exists
     """
-    for dataset in datasets:
+    # skip datasets of an interrupted run
+    datasetIds = [id for id in datasetIds if not JOURNAL.isDone("Dataset", id)]
+    imageIds = [id for d in datasetIds for id in OBJECT_CHILDREN[("Dataset", d)]]
+    # load owner and filesets of all images at once
+    resolveImages(conn, imageIds)
+    if addAttachments:
+        loadAttachments(conn, "Dataset", datasetIds)
+        loadAttachments(conn, "Image", imageIds)
+
+    for datasetId in datasetIds:
         # check if parent project dir still exists
         if not targetDir:
-            projectObj = dataset.getParent()
-            if projectObj is not None:
-                linkDir = createObjectDir(slot, projectObj, projectObj.getName())
-            else:
-                linkDir = slot
+            linkDir = getParentDir(slot, "Dataset", datasetId)
         else:
             linkDir = targetDir
 
         if linkDir is not None:
-            linkDir = createObjectDir(linkDir, dataset, dataset.getName())
+            linkDir = getObjectDir(linkDir, "Dataset", datasetId)
 
             if addAttachments:
-                addAttachment(dataset, linkDir)
+                addAttachment(conn, "Dataset", datasetId, linkDir)
 
             addImages(
                 conn,
                 slot,
-                dataset.listChildren(),
+                OBJECT_CHILDREN[("Dataset", datasetId)],
                 user,
                 addAttachments,
-                allowedToShare,
                 linkDir,
             )
+        JOURNAL.markDone("Dataset", [datasetId])
 
 
-def addProjects(conn, slot, projects, user, addAttachments, allowedToShare):
+def addProjects(conn, slot, projectIds, user, addAttachments):
     """
-    TODO: doubled with addPath?
-    Calls createObjectDir for given project objects and add child datasets
+    Calls createObjectDir for given projects and add child datasets
     Args:
         conn: BlitzGateway connection
         slot: path to access area
-        projects: List of OMERO project objects
+        projectIds: List of OMERO project ids
         user: user object
         addAttachments (bool):
-        allowedToShare (bool):
     """
-    for project in projects:
-        linkDir = createObjectDir(slot, project, project.getName())
+    # skip projects of an interrupted run
+    projectIds = [id for id in projectIds if not JOURNAL.isDone("Project", id)]
+    if addAttachments:
+        loadAttachments(conn, "Project", projectIds)
+
+    for projectId in projectIds:
+        linkDir = getObjectDir(slot, "Project", projectId)
         if linkDir is not None:
             if addAttachments:
-                addAttachment(project, linkDir)
+                addAttachment(conn, "Project", projectId, linkDir)
 
             addDatasets(
                 conn,
                 slot,
-                project.listChildren(),
+                OBJECT_CHILDREN[("Project", projectId)],
                 user,
                 addAttachments,
-                allowedToShare,
                 linkDir,
             )
+        JOURNAL.markDone("Project", [projectId])
 
 
-def addPlates(conn, slot, plates, user, addAttachments, allowedToShare, targetDir=None):
+def addPlates(conn, slot, plateIds, user, addAttachments, targetDir=None):
     """
-    TODO: doubled with addPath?
-    Check if parent screen dir exists (and create one if not) and afterwards calls createObjectDir for given plates objects
+    Check if parent screen dir exists (and create one if not) and afterwards calls createObjectDir for given plates
     and add images
     Args:
       conn: BlitzGateway connection
       slot: path to access area
-      plates: List of OMERO plates objects
+      plateIds: List of OMERO plate ids
       user: user object
       addAttachments (bool):
-      allowedToShare (bool):
-      targetDir: parent project dir if exists
+      targetDir: parent screen dir if exists
     """
-    for plate in plates:
+    # skip plates of an interrupted run
+    plateIds = [id for id in plateIds if not JOURNAL.isDone("Plate", id)]
+    # load images of all plates at once, with owner and fileset
+    images = loadPlateImages(conn, plateIds)
+    imageIds = [id for children in images.values() for id in children]
+    if addAttachments:
+        loadAttachments(conn, "Plate", plateIds)
+        loadAttachments(conn, "Image", imageIds)
+
+    for plateId in plateIds:
         # check if parent screen dir still exists
         if not targetDir:
-            screenObj = plate.getParent()
-            if screenObj is not None:
-                linkDir = createObjectDir(slot, screenObj, screenObj.getName())
-            else:
-                linkDir = slot
+            linkDir = getParentDir(slot, "Plate", plateId)
         else:
             linkDir = targetDir
 
         if linkDir is not None:
-            linkDir = createObjectDir(linkDir, plate, plate.getName())
+            linkDir = getObjectDir(linkDir, "Plate", plateId)
 
             if addAttachments:
-                addAttachment(plate, linkDir)
-            imageList = []
-            for well in plate.listChildren():
-                index = well.countWellSample()
-
-                for index in range(0, index):
-                    imageList.append(well.getImage(index))
+                addAttachment(conn, "Plate", plateId, linkDir)
             addImages(
-                conn, slot, imageList, user, addAttachments, allowedToShare, linkDir
+                conn,
+                slot,
+                images[plateId],
+                user,
+                addAttachments,
+                linkDir,
             )
+        JOURNAL.markDone("Plate", [plateId])
 
 
-def addScreens(conn, slot, screens, user, addAttachments, allowedToShare):
+def addScreens(conn, slot, screenIds, user, addAttachments):
     """
-    Calls createObjectDir for given screen objects and add child plates
+    Calls createObjectDir for given screens and add child plates
      Args:
         conn: BlitzGateway connection
         slot: path to access area
-        screens: List of OMERO screen objects
+        screenIds: List of OMERO screen ids
         user: user object
         addAttachments (bool):
-        allowedToShare (bool):
     """
-    for screen in screens:
-        linkDir = createObjectDir(slot, screen, screen.getName())
+    # skip screens of an interrupted run
+    screenIds = [id for id in screenIds if not JOURNAL.isDone("Screen", id)]
+    if addAttachments:
+        loadAttachments(conn, "Screen", screenIds)
+
+    for screenId in screenIds:
+        linkDir = getObjectDir(slot, "Screen", screenId)
         if linkDir is not None:
             if addAttachments:
-                addAttachment(screen, linkDir)
+                addAttachment(conn, "Screen", screenId, linkDir)
 
             addPlates(
                 conn,
                 slot,
-                screen.listChildren(),
+                OBJECT_CHILDREN[("Screen", screenId)],
                 user,
                 addAttachments,
-                allowedToShare,
                 linkDir,
             )
+        JOURNAL.markDone("Screen", [screenId])
 
 
 def getRandomString(n):
@@ -910,6 +2524,7 @@ def generateNewArea(user, name):
 
     pathToArea = os.path.join(OPENLINK_DIR, hashName)
     os.mkdir(pathToArea)
+    TRACER.count("fs.mkdir")
 
     return pathToArea, hashName
 
@@ -946,6 +2561,7 @@ def email_results(conn, imageIDs, email, smtpObj):
     return
 
 
+@traced("notification")
 def notifyMembers(conn):
     """
     Notify owner of the data via mail if they was shared by group owner
@@ -967,7 +2583,9 @@ def notifyMembers(conn):
 
 def addObjToArea(conn, params, existingAreasNames=None, paths=None):
     """
-    add selected object and its content to a slot on OPENLINK_DIR as link to sources on ManagedRepository
+    add selected object and its content to a slot on OPENLINK_DIR as link to sources on ManagedRepository.
+    The phases of the run are written as TRACE_FILE into the area, with option
+    PARAM_PROFILE the run is profiled into PROFILE_FILE of the area.
 
     Args:
         conn: current user connection
@@ -977,33 +2595,73 @@ def addObjToArea(conn, params, existingAreasNames=None, paths=None):
     Returns:
         message:
     """
+    profiler = None
+    if params.get(PARAM_PROFILE):
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with TRACER.span("run"):
+            return buildArea(
+                TracedConnection(conn), params, existingAreasNames, paths
+            )
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if TRACER.base and os.path.isdir(TRACER.base):
+            try:
+                if profiler is not None:
+                    profiler.dump_stats(os.path.join(TRACER.base, PROFILE_FILE))
+                    print("# INFO: profile of this run in %s" % PROFILE_FILE)
+                TRACER.write(TRACER.base)
+            except OSError as e:
+                print("# WARNING: could not write trace of this run: %s" % e)
+            TRACER.report()
+        TRACER.reset()
 
-    # init Notifationlist
-    global NOTIFICATION_LIST
-    NOTIFICATION_LIST = {}
-
-    # check group permissions for sharing
-    allowedToShare = groupAllowedToShareData(conn, conn.getUser().getId())
 
-    # prepare openLink area
-    accessAreaPath, hashName = prepareOpenLinkArea(
-        existingAreasNames, conn, params, paths
-    )
+def buildArea(conn, params, existingAreasNames=None, paths=None):
+    """
+    add selected object and its content to a slot on OPENLINK_DIR (see addObjToArea)
 
-    addAttachments = False
-    if params.get(PARAM_ATTACH):
-        addAttachments = True
+    Args:
+        conn: current user connection
+        params: user input
+        existingAreasNames: list of available slots for current user
+        paths: list of paths to the available slots of the surrent user
+    Returns:
+        message:
+    """
 
+    # init Notifationlist
+    global NOTIFICATION_LIST
+    NOTIFICATION_LIST = {}
+    global LINK_PLAN
+    LINK_PLAN = LinkPlan()
+    RESOLVED_IMAGES.clear()
+    OWNERS.clear()
+    OBJECT_NAMES.clear()
+    OBJECT_CHILDREN.clear()
+    OBJECT_PARENTS.clear()
+    OBJECT_DIRS.clear()
+    ATTACHMENTS.clear()
+    AREA_STATS["size"] = 0
+    AREA_STATS["files"] = 0
+    AREA_STATS["segmented"] = 0
+
+    # check permissions for sharing
+    global PERMISSIONS
+    with TRACER.span("permission checks"):
+        PERMISSIONS = PermissionContext(conn)
+
+    # check selected objects before an area (and its journal) is prepared,
+    # so that a rerun does not resume into an area of a failed run
     destObjs = None
-    if params.get(PARAM_ID) is not None:
-        destObjs = conn.getObjects(params.get(PARAM_DATATYPE), params.get(PARAM_ID))
-        destType = params.get(PARAM_DATATYPE)
-
-    # parse json with object ids available in this area to dict
-    contentFileName = "%s/%s" % (accessAreaPath, CONTENT_FILE)
-    loadDictContent(contentFileName)
+    destType = params.get(PARAM_DATATYPE)
+    if params.get(PARAM_ID) is not None and destType is not None:
+        # load hierarchy of the selected objects
+        destObjs = loadGraph(conn, destType, params.get(PARAM_ID))
 
-    if destObjs is None:
+    if not destObjs:
         setError()
         return None, "ERROR: Given objects not available"
     if destType is None:
@@ -1012,14 +2670,60 @@ def addObjToArea(conn, params, existingAreasNames=None, paths=None):
             None,
             "ERROR: Can't identify selected object. Please select Projects, Datasets or Images",
         )
-    elif destType == "Project":
+
+    # prepare openLink area
+    signature = getRunSignature(params)
+    with TRACER.span("path discovery"):
+        accessAreaPath, hashName = prepareOpenLinkArea(
+            existingAreasNames, conn, params, paths, signature
+        )
+    TRACER.base = accessAreaPath
+
+    # an unfinished run with other parameters has to be finished first, its
+    # journal can't be continued with the parameters of this run
+    header = Journal.readHeader(accessAreaPath)
+    if header is not None and header.get("signature") != signature:
+        setError()
+        return (
+            None,
+            "ERROR: OpenLink area %s has an unfinished run with other "
+            "parameters. Please rerun it with the same parameters to finish "
+            "it before adding objects to the area." % parseAreaNames(hashName),
+        )
+
+    # index of object directories available in this area
+    global CONTENT_INDEX
+    CONTENT_INDEX = ContentIndex(accessAreaPath)
+
+    # progress of this run, resume an unfinished run in this area
+    global JOURNAL
+    JOURNAL = Journal(accessAreaPath)
+    if JOURNAL.load(signature):
+        newArea = JOURNAL.header.get("newArea")
+        areaInfo = JOURNAL.header.get("areaInfo")
+        revision = JOURNAL.header.get("revision") or getNextRevision(accessAreaPath)
+        JOURNAL.start(signature, areaInfo, newArea, revision)
+        restoreFromJournal(conn, JOURNAL)
+    else:
+        # area info before adding new content (a new area is empty)
+        newArea = len(os.listdir(accessAreaPath)) == 0
+        areaInfo = readAreaInfo(accessAreaPath)
+        if areaInfo is None and newArea:
+            areaInfo = {"size": 0, "files": 0}
+        revision = getNextRevision(accessAreaPath)
+        JOURNAL.start(signature, areaInfo, newArea, revision)
+
+    addAttachments = False
+    if params.get(PARAM_ATTACH):
+        addAttachments = True
+
+    if destType == "Project":
         addProjects(
             conn,
             accessAreaPath,
             destObjs,
             conn.getUser(),
             addAttachments,
-            allowedToShare,
         )
     elif destType == "Dataset":
         addDatasets(
@@ -1028,7 +2732,6 @@ def addObjToArea(conn, params, existingAreasNames=None, paths=None):
             destObjs,
             conn.getUser(),
             addAttachments,
-            allowedToShare,
         )
     elif destType == "Screen":
         addScreens(
@@ -1037,7 +2740,6 @@ def addObjToArea(conn, params, existingAreasNames=None, paths=None):
             destObjs,
             conn.getUser(),
             addAttachments,
-            allowedToShare,
         )
     elif destType == "Plate":
         addPlates(
@@ -1046,20 +2748,73 @@ def addObjToArea(conn, params, existingAreasNames=None, paths=None):
             destObjs,
             conn.getUser(),
             addAttachments,
-            allowedToShare,
         )
     elif destType == "Image":
-        addImages(
+        addImagesToPaths(
             conn,
             accessAreaPath,
             destObjs,
             conn.getUser(),
             addAttachments,
-            allowedToShare,
         )
 
-    addToCurlFile(accessAreaPath, hashName)
-    writeDictContent(contentFileName)
+    # finalise area, steps that are done are skipped on resume
+    if "curl" not in JOURNAL.final:
+        curlFileMissing = not os.path.exists(os.path.join(accessAreaPath, CURL_FILE))
+        if params.get(PARAM_REBUILD_CURL) or (curlFileMissing and not newArea):
+            addToCurlFile(accessAreaPath, hashName)
+        else:
+            appendToCurlFile(accessAreaPath, hashName, LINK_PLAN)
+        JOURNAL.markFinal("curl")
+    if "shards" not in JOURNAL.final:
+        previousShards = (areaInfo or {}).get("shards")
+        shardCount = params.get(PARAM_SHARDS)
+        if shardCount is None:
+            shardCount = (
+                len(previousShards) if previousShards is not None else CURL_SHARDS
+            )
+        if shardCount <= 1:
+            # remove shard curl files of the area
+            totals, files, rebuildShards = [], [], True
+        elif (
+            params.get(PARAM_REBUILD_CURL)
+            or previousShards is None
+            or len(previousShards) != shardCount
+        ):
+            totals, rebuildShards = [0] * shardCount, True
+            if newArea:
+                files = list(getCreatedFileSizes(accessAreaPath, LINK_PLAN))
+            else:
+                print("# INFO: rebuild %d shard curl files" % shardCount)
+                files = list(getAreaFileSizes(accessAreaPath))
+        else:
+            totals, rebuildShards = list(previousShards), False
+            files = list(getCreatedFileSizes(accessAreaPath, LINK_PLAN))
+        writeShardCurlFiles(accessAreaPath, hashName, files, totals, rebuildShards)
+        JOURNAL.markFinal("shards", totals)
+    shards = JOURNAL.final["shards"]
+    deltaFile = None
+    if LINK_PLAN.created:
+        deltaFile = DELTA_CURL_FILE % revision
+        if "delta" not in JOURNAL.final:
+            writeDeltaCurlFile(accessAreaPath, hashName, LINK_PLAN, revision)
+            JOURNAL.markFinal("delta")
+        if "manifest" not in JOURNAL.final:
+            appendToManifest(accessAreaPath, hashName, LINK_PLAN, revision)
+            JOURNAL.markFinal("manifest")
+    if "listing" not in JOURNAL.final:
+        writeListings(accessAreaPath, LINK_PLAN, params.get(PARAM_REBUILD_CURL))
+        JOURNAL.markFinal("listing")
+    if "content" not in JOURNAL.final:
+        CONTENT_INDEX.save()
+        JOURNAL.markFinal("content")
+    expires = None
+    if params.get(PARAM_EXPIRY):
+        expires = time.time() + params.get(PARAM_EXPIRY) * 86400
+    AREA_STATS["segmented"] = countSegmentedFiles(accessAreaPath, LINK_PLAN)
+    info = writeAreaInfo(accessAreaPath, areaInfo, expires, shards)
+    registerArea(accessAreaPath, info)
+    JOURNAL.remove()
     url = "%s/%s/" % (URL, hashName)
     cmd = CMD % (URL, hashName.replace(" ", "%20"), CURL_FILE)
 
@@ -1070,26 +2825,76 @@ def addObjToArea(conn, params, existingAreasNames=None, paths=None):
     )
     print(cmd)
     print("###\n")
+    if shards:
+        print(
+            "Parallel download of %d files at once (curl 7.66 or newer):\n### "
+            % len(shards)
+        )
+        print(
+            CMD_PARALLEL
+            % (URL, hashName.replace(" ", "%20"), CURL_FILE, len(shards))
+        )
+        print("###\n")
+        print(
+            "Download in %d parallel parts of about the same size:\n### "
+            % len(shards)
+        )
+        print(CMD_SHARDS % (len(shards), URL, hashName.replace(" ", "%20")))
+        print("###\n")
+    if deltaFile is not None and not newArea:
+        print(
+            "Download only the files added by this run (revision %d):\n### "
+            % revision
+        )
+        print(CMD % (URL, hashName.replace(" ", "%20"), deltaFile))
+        print("###\n")
+    if info.get("segmented"):
+        print(
+            "%d files larger than %g GiB are downloaded by curl in parts "
+            "(<file>.partNNNN). After the download, join the parts in the same "
+            "directory with Python 3:\n### "
+            % (info["segmented"], SEGMENT_THRESHOLD / 1024**3)
+        )
+        print(CMD_REASSEMBLE % (URL, hashName.replace(" ", "%20"), MANIFEST_FILE))
+        print("###\n")
 
+    PERMISSIONS.report()
     notifyMembers(conn)
     return url
 
 
-def prepareOpenLinkArea(existingAreasNames, conn, params, paths):
+def prepareOpenLinkArea(existingAreasNames, conn, params, paths, signature=None):
     """
     Return path to openlink area and hashName
     """
+    # area of an unfinished run with the same parameters
+    unfinished = [
+        p
+        for p in paths or []
+        if signature is not None
+        and (Journal.readHeader(p) or {}).get("signature") == signature
+    ]
     # get available openlink
     if params.get(PARAM_ADD_TO_SLOT) and paths and len(paths) > 0:
         index = existingAreasNames.index(params.get(PARAM_SLOTS))
         accessAreaPath = paths[index]
         hashName = os.path.basename(accessAreaPath)
+    elif unfinished:
+        accessAreaPath = unfinished[0]
+        hashName = os.path.basename(accessAreaPath)
+        print("# INFO: resume unfinished OpenLink area %s" % hashName)
     else:
         # create new openlink
         areaName = params.get(PARAM_SLOT_NAME)
         if not areaName:
             areaName = createDefaultAreaName()
         accessAreaPath, hashName = generateNewArea(conn.getUser(), areaName)
+        # list the area for a rerun if this run is interrupted
+        registerArea(
+            accessAreaPath,
+            {"modified": time.time(), "size": 0, "files": 0},
+            STATUS_BUILDING,
+        )
 
     return accessAreaPath, hashName
 
@@ -1109,11 +2914,28 @@ def parseAreaNames(p):
 
 def getAreasOfUser(id):
     """
+    Read areas of the user from the registry of OPENLINK_DIR, list
+    OPENLINK_DIR if the registry is not available.
     Args:
         id: user id
     Returns:
         values: list of paths that contains ID in the folder name
     """
+    registryFile = os.path.join(OPENLINK_DIR, REGISTRY_FILE)
+    if os.path.exists(registryFile):
+        try:
+            registry = sqlite3.connect(registryFile, timeout=30)
+            try:
+                rows = registry.execute(
+                    "SELECT hashname FROM areas WHERE user_id = ?", (int(id),)
+                ).fetchall()
+            finally:
+                registry.close()
+            paths = [os.path.join(OPENLINK_DIR, row[0]) for row in rows]
+            return [p for p in paths if os.path.isdir(p)]
+        except sqlite3.Error as e:
+            print("# WARNING: can't read OpenLink registry: %s" % e)
+
     values = []
     p = "%s/%s%s_*" % (OPENLINK_DIR, OPENLINK_PATTERN, id)
     values = glob.glob(p)
@@ -1176,11 +2998,13 @@ def run_script():
     scripting service, passing the required parameters.
     """
 
+    TRACER.reset()
     client = omero.client()
     client.createSession()
     conn = omero.gateway.BlitzGateway(client_obj=client)
     conn.SERVICE_OPTS.setOmeroGroup(-1)
-    existingAreaNames, paths = getExistingAreas(conn)
+    with TRACER.span("path discovery"):
+        existingAreaNames, paths = getExistingAreas(conn)
     client.closeSession()
 
     dataTypes = [
@@ -1236,8 +3060,35 @@ def run_script():
             description="Link all file attachments of selected and subordinate objects",
             default=True,
         ),
+        scripts.Bool(
+            PARAM_REBUILD_CURL,
+            grouping="6",
+            description="Rebuild the batch download file from all files of the OpenLink area instead of only adding the new files",
+            default=False,
+        ),
+        scripts.Int(
+            PARAM_EXPIRY,
+            optional=True,
+            grouping="7",
+            description="Remove the OpenLink area after the given number of days. If nothing is specified, the default of the server is used.",
+            min=1,
+        ),
+        scripts.Int(
+            PARAM_SHARDS,
+            optional=True,
+            grouping="8",
+            description="Split the batch download into the given number of download files of about the same size for parallel downloads (1: no split). If nothing is specified, the number of the OpenLink area or the default of the server is used.",
+            min=1,
+        ),
+        scripts.Bool(
+            PARAM_PROFILE,
+            grouping="9",
+            description="Profile this run with cProfile, the statistics are written to %s in the OpenLink area (python -m pstats)"
+            % PROFILE_FILE,
+            default=False,
+        ),
         namespaces=[omero.constants.namespaces.NSDYNAMIC],
-        version="2.1.2",
+        version=SCRIPT_VERSION,
         authors=["Susanne Kunis", "CellNanOs"],
         institutions=["University of Osnabrueck"],
         contact="sinukesus@gmail.com",
@@ -1247,7 +3098,8 @@ def run_script():
         params = client.getInputs(unwrap=True)
         if os.path.exists(OPENLINK_DIR):
             conn = BlitzGateway(client_obj=client)
-            mrep, orep = get_omero_paths(client)
+            with TRACER.span("path discovery"):
+                mrep, orep = get_omero_paths(client)
 
             global MANAGED_REP
             global ORIGINAL_REP
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Asynchronous deletion of OpenLink areas.
+
+An area is deleted by an atomic rename into OPENLINK_DIR/.trash, so the
+request returns at once. The symlinks of the area are removed afterwards by
+a background thread of the web app (see wake_reaper) or by the management
+command openlink_reap_trash. Until then the area is listed with the status
+registry.STATUS_DELETING.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from . import registry
+from .areas import TRASH_DIR
+
+logger = logging.getLogger(__name__)
+
+# suffix of trash entries that are removed by a reaper
+REAPING_SUFFIX = ".reaping"
+# trash entries whose claim was not touched for longer are claimed again
+# (the reaper was stopped)
+REAPING_TIMEOUT = 3600
+# seconds between two touches of a claim while its entry is removed
+REAPING_HEARTBEAT = 60
+# seconds between two runs of the background reaper
+REAPER_INTERVAL = 600
+
+_reaper = None
+_reaper_lock = threading.Lock()
+_reaper_event = threading.Event()
+
+
+def get_trash_dir(openlink_dir):
+    return os.path.join(openlink_dir, TRASH_DIR)
+
+
+def move_to_trash(openlink_dir, hashname):
+    """
+    Move the area <hashname> into the trash and mark it as deleting in the
+    registry.
+    :return: path of the area in the trash
+    """
+    trash_dir = get_trash_dir(openlink_dir)
+    os.makedirs(trash_dir, exist_ok=True)
+    target = os.path.join(trash_dir, "%s.%d" % (hashname, time.time_ns()))
+    os.rename(os.path.join(openlink_dir, hashname), target)
+    try:
+        registry.set_status(openlink_dir, hashname, registry.STATUS_DELETING)
+    except (OSError, sqlite3.Error) as e:
+        logger.error('Cannot update area registry: %s', e)
+    return target
+
+
+def _claim(trash_dir, name):
+    """
+    Rename a trash entry so no other reaper removes it at the same time.
+    A claim is alive while its reaper touches it (see ClaimHeartbeat), the
+    change time of the claim is updated by the rename and every touch.
+    :return: path of the claimed entry or None if claimed by another reaper
+    """
+    path = os.path.join(trash_dir, name)
+    if name.endswith(REAPING_SUFFIX):
+        try:
+            if time.time() - os.lstat(path).st_ctime < REAPING_TIMEOUT:
+                return None
+        except OSError:
+            return None
+        # strip ".<pid>.reaping" of the previous claim
+        name = name[:-len(REAPING_SUFFIX)].rsplit(".", 1)[0]
+    claimed = os.path.join(trash_dir, "%s.%d%s" % (name, os.getpid(),
+                                                    REAPING_SUFFIX))
+    try:
+        os.rename(path, claimed)
+    except OSError:
+        return None
+    return claimed
+
+
+def _get_hashname(name):
+    """Return name of the area of a (claimed) trash entry"""
+    if name.endswith(REAPING_SUFFIX):
+        name = name[:-len(REAPING_SUFFIX)].rsplit(".", 1)[0]
+    return name.rsplit(".", 1)[0]
+
+
+class ClaimHeartbeat:
+    """
+    Touch a claimed trash entry every REAPING_HEARTBEAT seconds while it is
+    removed, so other reapers do not claim it again after REAPING_TIMEOUT.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.last = time.time()
+
+    def __call__(self):
+        now = time.time()
+        if now - self.last < REAPING_HEARTBEAT:
+            return
+        self.last = now
+        try:
+            os.utime(self.path, follow_symlinks=False)
+        except OSError as e:
+            logger.error('Cannot touch %s: %s', self.path, e)
+
+
+def remove_tree(path, heartbeat=None):
+    """
+    Remove the directory path and its content without following symlinks.
+    :param heartbeat: called for every removed entry (see ClaimHeartbeat)
+    :return: (bytes, inodes) that were removed (as reported by lstat)
+    """
+    removed_bytes = 0
+    inodes = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if heartbeat is not None:
+                heartbeat()
+            if entry.is_dir(follow_symlinks=False):
+                size, count = remove_tree(entry.path, heartbeat)
+                removed_bytes += size
+                inodes += count
+            else:
+                removed_bytes += entry.stat(follow_symlinks=False).st_size
+                os.unlink(entry.path)
+                inodes += 1
+    removed_bytes += os.lstat(path).st_size
+    os.rmdir(path)
+    return removed_bytes, inodes + 1
+
+
+def _reap_entry(openlink_dir, path, name):
+    """Remove a claimed trash entry and the registry row of its area"""
+    result = remove_tree(path, ClaimHeartbeat(path))
+    hashname = _get_hashname(name)
+    if not registry.in_trash(openlink_dir, hashname):
+        try:
+            registry.unregister_area(openlink_dir, hashname)
+        except (OSError, sqlite3.Error) as e:
+            logger.error('Cannot update area registry: %s', e)
+    return result
+
+
+def reap(openlink_dir, workers=1):
+    """
+    Remove all areas in the trash and their registry rows.
+    :param workers: number of areas that are removed in parallel
+    :return: dict with number of 'removed' and 'failed' areas and the
+             removed 'bytes' and 'inodes'
+    """
+    result = {'removed': 0, 'failed': 0, 'bytes': 0, 'inodes': 0}
+    trash_dir = get_trash_dir(openlink_dir)
+    try:
+        names = os.listdir(trash_dir)
+    except FileNotFoundError:
+        return result
+
+    claimed = {}
+    for name in names:
+        path = _claim(trash_dir, name)
+        if path is not None:
+            claimed[path] = name
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(_reap_entry, openlink_dir, path, name): path
+                   for path, name in claimed.items()}
+        for future in as_completed(futures):
+            try:
+                removed_bytes, inodes = future.result()
+            except OSError as e:
+                logger.error('Cannot remove %s: %s', futures[future], e)
+                result['failed'] += 1
+                continue
+            result['removed'] += 1
+            result['bytes'] += removed_bytes
+            result['inodes'] += inodes
+    return result
+
+
+def _run_reaper(openlink_dir):
+    while True:
+        _reaper_event.wait(REAPER_INTERVAL)
+        _reaper_event.clear()
+        try:
+            reap(openlink_dir)
+        except Exception:
+            logger.exception('Error while reaping %s',
+                             get_trash_dir(openlink_dir))
+
+
+def wake_reaper(openlink_dir):
+    """Start the background reaper of this process (once) and wake it"""
+    global _reaper
+    with _reaper_lock:
+        if _reaper is None or not _reaper.is_alive():
+            _reaper = threading.Thread(target=_run_reaper,
+                                       args=(openlink_dir,),
+                                       name="openlink-reaper", daemon=True)
+            _reaper.start()
+    _reaper_event.set()
@@ -12,6 +12,24 @@ urlpatterns = [
 
     re_path(r'^deleteOpenLink/?', views.delete, name='openlink-delete'),
 
+    # JSON listing of the areas of the current user
+    re_path(r'^api/areas/?$', views.api_areas, name='openlink-api-areas'),
+    re_path(r'^api/areas/(?P<hashname>[^/]+)/size/?$', views.api_area_size,
+            name='openlink-api-area-size'),
+    # streaming ZIP/TAR archive of an area
+    re_path(r'^api/areas/(?P<hashname>[^/]+)/archive\.(?P<fmt>zip|tar)$',
+            views.api_area_archive, name='openlink-api-area-archive'),
+    # share link of an area
+    re_path(r'^api/areas/(?P<hashname>[^/]+)/share/?$',
+            views.api_area_share, name='openlink-api-area-share'),
+
+    # downloads served by nginx (X-Accel-Redirect) for the owner of an area
+    # or with a share link
+    re_path(r'^download/(?P<hashname>[^/]+)/(?P<path>.*)$', views.download,
+            name='openlink-download'),
+    re_path(r'^share/(?P<token>[^/]+)/(?P<path>.*)$', views.shared_download,
+            name='openlink-share'),
+
     # debug output: replace in url "webclient" by "omero_openlink/debugoutput"
     # re_path(r'^debugoutput/$',views.debugoutput,name='debugoutput'),
 
@@ -1,8 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.core import signing
+from django.http import Http404, HttpResponse, HttpResponseRedirect, \
+    JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.template.defaultfilters import filesizeformat
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 
 
 from omeroweb.webclient.decorators import login_required, render_response
@@ -12,11 +17,18 @@ import sys
 import os
 import re
 import datetime
-import shutil
+import time
 import glob
-from operator import itemgetter
+import hashlib
+import sqlite3
 
+from . import accel
+from . import archive
 from . import openlink_settings
+from . import registry
+from . import trash
+from .areas import AREA_INFO_FILE, CURL_FILE, MANIFEST_FILE, \
+    get_area_info, read_area_info, read_content_index
 
 logger = logging.getLogger(__name__)
 
@@ -30,15 +42,28 @@ except ImportError:
             line plots and split channel will fail!')
 
 OPENLINK_DIR = openlink_settings.OPENLINK_DIR.rstrip("/")
+EXPIRY_DAYS = openlink_settings.EXPIRY_DAYS
+PARALLEL_MAX = openlink_settings.PARALLEL_MAX
+ACCEL_LOCATION = openlink_settings.ACCEL_LOCATION
+SHARE_TOKEN_DAYS = openlink_settings.SHARE_TOKEN_DAYS
 TYPE_HTTP = openlink_settings.TYPE_HTTP
 SERVER_NAME = f'{TYPE_HTTP}://{openlink_settings.SERVER_NAME}'.rstrip("/")
 
 
 CMD_CURL = "curl -s %s/%s/%s | curl -K-"
-CONTENT_FILE = "content.json"
-CURL_FILE = "batch_download.curl"
+CMD_CURL_PARALLEL = \
+    "curl -s %s/%s/%s | curl --parallel --parallel-max %d -K-"
+CMD_CURL_SHARDS = "for i in $(seq 1 %d); do " \
+    "(curl -s %s/%s/batch_download_$i.curl | curl -K-) & done; wait"
+# join files that curl downloaded in byte-range segments
+CMD_REASSEMBLE = "python -m omero_openlink.reassemble %s/%s/%s"
 GET_SLOTNAME_PATTERN = r'^rn_[A-Z,0-9]+_\d+_(.+)'
-SKIP_FILES = [CONTENT_FILE, CURL_FILE]
+GET_USERID_PATTERN = r'^rn_[A-Z,0-9]+_(\d+)_'
+
+# paging and sorting of the area listing
+DEFAULT_PAGE_LIMIT = 20
+MAX_PAGE_LIMIT = 100
+SORT_KEYS = ('date', 'size', 'name')
 
 
 @login_required()
@@ -59,18 +84,18 @@ def debugoutput(request, conn=None, **kwargs):
     # data.append({",".join([str(elem) for elem in dircontent])})
     try:
         user = conn.getUser()
-        slotParentDir = getAreasOfUser(str(user.getId()))
-        if slotParentDir is not None:
+        if os.path.exists(OPENLINK_DIR):
             data.append({
                 "Current User ID": str(user.getId()),
                 "Current User Name": user.getName()
             })
 
-            for p in slotParentDir:
-                areaName = parseAccessAreaNames(os.path.basename(p))
+            for area in scanAreasOfUser(user.getId()):
                 data.append({
-                    "SLOT user path": p,
-                    "SLOT user name": areaName
+                    "SLOT user path": area['path'],
+                    "SLOT user name": area['area'],
+                    "SLOT status": area['status'],
+                    "SLOT objects": len(read_content_index(area['path']))
                 })
     except Exception as e:
         exc_type, exc_obj, exc_tb = sys.exc_info()
@@ -91,7 +116,8 @@ def parseAccessAreaNames(p):
 
 def getAreasOfUser(id):
     """
-    Scan ACCESS_AREA directories, filter out userID from directory name
+    Scan ACCESS_AREA directories, filter out userID from directory name.
+    Only used by scanAreasOfUser if the area registry is not available.
     :param id: user id in OMERO
     :return: list of directories in ACCESS_AREA that belongs to given id
     """
@@ -101,88 +127,415 @@ def getAreasOfUser(id):
     return glob.glob(os.path.join(OPENLINK_DIR, f"rn*_{id}_*"))
 
 
-def get_area_size(path):
-    """Return total size of files in path and subdirs. If
-    is_dir() or stat() fails, print an error message to stderr
-    and assume zero size (for example, file has been deleted).
+def formatDate(timestamp):
+    """Format timestamp of an area in the local timezone"""
+    dt = datetime.datetime.fromtimestamp(timestamp)
+    # Convert it to an aware datetime object in UTC time.
+    dt = dt.replace(tzinfo=datetime.timezone.utc)
+    # Convert it to your local timezone (still aware)
+    dt = dt.astimezone()
+    # Print it with a directive of choice
+    return dt.strftime("%d %b %Y (%I:%M:%S %p)")
+
+
+def scanAreasOfUser(id):
+    """
+    List areas of the given user with name, creation time, modification time
+    and size (if known) from the area registry. If the registry is not
+    available, the area directories are listed and stat'ed instead.
+    :param id: user id in OMERO
+    :return: list of dicts {'hashname', 'area', 'path', 'timestamp',
+             'mtime', 'size', 'status', 'expires', 'shards', 'segmented'}
+    """
+    if not os.path.exists(OPENLINK_DIR):
+        return []
+    try:
+        return [{'hashname': row['hashname'], 'area': row['name'],
+                 'path': os.path.join(OPENLINK_DIR, row['hashname']),
+                 'timestamp': row['created'], 'mtime': row['modified'],
+                 'size': row['size'], 'status': row['status'],
+                 'expires': registry.get_expiry(row, EXPIRY_DAYS),
+                 'shards': row['shards'] or 0,
+                 'segmented': row['segmented'] or 0}
+                for row in registry.list_areas(OPENLINK_DIR, id)]
+    except (OSError, sqlite3.Error) as e:
+        logger.error('Cannot read area registry: %s', e)
+
+    areas = []
+    for p in getAreasOfUser(id) or []:
+        hashname = os.path.basename(p)
+        areaName = parseAccessAreaNames(hashname)
+        if areaName is None:
+            continue
+        try:
+            st = os.stat(p)
+        except OSError:
+            # deleted in the meantime
+            continue
+        mtime = st.st_mtime
+        try:
+            mtime = max(mtime,
+                        os.stat(os.path.join(p, AREA_INFO_FILE)).st_mtime)
+        except OSError:
+            pass
+        areas.append({'hashname': hashname, 'area': areaName, 'path': p,
+                      'timestamp': st.st_ctime, 'mtime': mtime,
+                      'size': None, 'status': registry.STATUS_ACTIVE,
+                      'expires': registry.get_expiry(
+                          {'created': st.st_ctime}, EXPIRY_DAYS),
+                      'shards': 0, 'segmented': 0})
+    return areas
+
+
+def getAreaEntry(area, with_size=False):
+    """
+    Return JSON data of an area of scanAreasOfUser.
+    :param with_size: add size of the area, else it has to be requested
+                      with api_area_size
+    """
+    hashname = area['hashname']
+    quoted = hashname.replace(" ", "%20")
+    entry = {'area': area['area'],
+             'hashname': hashname,
+             'date': formatDate(area['timestamp']),
+             'timestamp': area['timestamp'],
+             'url': f"{SERVER_NAME}/{hashname}/",
+             'cmd': CMD_CURL % (SERVER_NAME, quoted, CURL_FILE),
+             'cmd_parallel': CMD_CURL_PARALLEL % (
+                 SERVER_NAME, quoted, CURL_FILE,
+                 area['shards'] or PARALLEL_MAX),
+             'cmd_shards': None,
+             'cmd_reassemble': None,
+             'manifest_url': f"{SERVER_NAME}/{hashname}/{MANIFEST_FILE}",
+             'zip_url': reverse('openlink-api-area-archive',
+                                args=[hashname, 'zip']),
+             'tar_url': reverse('openlink-api-area-archive',
+                                args=[hashname, 'tar']),
+             'download_url': None,
+             'share_url': None,
+             'size': None,
+             'size_str': None,
+             'status': area['status'],
+             'expires': None}
+    if area['expires'] is not None:
+        entry['expires'] = formatDate(area['expires'])
+    if ACCEL_LOCATION:
+        entry['download_url'] = reverse('openlink-download',
+                                        args=[hashname, ''])
+        entry['share_url'] = reverse('openlink-api-area-share',
+                                     args=[hashname])
+    if area['shards']:
+        entry['cmd_shards'] = CMD_CURL_SHARDS % (area['shards'], SERVER_NAME,
+                                                 quoted)
+    if area['segmented']:
+        entry['cmd_reassemble'] = CMD_REASSEMBLE % (SERVER_NAME, quoted,
+                                                    MANIFEST_FILE)
+    # symlinks of a deleted area are not available anymore
+    if area['status'] == registry.STATUS_DELETING:
+        entry['size'] = 0
+        entry['size_str'] = '-'
+    elif with_size:
+        size = area['size']
+        if size is None:
+            size = get_area_info(area['path'])['size']
+        entry['size'] = size
+        entry['size_str'] = filesizeformat(size)
+    return entry
+
+
+def getAreaPath(hashname, user_id):
+    """
+    Return path of the area <hashname> if it belongs to the given user
+    :raise Http404: if the area does not exist or belongs to another user
+    """
+    match = re.search(GET_USERID_PATTERN, hashname or '')
+    if match is None or match.group(1) != str(user_id) or \
+            os.path.basename(hashname) != hashname:
+        raise Http404("OpenLink area not found")
+    path = os.path.join(OPENLINK_DIR, hashname)
+    if not os.path.isdir(path):
+        raise Http404("OpenLink area not found")
+    return path
+
+
+def getAreaExpiry(hashname, user_id):
     """
-    total = 0
-    for entry in os.scandir(path):
-        if entry not in SKIP_FILES:
-            try:
-                is_dir = entry.is_dir(follow_symlinks=True)
-            except OSError as error:
-                print('Error calling is_dir():', error)
-                continue
-            if is_dir:
-                total += get_area_size(entry.path)
-            else:
-                try:
-                    total += entry.stat(follow_symlinks=True).st_size
-                except OSError as error:
-                    print('Error calling stat():', error)
+    Return path and expiry date of the area <hashname> if it belongs to the
+    given user and can be downloaded (see getAreaPath)
+    :return: (path, timestamp or None if the area does not expire)
+    :raise Http404: if the area does not exist, belongs to another user, is
+                    deleted or has expired
+    """
+    path = getAreaPath(hashname, user_id)
+    try:
+        row = registry.get_area(OPENLINK_DIR, hashname)
+    except (OSError, sqlite3.Error) as e:
+        logger.error('Cannot read area registry: %s', e)
+        row = None
+    if row is None:
+        # not registered yet, see scanAreasOfUser
+        try:
+            row = {'created': os.stat(path).st_ctime,
+                   'expires': (read_area_info(path) or {}).get('expires'),
+                   'status': registry.STATUS_ACTIVE}
+        except OSError:
+            raise Http404("OpenLink area not found")
+    expires = registry.get_expiry(row, EXPIRY_DAYS)
+    if row['status'] == registry.STATUS_DELETING or \
+            (expires is not None and expires < time.time()):
+        raise Http404("OpenLink area not found")
+    return path, expires
 
-    return total
+
+def getIntParam(request, name, default, minimum, maximum):
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError:
+        value = default
+    return min(max(value, minimum), maximum)
 
 
 @login_required()
 def openlink(request, conn=None, **kwargs):
-    values = []
-    debug = ""
+    return render(request,
+                  'omero_openlink/index.html',
+                  {'api_url': reverse('openlink-api-areas'),
+                   'size_url': reverse('openlink-api-area-size',
+                                       args=['HASHNAME'])})
+
+
+@login_required()
+def api_areas(request, conn=None, **kwargs):
+    """
+    JSON listing of the areas of the current user.
+    Query parameters:
+      page: page number, starting at 1
+      limit: areas per page (max. MAX_PAGE_LIMIT)
+      sort: one of SORT_KEYS, default date
+      order: asc or desc, default desc
+      q: only areas that contain this string in their name
+    Sizes of the areas are only listed if sorted by size, else they are
+    loaded per area by api_area_size.
+    Sends ETag and Last-Modified headers, conditional requests are answered
+    with 304 if no area of the user was changed.
+    """
+    sort = request.GET.get('sort', 'date')
+    if sort not in SORT_KEYS:
+        sort = 'date'
+    reverse_order = request.GET.get('order', 'desc') != 'asc'
+    query = request.GET.get('q', '').strip().lower()
+    limit = getIntParam(request, 'limit', DEFAULT_PAGE_LIMIT, 1,
+                        MAX_PAGE_LIMIT)
+
     try:
-        user = conn.getUser()
-        slotParentDir = getAreasOfUser(str(user.getId()))
-
-        if slotParentDir is not None:
-            for p in slotParentDir:
-                debug = "%s...[%s]..." % (debug, p)
-                areaName = parseAccessAreaNames(os.path.basename(p))
-                if areaName is not None:
-                    timestamp = os.path.getctime(p)
-                    dt = datetime.datetime.fromtimestamp(timestamp)
-                    # Convert it to an aware datetime object in UTC time.
-                    dt = dt.replace(tzinfo=datetime.timezone.utc)
-                    # Convert it to your local timezone (still aware)
-                    dt = dt.astimezone()
-                    # Print it with a directive of choice
-                    thisDate = dt.strftime("%d %b %Y (%I:%M:%S %p)")
-                    data = {'date': thisDate, 'area': areaName,
-                            'timestamp': timestamp,
-                            'hashname': os.path.basename(p),
-                            'url': f"{SERVER_NAME}/{os.path.basename(p)}/",
-                            'cmd': CMD_CURL % (
-                                SERVER_NAME,
-                                os.path.basename(p).replace(" ", "%20"),
-                                CURL_FILE),
-                            'size': filesizeformat(get_area_size(p))
-                          }
-                    values.append(data)
+        areas = scanAreasOfUser(str(conn.getUser().getId()))
     except Exception as e:
-        exc_type, exc_obj, exc_tb = sys.exc_info()
-
-        debug = "%s...[ERROR: \n%s[%s]]..." % (debug, str(e), exc_tb.tb_lineno)
         print('ERROR: while reading openlink dir: %s\n ' % (str(e)))
+        return JsonResponse({'error': str(e)}, status=500)
+    if query:
+        areas = [a for a in areas if query in a['area'].lower()]
+
+    # validators of this listing: the matching areas and the query
+    validator = hashlib.sha1(request.GET.urlencode().encode())
+    for a in sorted(areas, key=lambda a: a['hashname']):
+        validator.update(('%s:%r:%s;' % (a['hashname'], a['mtime'],
+                                          a['status'])).encode())
+    etag = quote_etag(validator.hexdigest())
+    last_modified = int(max([a['mtime'] for a in areas], default=0))
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=last_modified)
+    if response is not None:
+        return response
+
+    if sort == 'size':
+        entries = [getAreaEntry(a, with_size=True) for a in areas]
+        entries.sort(key=lambda e: e['size'], reverse=reverse_order)
+    else:
+        key = 'timestamp' if sort == 'date' else 'area'
+        areas.sort(key=lambda a: a[key], reverse=reverse_order)
+    pages = max(1, -(-len(areas) // limit))
+    page = getIntParam(request, 'page', 1, 1, pages)
+    start = (page - 1) * limit
+    if sort == 'size':
+        entries = entries[start:start + limit]
+    else:
+        entries = [getAreaEntry(a) for a in areas[start:start + limit]]
+
+    response = JsonResponse({'areas': entries,
+                             'total': len(areas),
+                             'page': page,
+                             'pages': pages,
+                             'limit': limit,
+                             'sort': sort,
+                             'order': 'desc' if reverse_order else 'asc',
+                             'q': query})
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required()
+def api_area_size(request, hashname, conn=None, **kwargs):
+    """
+    JSON size and number of files of an area of the current user, read from
+    the metadata sidecar of the area (rebuilt if it is missing or stale).
+    Conditional requests are answered with 304 if the sidecar is unchanged.
+    """
+    path = getAreaPath(hashname, conn.getUser().getId())
+    info = get_area_info(path)
+    try:
+        registry.update_area_info(OPENLINK_DIR, hashname, info)
+    except (OSError, sqlite3.Error) as e:
+        logger.error('Cannot update area registry: %s', e)
+    etag = quote_etag('%s-%s' % (info['modified'], info['size']))
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+
+    response = JsonResponse({'hashname': hashname,
+                             'size': info['size'],
+                             'size_str': filesizeformat(info['size']),
+                             'files': info.get('files')})
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required()
+def api_area_archive(request, hashname, fmt, conn=None, **kwargs):
+    """
+    Download an area of the current user as streaming ZIP or TAR archive
+    (see omero_openlink.archive). Single byte ranges are supported, so
+    interrupted downloads can be resumed.
+    """
+    path, expires = getAreaExpiry(hashname, conn.getUser().getId())
+    if fmt not in archive.ARCHIVES:
+        raise Http404("Unknown archive format")
+    etag = quote_etag(archive.get_etag(fmt, get_area_info(path)))
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+
+    # the members are only listed if the archive is sent
+    area = parseAccessAreaNames(hashname)
+    stream = archive.get_archive(path, area, fmt)
+
+    size = stream.size
+    byte_range = None
+    if request.META.get('HTTP_IF_RANGE', etag) == etag:
+        try:
+            byte_range = archive.parse_range(request.META.get('HTTP_RANGE'),
+                                             size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+            return response
+
+    if byte_range is None:
+        response = StreamingHttpResponse(stream.chunks(),
+                                         content_type=stream.content_type)
+        response['Content-Length'] = str(size)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(stream.chunks(start, end),
+                                         content_type=stream.content_type,
+                                         status=206)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (
+        area.replace('"', '_'), stream.extension)
+    return response
 
-    values = sorted(values, key=itemgetter('timestamp'), reverse=True)
-    return render(request,
-                  'omero_openlink/index.html',
-                  {'slots': values, 'debug': debug})
+
+def accelResponse(hashname, path):
+    """
+    Return response that lets nginx serve a file or directory of an area
+    (see omero_openlink.accel). Access has to be checked by the caller.
+    """
+    if not ACCEL_LOCATION:
+        raise Http404("Authenticated downloads are not configured")
+    try:
+        path = accel.clean_path(path)
+    except ValueError:
+        raise Http404("OpenLink file not found")
+    response = HttpResponse()
+    # content type is set by nginx
+    del response['Content-Type']
+    for header, value in accel.build_accel_headers(ACCEL_LOCATION, hashname,
+                                                   path).items():
+        response[header] = value
+    return response
+
+
+@login_required()
+def download(request, hashname, path, conn=None, **kwargs):
+    """Download a file or directory listing of an area of the current
+    user"""
+    getAreaExpiry(hashname, conn.getUser().getId())
+    return accelResponse(hashname, path)
+
+
+def shared_download(request, token, path, **kwargs):
+    """
+    Download a file or directory listing of an area with a share token of
+    api_area_share, no OMERO session is needed.
+    """
+    try:
+        hashname = accel.read_share_token(
+            token, SHARE_TOKEN_DAYS * 86400 if SHARE_TOKEN_DAYS > 0 else None)
+    except signing.BadSignature:
+        raise Http404("OpenLink area not found")
+    match = re.search(GET_USERID_PATTERN, hashname)
+    if match is None:
+        raise Http404("OpenLink area not found")
+    # the token is valid until the area is deleted or expires
+    getAreaExpiry(hashname, match.group(1))
+    return accelResponse(hashname, path)
+
+
+@login_required()
+def api_area_share(request, hashname, conn=None, **kwargs):
+    """
+    JSON share link of an area of the current user: the area can be
+    downloaded with the link without OMERO session until it expires.
+    """
+    path, expires = getAreaExpiry(hashname, conn.getUser().getId())
+    if not ACCEL_LOCATION:
+        raise Http404("Authenticated downloads are not configured")
+    token = accel.make_share_token(hashname)
+    # the link expires with the area at the latest
+    if SHARE_TOKEN_DAYS > 0:
+        token_expires = time.time() + SHARE_TOKEN_DAYS * 86400
+        expires = token_expires if expires is None else \
+            min(expires, token_expires)
+    return JsonResponse({'hashname': hashname,
+                         'url': request.build_absolute_uri(
+                             reverse('openlink-share', args=[token, ''])),
+                         'expires': formatDate(expires)
+                         if expires is not None else None})
 
 
 @login_required()
 def delete(request, conn=None, **kwargs):
+    """
+    Move an area of the current user into the trash, it is removed in the
+    background and listed as deleting until then.
+    """
     if request.method == "POST":
         hashname = request.POST.get('hashname_id')
-        myPath = '%s/%s' % (OPENLINK_DIR, hashname)
-        if os.path.exists(myPath):
-            try:
-                shutil.rmtree(myPath)
-            except OSError as e:
-                exc_type, exc_obj, exc_tb = sys.exc_info()
-                print('ERROR: while delete openlink area: %s\n ' % (str(e)))
-                return JsonResponse(['ERROR:while delete openlink area',
-                                     str(e), exc_tb.tb_lineno],
-                                    safe=False)
+        getAreaPath(hashname, conn.getUser().getId())
+        try:
+            trash.move_to_trash(OPENLINK_DIR, hashname)
+        except OSError as e:
+            exc_type, exc_obj, exc_tb = sys.exc_info()
+            print('ERROR: while delete openlink area: %s\n ' % (str(e)))
+            return JsonResponse(['ERROR:while delete openlink area',
+                                 str(e), exc_tb.tb_lineno],
+                                safe=False)
+        trash.wake_reaper(OPENLINK_DIR)
 
     return HttpResponseRedirect(request.META.get('HTTP_REFERER') +
                                 '#openlink_tab')
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Fixtures of the tests of OMERO.openlink.
+
+Create_OpenLink.py is an OMERO script, not a module of the package: it is
+loaded from its file like in benchmarks/bench_create_openlink.py. If
+omero-py is not available, the minimal omero modules of
+benchmarks/fakegateway are installed.
+"""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "benchmarks"), ROOT]
+
+import fakegateway  # noqa: E402,F401
+
+SCRIPT = os.path.join(ROOT, "omero_openlink", "scripts", "omero",
+                      "util_scripts", "Create_OpenLink.py")
+
+
+def load_script(openlink_dir=None, managed_rep=None, original_rep=None):
+    """
+    Load a fresh module of Create_OpenLink.py (the script keeps the state
+    of a run in globals) configured for the given directories.
+    """
+    spec = importlib.util.spec_from_file_location("Create_OpenLink", SCRIPT)
+    script = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(script)
+    if openlink_dir is not None:
+        script.OPENLINK_DIR = openlink_dir
+        script.MANAGED_REP = managed_rep
+        script.ORIGINAL_REP = original_rep
+    return script
+
+
+@pytest.fixture
+def script():
+    """Fresh module of Create_OpenLink.py"""
+    return load_script()
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    """OPENLINK_DIR, managed repository and OMERO data directory"""
+    result = [str(tmp_path / d) for d in ("openlink", "managed", "files")]
+    for d in result:
+        os.makedirs(d)
+    return result
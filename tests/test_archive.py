@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the streaming archives of omero_openlink.archive: the archives are
+valid and every byte range is a slice of the whole archive. Ranges of ZIP
+archives start at the matching file with the CRC-32 checkpoints of
+ARCHIVE_CRC_FILE.
+"""
+
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from omero_openlink import archive
+
+FILES = {
+    "Dataset_1/a.tif": b"a" * 1000,
+    "Dataset_1/empty.tif": b"",
+    "Dataset_2/b.tif": bytes(range(256)) * 40,
+    "Dataset_2/large.tif": os.urandom(50000),
+}
+
+
+@pytest.fixture
+def area(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "CHUNK_SIZE", 1024)
+    monkeypatch.setattr(archive, "CRC_CHECKPOINT", 8 * 1024)
+    path = str(tmp_path / "rn_ABC_2_area")
+    for name, data in FILES.items():
+        os.makedirs(os.path.join(path, os.path.dirname(name)), exist_ok=True)
+        with open(os.path.join(path, name), "wb") as f:
+            f.write(data)
+    # written by Create_OpenLink.py, not in the archive
+    with open(os.path.join(path, "manifest.jsonl"), "w") as f:
+        f.write("{}\n")
+    return path
+
+
+@pytest.fixture
+def bytes_read(monkeypatch):
+    """:return: list of the number of bytes read from files"""
+    read = []
+    read_file = archive.read_file
+
+    def counting_read_file(member, offset=0):
+        for chunk in read_file(member, offset):
+            read.append(len(chunk))
+            yield chunk
+    monkeypatch.setattr(archive, "read_file", counting_read_file)
+    return read
+
+
+def get(path, fmt, start=0, end=None):
+    return b"".join(archive.get_archive(path, "area", fmt).chunks(start, end))
+
+
+def ranges(size):
+    return [(0, 0), (0, size - 1), (1, 100), (500, 2000), (1040, 1100),
+            (size - 30, size - 1), (size - 1, size - 1), (12345, 40000)]
+
+
+@pytest.mark.parametrize("fmt", ["zip", "tar"])
+def test_archive_is_valid(area, fmt):
+    data = get(area, fmt)
+    assert len(data) == archive.get_archive(area, "area", fmt).size
+    if fmt == "zip":
+        with zipfile.ZipFile(io.BytesIO(data)) as z:
+            assert z.testzip() is None
+            content = {i.filename: z.read(i) for i in z.infolist()}
+    else:
+        with tarfile.open(fileobj=io.BytesIO(data)) as t:
+            content = {m.name: t.extractfile(m).read() for m in t}
+    assert content == {"area/" + n: d for n, d in FILES.items()}
+
+
+@pytest.mark.parametrize("fmt", ["zip", "tar"])
+def test_ranges(area, fmt):
+    data = get(area, fmt)
+    if fmt == "zip":
+        os.remove(os.path.join(area, archive.ARCHIVE_CRC_FILE))
+    for start, end in ranges(len(data)):
+        # without and with the CRCs of earlier ranges
+        assert get(area, fmt, start, end) == data[start:end + 1]
+        assert get(area, fmt, start, end) == data[start:end + 1]
+
+
+def test_crcs_are_stored(area):
+    get(area, "zip")
+    stream = archive.get_archive(area, "area", "zip")
+    crcs = archive.CrcCache(area, stream.validator)
+    for index, member in enumerate(stream.members):
+        assert crcs.get(index)[0] == member.size
+
+
+def test_range_starts_at_file(area, bytes_read):
+    data = get(area, "zip")
+    del bytes_read[:]
+    # the end of the archive needs the CRCs of all files
+    assert get(area, "zip", len(data) - 100) == data[-100:]
+    assert bytes_read == []
+    # the last 1000 bytes of the large file
+    stream = archive.get_archive(area, "area", "zip")
+    end = stream.central_offset - stream.DATA_DESCRIPTOR.size
+    assert get(area, "zip", end - 1000) == data[end - 1000:]
+    assert sum(bytes_read) == 1000
+
+
+def test_interrupted_download_is_resumed(area, bytes_read):
+    data = get(area, "zip")
+    os.remove(os.path.join(area, archive.ARCHIVE_CRC_FILE))
+    # interrupted in the large file after 20000 bytes
+    stream = archive.get_archive(area, "area", "zip")
+    position = stream.offsets[-1] + 20000
+    received = b""
+    chunks = stream.chunks()
+    for chunk in chunks:
+        received += chunk
+        if len(received) >= position:
+            break
+    chunks.close()
+    del bytes_read[:]
+    assert received + get(area, "zip", len(received)) == data
+    # read again from the last checkpoint (16 KiB) of the large file
+    assert sum(bytes_read) < 50000 - 16 * 1024 + 1024
+
+
+def test_changed_area_replaces_crcs(area):
+    get(area, "zip")
+    with open(os.path.join(area, "Dataset_1", "a.tif"), "wb") as f:
+        f.write(b"b" * 1000)
+    os.utime(os.path.join(area, "Dataset_1", "a.tif"), (1, 1))
+    data = get(area, "zip")
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        assert z.testzip() is None
+    for start, end in ranges(len(data)):
+        assert get(area, "zip", start, end) == data[start:end + 1]
+
+
+def test_etag_of_area_info(area, monkeypatch):
+    def walk(*args):
+        raise AssertionError("the area is walked")
+    monkeypatch.setattr(archive, "list_members", walk)
+    info = {"modified": 1.5, "size": 10, "files": 2}
+    etag = archive.get_etag("zip", info)
+    assert etag == archive.get_etag("zip", dict(info))
+    assert etag != archive.get_etag("tar", info)
+    assert etag != archive.get_etag("zip", dict(info, modified=2.5))
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the curl files and manifest outputs of Create_OpenLink.py: a
+rebuild of the curl file replaces it atomically, output paths are only
+reported if characters are replaced.
+"""
+
+import os
+
+import pytest
+
+HASHNAME = "rn_ABC_2_area"
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def area(tmp_path):
+    base = tmp_path / HASHNAME
+    (base / "Dataset_1").mkdir(parents=True)
+    for name in ("a.tif", "b.tif"):
+        (base / "Dataset_1" / name).write_bytes(b"x" * 10)
+    return str(base)
+
+
+def read_curl(script, base):
+    with open(os.path.join(base, script.CURL_FILE)) as f:
+        return f.read()
+
+
+def test_rebuild_lists_area_files(script, area):
+    # tmp file of an interrupted rebuild
+    with open(os.path.join(area, script.CURL_FILE + ".tmp"), "w") as f:
+        f.write("stale\n")
+    script.addToCurlFile(area, HASHNAME)
+    curl = read_curl(script, area)
+    assert curl.count("url=") == 2
+    assert 'output="area/Dataset_1/a.tif"' in curl
+    assert "stale" not in curl
+    assert not os.path.exists(os.path.join(area, script.CURL_FILE + ".tmp"))
+
+
+def test_failed_rebuild_keeps_curl_file(script, area, monkeypatch):
+    script.addToCurlFile(area, HASHNAME)
+    curl = read_curl(script, area)
+
+    def crash(base):
+        yield "Dataset_1/a.tif", 10
+        raise Crash()
+    monkeypatch.setattr(script, "getAreaFileSizes", crash)
+    with pytest.raises(Crash):
+        script.addToCurlFile(area, HASHNAME)
+    assert read_curl(script, area) == curl
+
+
+def test_output_path(script, capsys):
+    assert script.getOutputPath("Dataset_1/a.tif", "area") == \
+        "area/Dataset_1/a.tif"
+    assert capsys.readouterr().out == ""
+    assert script.getOutputPath("Dataset 1/a b.tif", "area") == \
+        "area/Dataset_1/a_b.tif"
+    assert capsys.readouterr().out.count("WARNING") == 1
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the downloader omero_openlink.fetch against a local http.server
+that serves an area with its manifest.
+"""
+
+import functools
+import hashlib
+import http.server
+import io
+import json
+import os
+import re
+import threading
+
+import pytest
+
+from omero_openlink import fetch
+
+FILES = {
+    "Dataset_1/a.tif": b"a" * 1000,
+    "Dataset_1/b c.tif": bytes(range(256)) * 8,
+    # downloaded in 3 segments
+    "Dataset_1/large.tif": os.urandom(5000),
+}
+SEGMENT_SIZE = 2000
+
+
+class Handler(http.server.SimpleHTTPRequestHandler):
+    """Static files with single byte ranges (as served by nginx)"""
+
+    ranges = True
+    # Range headers of all requests
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def send_head(self):
+        header = self.headers.get("Range")
+        Handler.requests.append((self.path, header))
+        match = re.match(r"bytes=(\d+)-(\d*)$", header or "")
+        if not self.ranges or match is None:
+            return super().send_head()
+        path = self.translate_path(self.path)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            self.send_error(404)
+            return None
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else len(data) - 1
+        if start >= len(data):
+            self.send_error(416)
+            return None
+        body = data[start:end + 1]
+        self.send_response(206)
+        self.send_header("Content-Range", "bytes %d-%d/%d"
+                         % (start, start + len(body) - 1, len(data)))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        return BodyFile(body)
+
+
+class BodyFile:
+
+    def __init__(self, body):
+        self.body = body
+
+    def read(self, *args):
+        body, self.body = self.body, b""
+        return body
+
+    def close(self):
+        pass
+
+
+def write_area(root):
+    """Write the files and the manifest of an area into root"""
+    manifest = [{"version": 1}]
+    for path, data in FILES.items():
+        os.makedirs(os.path.join(root, os.path.dirname(path)), exist_ok=True)
+        with open(os.path.join(root, path), "wb") as f:
+            f.write(data)
+        output = "area/" + path.replace(" ", "_")
+        entry = {"path": path, "output": output, "size": len(data),
+                 "hash": hashlib.sha1(data).hexdigest(),
+                 "hasher": "SHA1-160", "revision": 1}
+        if len(data) > SEGMENT_SIZE:
+            entry["segments"] = [
+                [start, min(start + SEGMENT_SIZE, len(data)) - 1,
+                 "%s.part%04d" % (output, i)]
+                for i, start in enumerate(range(0, len(data), SEGMENT_SIZE))]
+        manifest.append(entry)
+    with open(os.path.join(root, "manifest.jsonl"), "w") as f:
+        f.writelines(json.dumps(e) + "\n" for e in manifest)
+
+
+@pytest.fixture
+def server(tmp_path):
+    """:return: URL of an area served by a local http.server"""
+    root = tmp_path / "server"
+    write_area(str(root))
+    Handler.ranges = True
+    Handler.requests = []
+    httpd = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0), functools.partial(Handler, directory=str(root)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d/" % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def target(tmp_path):
+    return str(tmp_path / "download")
+
+
+def run(url, target):
+    return fetch.fetch(url, target, workers=2,
+                       progress=fetch.Progress(out=io.StringIO()))
+
+
+def read(target, path):
+    with open(os.path.join(target, "area", path.replace(" ", "_")),
+              "rb") as f:
+        return f.read()
+
+
+def assert_complete(target):
+    for path, data in FILES.items():
+        assert read(target, path) == data
+    # parts of segmented files are joined and removed
+    assert not [n for n in os.listdir(os.path.join(target, "area",
+                                                   "Dataset_1"))
+                if ".part" in n]
+
+
+def test_download_area(server, target):
+    result = run(server, target)
+    assert result["errors"] == []
+    assert (result["downloaded"], result["skipped"], result["failed"]) == \
+        (3, 0, 0)
+    assert result["bytes"] == sum(len(d) for d in FILES.values())
+    assert_complete(target)
+    # segments are requested as byte ranges
+    assert ("/Dataset_1/large.tif", "bytes=4000-4999") in Handler.requests
+
+
+def test_manifest_url(server, target):
+    result = run(server + "manifest.jsonl", target)
+    assert result["downloaded"] == 3
+
+
+def test_complete_files_are_skipped(server, target):
+    run(server, target)
+    Handler.requests = []
+    result = run(server, target)
+    assert (result["downloaded"], result["skipped"]) == (0, 3)
+    assert result["bytes"] == 0
+    assert [path for path, header in Handler.requests] == ["/manifest.jsonl"]
+
+
+def test_partial_file_is_resumed(server, target):
+    run(server, target)
+    path = os.path.join(target, "area", "Dataset_1", "a.tif")
+    with open(path, "r+b") as f:
+        f.truncate(400)
+    Handler.requests = []
+    result = run(server, target)
+    assert (result["downloaded"], result["skipped"]) == (1, 2)
+    assert result["bytes"] == 600
+    assert ("/Dataset_1/a.tif", "bytes=400-") in Handler.requests
+    assert_complete(target)
+
+
+def test_corrupt_file_is_downloaded_again(server, target):
+    run(server, target)
+    path = os.path.join(target, "area", "Dataset_1", "a.tif")
+    with open(path, "wb") as f:
+        f.write(b"b" * 1000)
+    result = run(server, target)
+    assert (result["downloaded"], result["skipped"]) == (1, 2)
+    assert_complete(target)
+
+
+def test_server_without_ranges(server, target):
+    run(server, target)
+    path = os.path.join(target, "area", "Dataset_1", "a.tif")
+    with open(path, "r+b") as f:
+        f.truncate(400)
+    Handler.ranges = False
+    result = run(server, target)
+    # the range is ignored, the file is downloaded again
+    assert result["downloaded"] == 1
+    assert result["bytes"] == 1000
+    assert_complete(target)
+
+
+def test_missing_file_fails(server, target, tmp_path):
+    os.remove(str(tmp_path / "server" / "Dataset_1" / "a.tif"))
+    result = run(server, target)
+    assert (result["downloaded"], result["failed"]) == (2, 1)
+    assert result["errors"][0].startswith("area/Dataset_1/a.tif")
+
+
+def test_paths_outside_directory_are_refused(server, target, tmp_path):
+    victim = tmp_path / "victim.txt"
+    victim.write_bytes(b"keep")
+    absolute = tmp_path / "absolute.tif"
+    hostile = [
+        {"path": "Dataset_1/a.tif", "output": "../victim.txt", "size": 1000},
+        {"path": "Dataset_1/a.tif", "output": str(absolute), "size": 1000},
+        {"path": "Dataset_1/large.tif", "output": "area/large.tif",
+         "size": 5000, "segments": [[0, 4999, "../../large.part0000"]]},
+    ]
+    with open(str(tmp_path / "server" / "manifest.jsonl"), "a") as f:
+        f.writelines(json.dumps(e) + "\n" for e in hostile)
+    result = run(server, target)
+    assert (result["downloaded"], result["failed"]) == (3, 3)
+    assert all("outside the download directory" in e
+               for e in result["errors"])
+    assert victim.read_bytes() == b"keep"
+    assert not absolute.exists()
+    assert not (tmp_path.parent / "large.part0000").exists()
+    assert_complete(target)
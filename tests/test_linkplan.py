@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of LinkPlan of Create_OpenLink.py: duplicate targets, name
+collisions and a constant number of lookups per addLink.
+"""
+
+AREA = "/openlink/rn_ABC_2_area"
+DATASET = AREA + "/project/dataset"
+
+
+def test_add_link(script):
+    plan = script.LinkPlan()
+    link = plan.addLink("/managed/a.tif", DATASET, "a.tif", 1, size=10)
+    assert link == DATASET + "/a.tif"
+    assert link in plan
+    assert len(plan) == 1
+    assert plan.getTarget(link) == "/managed/a.tif"
+    assert plan.getLink(DATASET, "/managed/a.tif") == link
+    assert plan.sizes[link] == (10, 1)
+    assert plan.pending == [link]
+
+
+def test_same_target_in_dir_is_ignored(script):
+    plan = script.LinkPlan()
+    plan.addLink("/managed/a.tif", DATASET, "a.tif", 1)
+    assert plan.addLink("/managed/a.tif", DATASET, "b.tif", 2) is None
+    assert len(plan) == 1
+
+
+def test_same_target_in_other_dir(script):
+    plan = script.LinkPlan()
+    plan.addLink("/managed/a.tif", DATASET, "a.tif", 1)
+    link = plan.addLink("/managed/a.tif", AREA + "/other", "a.tif", 1)
+    assert link == AREA + "/other/a.tif"
+    assert len(plan) == 2
+
+
+def test_name_collision_appends_id(script):
+    plan = script.LinkPlan()
+    plan.addLink("/managed/1/a.tif", DATASET, "a.tif", 1)
+    link = plan.addLink("/managed/2/a.tif", DATASET, "a.tif", 2)
+    assert link == DATASET + "/a_2.tif"
+
+
+def test_name_collision_of_same_id_appends_counter(script):
+    plan = script.LinkPlan()
+    links = [plan.addLink("/managed/%d/a.tif" % i, DATASET, "a.tif", 7)
+             for i in range(4)]
+    assert links == [DATASET + "/a.tif", DATASET + "/a_7.tif",
+                     DATASET + "/a_7_2.tif", DATASET + "/a_7_3.tif"]
+
+
+def test_unique_name(script):
+    plan = script.LinkPlan()
+    assert plan.uniqueName(DATASET, "a.tif", 1) == "a.tif"
+    plan.addLink("/managed/a.tif", DATASET, "a.tif", 1)
+    assert plan.uniqueName(DATASET, "a.tif", 1) == "a_1.tif"
+    assert plan.uniqueName(AREA, "a.tif", 1) == "a.tif"
+    # without extension
+    plan.addLink("/managed/b", DATASET, "b", 1)
+    assert plan.uniqueName(DATASET, "b", 3) == "b_3"
+
+
+def test_special_chars_are_replaced(script):
+    plan = script.LinkPlan()
+    link = plan.addLink("/managed/a b.tif", DATASET, "a b.tif", 1)
+    assert link == DATASET + "/a_b.tif"
+
+
+class CountingDict(dict):
+    """dict that counts membership tests"""
+
+    probes = 0
+
+    def __contains__(self, key):
+        CountingDict.probes += 1
+        return super().__contains__(key)
+
+
+def probes_per_link(script, n, same_name=False):
+    """:return: lookups in the links and targets of the plan per addLink of n
+    links into one directory"""
+    plan = script.LinkPlan()
+    plan.links = CountingDict()
+    plan.targets = CountingDict()
+    CountingDict.probes = 0
+    for i in range(n):
+        plan.addLink("/managed/%d/image.tif" % i, DATASET,
+                     "image.tif" if same_name else "image_%d.tif" % i, i)
+    assert len(plan) == n
+    return CountingDict.probes / n
+
+
+def test_add_link_is_constant_time(script):
+    # every link is looked up in dicts a constant number of times, no scan
+    # of the links of the directory (100 times slower at 1M than at 10k)
+    assert probes_per_link(script, 1000) == probes_per_link(script, 100000)
+    assert probes_per_link(script, 100000) <= 2
+
+
+def test_name_collisions_are_constant_time(script, capsys):
+    assert probes_per_link(script, 1000, same_name=True) <= 3
+    assert probes_per_link(script, 20000, same_name=True) <= 3
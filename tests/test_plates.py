@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of adding plates with Create_OpenLink.py against the fake OMERO
+server of benchmarks.
+"""
+
+import contextlib
+import io
+import json
+import os
+
+from conftest import load_script
+from fakegateway import FakeGateway, World
+
+
+def test_plate_images_are_resolved_by_plate_query(dirs):
+    world = World(dirs[1], dirs[2], images=400, wells_per_plate=24,
+                  plates_per_screen=2, attachment_every=0)
+    script = load_script(dirs[0], dirs[1], dirs[2] + "/")
+    conn = FakeGateway(script, world)
+    plateIds = world.ids("Plate")
+    with contextlib.redirect_stdout(io.StringIO()):
+        script.addObjToArea(conn, {script.PARAM_DATATYPE: "Plate",
+                                   script.PARAM_ID: plateIds,
+                                   script.PARAM_SLOT_NAME: "plates"})
+
+    queries = conn.round_trips.queries
+    assert "image files" not in queries
+    assert queries["fileset files"] == 1
+
+    # one link per plate to the shared fileset of its images
+    area = os.path.join(dirs[0], os.listdir(dirs[0])[0])
+    with open(os.path.join(area, "manifest.jsonl")) as f:
+        manifest = [json.loads(line) for line in f][1:]
+    files = [(e["path"], e["size"]) for e in manifest]
+    assert len(files) == len(plateIds) * 2
+    assert all(size == world.file_size for path, size in files)
+    for plateId in plateIds:
+        image = script.RESOLVED_IMAGES[world.well_samples[plateId][0][3]]
+        assert image["files"] == world.filesets[image["fileset"]]
+        assert image["owner"] == world.user_id
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of joining the parts of segmented files with
+omero_openlink.reassemble.
+"""
+
+import hashlib
+import os
+
+from omero_openlink import reassemble
+
+DATA = os.urandom(5000)
+
+
+def write_parts(directory, output, size=2000):
+    """:return: manifest entry of DATA in parts of size bytes"""
+    segments = []
+    for i, start in enumerate(range(0, len(DATA), size)):
+        part = "%s.part%04d" % (output, i)
+        path = os.path.join(directory, part)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(DATA[start:start + size])
+        segments.append([start, min(start + size, len(DATA)) - 1, part])
+    return {"path": "large.tif", "output": output, "size": len(DATA),
+            "hash": hashlib.sha1(DATA).hexdigest(), "hasher": "SHA1-160",
+            "segments": segments}
+
+
+def test_parts_are_joined(tmp_path):
+    directory = str(tmp_path / "download")
+    entry = write_parts(directory, "area/large.tif")
+    result = reassemble.reassemble([entry], directory)
+    assert (result["joined"], result["failed"]) == (1, 0)
+    with open(os.path.join(directory, "area", "large.tif"), "rb") as f:
+        assert f.read() == DATA
+    assert os.listdir(os.path.join(directory, "area")) == ["large.tif"]
+
+
+def test_paths_outside_directory_are_refused(tmp_path):
+    directory = str(tmp_path / "download")
+    # complete parts outside the download directory
+    entry = write_parts(str(tmp_path), "large.tif")
+    entry["segments"] = [[s, e, "../" + p] for s, e, p in entry["segments"]]
+    absolute = dict(entry, output=str(tmp_path / "absolute.tif"),
+                    segments=[])
+    os.makedirs(directory)
+    result = reassemble.reassemble([entry, absolute], directory,
+                                   verify_all=True)
+    assert (result["joined"], result["failed"]) == (0, 2)
+    assert all("outside the download directory" in e
+               for e in result["errors"])
+    # the parts are not removed
+    assert sorted(os.listdir(str(tmp_path))) == \
+        ["download", "large.tif.part0000", "large.tif.part0001",
+         "large.tif.part0002"]
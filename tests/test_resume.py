@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of resuming an interrupted run of Create_OpenLink.py from the
+journal of its area, against the fake OMERO server of benchmarks.
+"""
+
+import contextlib
+import io
+import os
+
+import pytest
+
+from conftest import load_script
+from fakegateway import FakeGateway, World
+from omero_openlink import registry
+
+
+class Crash(Exception):
+    pass
+
+
+def run(script, world, params):
+    """
+    Run the script like run_script does: list the areas of the user, then
+    add the objects.
+    :return: output of the script
+    """
+    conn = FakeGateway(script, world)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        names, paths = script.getExistingAreas(conn)
+        script.addObjToArea(conn, params, names, paths)
+    return output.getvalue()
+
+
+def areas(openlink_dir):
+    return sorted(n for n in os.listdir(openlink_dir) if n.startswith("rn_"))
+
+
+@pytest.fixture
+def world(dirs):
+    return World(dirs[1], dirs[2], images=20, images_per_dataset=10)
+
+
+def params(script, ids):
+    return {script.PARAM_DATATYPE: "Dataset", script.PARAM_ID: ids,
+            script.PARAM_SLOT_NAME: "resume", script.PARAM_ATTACH: True}
+
+
+def crash_and_rerun(dirs, world, monkeypatch):
+    """
+    Interrupt a run while the shard curl files are written, then rerun it
+    with the same parameters.
+    :return: (areas after the crash, areas after the rerun, output of the
+             rerun)
+    """
+    script = load_script(dirs[0], dirs[1], dirs[2] + "/")
+
+    def crash(*args, **kwargs):
+        raise Crash()
+    monkeypatch.setattr(script, "writeShardCurlFiles", crash)
+    with pytest.raises(Crash):
+        run(script, world, params(script, world.ids("Dataset")))
+    crashed = areas(dirs[0])
+
+    script = load_script(dirs[0], dirs[1], dirs[2] + "/")
+    output = run(script, world, params(script, world.ids("Dataset")))
+    return crashed, areas(dirs[0]), output
+
+
+def get_status(openlink_dir):
+    """:return: dict of {<hashname>: <status>} of the registry"""
+    conn = registry.connect(openlink_dir)
+    try:
+        return dict(conn.execute("SELECT hashname, status FROM areas"))
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("with_registry", [False, True])
+def test_rerun_resumes_area(dirs, world, monkeypatch, with_registry):
+    if with_registry:
+        registry.reconcile(dirs[0])
+    crashed, resumed, output = crash_and_rerun(dirs, world, monkeypatch)
+    assert len(crashed) == 1
+    assert resumed == crashed
+    assert "resume unfinished OpenLink area" in output
+    area = os.path.join(dirs[0], resumed[0])
+    assert not os.path.exists(os.path.join(area, ".journal.jsonl"))
+    assert os.path.exists(os.path.join(area, "batch_download_1.curl"))
+    if with_registry:
+        assert get_status(dirs[0]) == {resumed[0]: registry.STATUS_ACTIVE}
+
+
+def test_interrupted_area_is_registered(dirs, world, monkeypatch):
+    registry.reconcile(dirs[0])
+    script = load_script(dirs[0], dirs[1], dirs[2] + "/")
+
+    def crash(*args, **kwargs):
+        raise Crash()
+    monkeypatch.setattr(script, "writeShardCurlFiles", crash)
+    with pytest.raises(Crash):
+        run(script, world, params(script, world.ids("Dataset")))
+    hashname = areas(dirs[0])[0]
+    assert get_status(dirs[0]) == {hashname: registry.STATUS_BUILDING}
+    # listed by the web app, reconcile keeps the status of the unfinished
+    # area
+    assert [a['hashname'] for a in registry.list_areas(dirs[0], 2)] == \
+        [hashname]
+    registry.reconcile(dirs[0])
+    assert get_status(dirs[0]) == {hashname: registry.STATUS_BUILDING}
+
+
+def test_missing_objects_leave_no_journal(dirs, world):
+    script = load_script(dirs[0], dirs[1], dirs[2] + "/")
+    run(script, world, params(script, [12345]))
+    assert areas(dirs[0]) == []
+
+    # nothing to resume for the next run
+    script = load_script(dirs[0], dirs[1], dirs[2] + "/")
+    output = run(script, world, params(script, world.ids("Dataset")))
+    assert "resume unfinished" not in output
+    assert len(areas(dirs[0])) == 1
+
+
+def test_other_run_does_not_continue_journal(dirs, world, monkeypatch):
+    script = load_script(dirs[0], dirs[1], dirs[2] + "/")
+
+    def crash(*args, **kwargs):
+        raise Crash()
+    monkeypatch.setattr(script, "writeShardCurlFiles", crash)
+    with pytest.raises(Crash):
+        run(script, world, params(script, world.ids("Dataset")[:1]))
+    area = os.path.join(dirs[0], areas(dirs[0])[0])
+    with open(os.path.join(area, ".journal.jsonl")) as f:
+        journal = f.read()
+
+    # add other objects to the area of the unfinished run
+    script = load_script(dirs[0], dirs[1], dirs[2] + "/")
+    conn = FakeGateway(script, world)
+    other = dict(params(script, world.ids("Dataset")[1:]))
+    with contextlib.redirect_stdout(io.StringIO()):
+        names, paths = script.getExistingAreas(conn)
+        other[script.PARAM_ADD_TO_SLOT] = True
+        other[script.PARAM_SLOTS] = names[0]
+        result, message = script.addObjToArea(conn, other, names, paths)
+    assert result is None
+    assert "unfinished run with other parameters" in message
+    with open(os.path.join(area, ".journal.jsonl")) as f:
+        assert f.read() == journal
+
+    # the unfinished run can still be resumed
+    script = load_script(dirs[0], dirs[1], dirs[2] + "/")
+    output = run(script, world, params(script, world.ids("Dataset")[:1]))
+    assert "resume unfinished OpenLink area" in output
+    assert not os.path.exists(os.path.join(area, ".journal.jsonl"))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of files that are downloaded in byte-range segments: the reassembly
+step is listed next to the curl commands of an area.
+"""
+
+import contextlib
+import io
+import json
+import os
+
+import pytest
+
+from conftest import load_script
+from fakegateway import FakeGateway, World
+from omero_openlink import registry
+
+
+def add_datasets(dirs, world, threshold, calls=None):
+    """
+    :param calls: list of the paths escaped by the script, filled if given
+    """
+    script = load_script(dirs[0], dirs[1], dirs[2] + "/")
+    script.SEGMENT_THRESHOLD = threshold
+    script.SEGMENT_SIZE = world.file_size // 4
+    if calls is not None:
+        escape = script.replace_special_char_in_tokens
+
+        def counting_escape(name):
+            calls.append(name)
+            return escape(name)
+        script.replace_special_char_in_tokens = counting_escape
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        script.addObjToArea(FakeGateway(script, world),
+                            {script.PARAM_DATATYPE: "Dataset",
+                             script.PARAM_ID: world.ids("Dataset"),
+                             script.PARAM_SLOT_NAME: "segments",
+                             script.PARAM_SHARDS: 2})
+    area = os.path.join(dirs[0], [n for n in os.listdir(dirs[0])
+                                  if n.startswith("rn_")][0])
+    with open(os.path.join(area, ".area_info.json")) as f:
+        return output.getvalue(), json.load(f), area
+
+
+@pytest.fixture
+def world(dirs):
+    # 10 images, every 5th with a fileset of 3 files
+    return World(dirs[1], dirs[2], images=10, multi_file_every=5,
+                 attachment_every=0)
+
+
+def test_reassembly_is_listed(dirs, world):
+    registry.reconcile(dirs[0])
+    output, info, area = add_datasets(dirs, world, world.file_size // 2)
+    files = sum(len(world.filesets[world.image_fileset[id]])
+                for id in world.ids("Image"))
+    assert info["segmented"] == files
+    assert "python -m omero_openlink.reassemble" in output
+    assert "/%s/manifest.jsonl" % os.path.basename(area) in output
+    assert registry.list_areas(dirs[0], 2)[0]["segmented"] == files
+    assert registry.get_area_row(area)["segmented"] == files
+
+
+def test_no_reassembly_without_segments(dirs, world):
+    output, info, area = add_datasets(dirs, world, world.file_size)
+    assert info["segmented"] == 0
+    assert "reassemble" not in output
+
+
+def test_paths_are_escaped_once(dirs, world):
+    calls = []
+    output, info, area = add_datasets(dirs, world, world.file_size // 2,
+                                      calls)
+    # one escaped path per file for the curl, shard, delta and manifest
+    # entries of all segments
+    assert sorted(calls) == sorted(set(calls))
+    assert len(calls) == info["files"]
+    assert "replaced_tokens" not in output
+    with open(os.path.join(area, "manifest.jsonl")) as f:
+        outputs = [json.loads(line).get("output") for line in f][1:]
+    with open(os.path.join(area, "batch_download.curl")) as f:
+        curl = f.read()
+    for output in outputs:
+        assert "//" not in output
+        assert 'output="%s.part0000"' % output in curl
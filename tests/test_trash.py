@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests of the removal of deleted areas by omero_openlink.trash: a claim of
+a trash entry stays alive while its reaper removes the entry.
+"""
+
+import os
+import time
+
+import pytest
+
+from omero_openlink import trash
+
+
+@pytest.fixture
+def entry(tmp_path, monkeypatch):
+    """:return: (trash dir, name of a trash entry with 5 files)"""
+    monkeypatch.setattr(trash, "REAPING_TIMEOUT", 0.5)
+    monkeypatch.setattr(trash, "REAPING_HEARTBEAT", 0)
+    openlink_dir = str(tmp_path)
+    area = tmp_path / "rn_ABC_2_area"
+    area.mkdir()
+    for i in range(5):
+        (area / ("f%d" % i)).write_bytes(b"x")
+    path = trash.move_to_trash(openlink_dir, "rn_ABC_2_area")
+    return trash.get_trash_dir(openlink_dir), os.path.basename(path)
+
+
+def test_stale_claim_is_claimed_again(entry):
+    trash_dir, name = entry
+    claimed = trash._claim(trash_dir, name)
+    assert trash._claim(trash_dir, os.path.basename(claimed)) is None
+    time.sleep(0.6)
+    assert trash._claim(trash_dir, os.path.basename(claimed)) is not None
+
+
+def test_claim_is_alive_during_removal(entry):
+    trash_dir, name = entry
+    claimed = trash._claim(trash_dir, name)
+    heartbeat = trash.ClaimHeartbeat(claimed)
+    claims = []
+
+    def slow_heartbeat():
+        # the removal takes longer than REAPING_TIMEOUT
+        time.sleep(0.2)
+        heartbeat()
+        claims.append(trash._claim(trash_dir, os.path.basename(claimed)))
+    assert trash.remove_tree(claimed, slow_heartbeat)[1] == 6
+    assert claims == [None] * 5
+    assert os.listdir(trash_dir) == []